@@ -20,12 +20,11 @@
 # THE SOFTWARE.
 #
 """Prints the currently sourced environment"""
+import os
 
 import click
-from robot_folders.helpers.directory_helpers import (
-    get_active_env,
-    get_last_activated_env,
-)
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.environment_helpers import get_creation_progress
 
 
 @click.command("active_environment")
@@ -33,14 +32,21 @@ def cli():
     """Prints out the current environment. If none
     is sourced right now, it tells which was the last active
     environment, which will be sourced by simply calling the
-    source command."""
+    source command. The progress of environments that are being
+    created is shown as well."""
 
-    active_env = get_active_env()
+    active_env = dir_helpers.get_active_env()
     if active_env is None:
         click.echo(
             "No active environment. Last activated environment: {}".format(
-                get_last_activated_env()
+                dir_helpers.get_last_activated_env()
             )
         )
     else:
         click.echo("Active environment: {}".format(active_env))
+
+    checkout_dir = dir_helpers.get_checkout_dir()
+    for env_name in dir_helpers.list_environments():
+        progress = get_creation_progress(os.path.join(checkout_dir, env_name))
+        if progress is not None:
+            click.echo(progress)
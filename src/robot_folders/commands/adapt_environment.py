@@ -23,15 +23,125 @@
 This implements a command to adapt an environment with a config file.
 """
 from __future__ import print_function
+import concurrent.futures
 import os
 import stat
 import subprocess
 import click
 
 import robot_folders.helpers.directory_helpers as dir_helpers
-from robot_folders.helpers.repository_helpers import create_rosinstall_entry
+from robot_folders.helpers.repository_helpers import (
+    create_rosinstall_entry,
+    fetch_version,
+    has_local_version,
+    inspect_repositories,
+    is_shallow_repository,
+    set_sparse_paths,
+)
+from robot_folders.helpers.clone_helpers import (
+    CloneOptions,
+    clone_repository,
+    defer_submodules,
+)
+from robot_folders.helpers import config_helpers
 from robot_folders.helpers.ConfigParser import ConfigFileParser
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.ssh_helpers import SshMultiplexer
 import robot_folders.helpers.environment_helpers as environment_helpers
+from robot_folders.helpers.exceptions import ModuleException
+
+
+class RepositoryPlan(object):
+    """
+    Describes all steps required to bring a single repository to the state given in the config.
+    """
+
+    def __init__(self, local_name, package_dir, uri, version, clone_options):
+        self.local_name = local_name
+        self.package_dir = package_dir
+        self.uri = uri
+        self.version = version
+        self.clone_options = clone_options
+        self.clone = False
+        self.sparse = None
+        self.set_url = False
+        self.fetch = False
+        self.checkout = False
+
+    def steps(self):
+        """Returns a list of short descriptions of all planned steps"""
+        steps = list()
+        if self.clone:
+            steps.append("clone")
+        if self.sparse is not None:
+            steps.append("sparse")
+        if self.set_url:
+            steps.append("set-url")
+        if self.fetch:
+            steps.append("fetch {}".format(self.version))
+        if self.checkout:
+            steps.append("checkout {}".format(self.version))
+        return steps
+
+    def needs_network(self):
+        """Checks whether executing the plan requires access to the remote"""
+        return self.clone or self.fetch
+
+    def execute(self):
+        """Executes the planned steps. As plans are executed in parallel, the output of git
+        is suppressed by cloning quietly to keep the progress readable. Errors are still
+        reported by git."""
+        if self.clone:
+            clone_repository(
+                self.uri, self.package_dir, self.clone_options, self.version or None
+            )
+        if self.sparse is not None:
+            set_sparse_paths(self.package_dir, self.sparse)
+        if self.set_url:
+            subprocess.check_call(
+                ["git", "remote", "set-url", "origin", self.uri], cwd=self.package_dir
+            )
+        if self.fetch:
+            # Only fetch the requested version instead of the whole remote
+            depth = None
+            if is_shallow_repository(self.package_dir):
+                depth = self.clone_options.depth or 1
+            fetch_version(self.package_dir, self.version, depth)
+        if self.checkout:
+            subprocess.check_call(
+                ["git", "checkout", "--quiet", self.version], cwd=self.package_dir
+            )
+
+
+def has_nested_repositories(rosinstall):
+    """Checks whether the rosinstall contains repositories inside other repositories"""
+    local_names = [
+        repo["git"]["local-name"]
+        for repo in rosinstall
+        if "git" in repo and "local-name" in repo["git"]
+    ]
+    return any(
+        name.startswith(other + "/") for name in local_names for other in local_names
+    )
+
+
+def get_plan_waves(plans):
+    """
+    Splits the given plans into waves that can be executed in parallel. A repository cloned
+    into the folder of another repository is only handled in a later wave than its parent.
+    """
+    waves = list()
+    wave_of = dict()
+    for plan in sorted(plans, key=lambda plan: plan.local_name.count("/")):
+        wave = 0
+        for other, other_wave in wave_of.items():
+            if plan.local_name.startswith(other + "/"):
+                wave = max(wave, other_wave + 1)
+        wave_of[plan.local_name] = wave
+        while len(waves) <= wave:
+            waves.append(list())
+        waves[wave].append(plan)
+    return waves
 
 
 class EnvironmentAdapter(click.Command):
@@ -47,13 +157,22 @@ class EnvironmentAdapter(click.Command):
         self.ignore_catkin = False
         self.ignore_colcon = False
         self.ignore_misc = False
-        self.no_submodules = False
+        self.clone_options = None
+        self.jobs = 1
+        self.offline = False
         self.rosinstall = dict()
 
     def invoke(self, ctx):
         """
         This invokes the actual command.
         """
+        with EnvironmentLock(self.name), SshMultiplexer():
+            self.adapt(ctx)
+
+    def adapt(self, ctx):
+        """
+        Adapts the environment while holding its lock.
+        """
         env_dir = os.path.join(dir_helpers.get_checkout_dir(), self.name)
         catkin_dir = dir_helpers.get_catkin_dir(env_dir)
         colcon_dir = dir_helpers.get_colcon_dir(env_dir)
@@ -67,7 +186,20 @@ class EnvironmentAdapter(click.Command):
         self.ignore_catkin = ctx.parent.params["ignore_catkin"]
         self.ignore_colcon = ctx.parent.params["ignore_colcon"]
         self.ignore_misc = ctx.parent.params["ignore_misc"]
-        self.no_submodules = ctx.parent.params["no_submodules"]
+        self.jobs = ctx.parent.params["jobs"]
+        self.offline = ctx.parent.params["offline"]
+        if self.jobs is None:
+            self.jobs = config_helpers.get_value_safe_default(
+                "git", "jobs", 8, debug=False
+            )
+        self.clone_options = CloneOptions(
+            no_submodules=ctx.parent.params["no_submodules"],
+            submodule_strategy=ctx.parent.params["submodule_strategy"],
+            submodule_jobs=ctx.parent.params["submodule_jobs"],
+            use_mirrors=ctx.parent.params["use_mirrors"],
+            depth=ctx.parent.params["clone_depth"],
+            filter=ctx.parent.params["filter"],
+        )
 
         config_file_parser = ConfigFileParser(ctx.params["in_file"])
         has_catkin, ros_rosinstall = config_file_parser.parse_ros_config()
@@ -75,11 +207,35 @@ class EnvironmentAdapter(click.Command):
         has_misc_ws, misc_ws_rosinstall = config_file_parser.parse_misc_ws_config()
         os.environ["ROB_FOLDERS_ACTIVE_ENV"] = self.name
 
+        if self.offline:
+            self.check_new_workspaces_offline(
+                [
+                    (
+                        "misc",
+                        has_misc_ws and not self.ignore_misc,
+                        misc_ws_dir,
+                        misc_ws_rosinstall,
+                    ),
+                    (
+                        "catkin",
+                        has_catkin and not self.ignore_catkin,
+                        catkin_src_dir,
+                        ros_rosinstall,
+                    ),
+                    (
+                        "colcon",
+                        has_colcon and not self.ignore_colcon,
+                        colcon_src_dir,
+                        ros2_rosinstall,
+                    ),
+                ]
+            )
+
         if has_misc_ws and (not self.ignore_misc):
             if os.path.isdir(misc_ws_dir):
                 click.echo("Adapting misc workspace")
                 self.rosinstall = dict()
-                self.parse_folder(misc_ws_dir)
+                self.parse_folder(misc_ws_dir, misc_ws_rosinstall)
                 if misc_ws_rosinstall:
                     self.adapt_rosinstall(misc_ws_rosinstall, misc_ws_dir)
             else:
@@ -92,14 +248,14 @@ class EnvironmentAdapter(click.Command):
                     misc_ws_dir,
                     rosinstall=misc_ws_rosinstall,
                     build_root=misc_ws_build_root,
-                    no_submodules=self.no_submodules,
+                    clone_options=self.clone_options,
                 )
 
         if has_catkin and (not self.ignore_catkin):
             if os.path.isdir(catkin_src_dir):
                 click.echo("Adapting catkin workspace")
                 self.rosinstall = dict()
-                self.parse_folder(catkin_src_dir)
+                self.parse_folder(catkin_src_dir, ros_rosinstall)
                 if ros_rosinstall:
                     self.adapt_rosinstall(ros_rosinstall, catkin_src_dir)
             else:
@@ -115,7 +271,7 @@ class EnvironmentAdapter(click.Command):
                     catkin_directory=catkin_dir,
                     build_directory=catkin_build_dir,
                     rosinstall=ros_rosinstall,
-                    no_submodules=self.no_submodules,
+                    clone_options=self.clone_options,
                 )
                 catkin_creator.create()
 
@@ -123,7 +279,7 @@ class EnvironmentAdapter(click.Command):
             if os.path.isdir(colcon_src_dir):
                 click.echo("Adapting colcon workspace")
                 self.rosinstall = dict()
-                self.parse_folder(colcon_src_dir)
+                self.parse_folder(colcon_src_dir, ros2_rosinstall)
                 if ros2_rosinstall:
                     self.adapt_rosinstall(ros2_rosinstall, colcon_src_dir)
             else:
@@ -139,7 +295,7 @@ class EnvironmentAdapter(click.Command):
                     colcon_directory=colcon_dir,
                     build_directory=colcon_build_dir,
                     rosinstall=ros2_rosinstall,
-                    no_submodules=self.no_submodules,
+                    clone_options=self.clone_options,
                 )
                 colcon_creator.create()
 
@@ -163,10 +319,68 @@ class EnvironmentAdapter(click.Command):
                 | stat.S_IXOTH,
             )
 
+    def check_new_workspaces_offline(self, workspaces):
+        """
+        Raises a ModuleException if any of the given workspaces would have to be created with
+        repositories, as creating them clones from the remotes. workspaces is a list of tuples
+        of the workspace name, whether it is adapted, its source directory and its rosinstall.
+        """
+        new_workspaces = [
+            name
+            for name, enabled, src_dir, rosinstall in workspaces
+            if enabled and rosinstall and not os.path.isdir(src_dir)
+        ]
+        if new_workspaces:
+            raise ModuleException(
+                "The following workspaces cannot be created offline, as their "
+                "repositories would have to be cloned:\n{}".format(
+                    "\n".join(new_workspaces)
+                ),
+                "adapt",
+            )
+
     def adapt_rosinstall(self, config_rosinstall, packages_dir, workspace_dir=""):
         """
-        Parses the given config rosinstall and compares it to the locally installed packages
+        Parses the given config rosinstall and compares it to the locally installed packages.
+
+        All decisions are made up front, so the repositories can be updated in parallel
+        afterwards without asking any questions in between.
+        """
+        plans, deletions = self.plan_rosinstall(config_rosinstall, packages_dir)
+        if self.offline:
+            missing = [plan.local_name for plan in plans if plan.needs_network()]
+            if missing:
+                raise ModuleException(
+                    "The following repositories cannot be adapted offline, as they "
+                    "would have to be cloned or fetched:\n{}".format(
+                        "\n".join(missing)
+                    ),
+                    "adapt",
+                )
+        errors = self.execute_plans(plans, packages_dir)
+
+        for local_name in deletions:
+            dir_helpers.recursive_rmdir(os.path.join(packages_dir, local_name))
+            click.echo("Deleted '{}'".format(local_name))
+
+        if errors:
+            raise ModuleException(
+                "Adapting the following repositories failed:\n{}".format(
+                    "\n".join(
+                        "{}: {}".format(local_name, error)
+                        for local_name, error in sorted(errors.items())
+                    )
+                ),
+                "adapt",
+            )
+
+    def plan_rosinstall(self, config_rosinstall, packages_dir):
+        """
+        Compares the given config rosinstall to the locally installed packages and resolves
+        all interactive decisions. Returns a list of RepositoryPlans and a list of local names
+        of the repositories to delete.
         """
+        plans = list()
         for repo in config_rosinstall:
             local_version_exists = False
             version_update_required = True
@@ -257,64 +471,108 @@ class EnvironmentAdapter(click.Command):
                     "Going to download.".format(local_name)
                 )
 
+            repo_options = self.clone_options.for_repo(repo["git"])
+            repo_options.quiet = True
+            plan = RepositoryPlan(local_name, package_dir, uri, version, repo_options)
             # Create repo if it does not exist yet.
             if not local_version_exists:
-                if self.no_submodules:
-                    subprocess.check_call(["git", "clone", uri, package_dir])
-                else:
-                    subprocess.check_call(
-                        ["git", "clone", uri, package_dir, "--recurse-submodules"]
-                    )
-
-            # Change the origin to the uri specified
-            if uri_update_required:
-                process = subprocess.check_call(
-                    ["git", "remote", "set-url", "origin", uri], cwd=package_dir
-                )
-
-            # Checkout the version specified
-            if version_update_required:
-                process = subprocess.check_call(["git", "fetch"], cwd=package_dir)
-                process = subprocess.check_call(
-                    ["git", "checkout", version], cwd=package_dir
+                plan.clone = True
+            else:
+                # Restrict the working tree to the sparse paths given in the config
+                local_sparse = self.rosinstall[local_name]["git"].get("sparse")
+                if "sparse" in repo["git"] and repo["git"]["sparse"] != local_sparse:
+                    plan.sparse = repo["git"]["sparse"]
+                plan.set_url = uri_update_required
+                plan.checkout = version_update_required
+                # Versions that are known locally already can be checked out without
+                # any network round trip
+                plan.fetch = version_update_required and not has_local_version(
+                    package_dir, version
                 )
+            plans.append(plan)
 
         config_name_list = [d["git"]["local-name"] for d in config_rosinstall]
 
+        deletions = list()
         for repo in self.rosinstall:
             if repo not in config_name_list:
                 click.echo(
                     "Package '{}' found locally, but not in config.".format(repo)
                 )
                 local_name = self.rosinstall[repo]["git"]["local-name"]
-                package_dir = os.path.join(packages_dir, local_name)
                 if self.local_delete_policy == "delete_all":
-                    dir_helpers.recursive_rmdir(package_dir)
-                    click.echo("Deleted '{}'".format(repo))
+                    deletions.append(local_name)
                 elif self.local_delete_policy == "ask":
                     if click.confirm("Do you want to delete it?"):
-                        dir_helpers.recursive_rmdir(package_dir)
-                        click.echo("Deleted '{}'".format(repo))
+                        deletions.append(local_name)
                 elif self.local_delete_policy == "keep_all":
                     click.echo("Keeping repository as all should be kept")
+        return plans, deletions
 
-    def parse_folder(self, folder, prefix=""):
+    def execute_plans(self, plans, packages_dir):
         """
-        Function to recursively find git repositories
+        Executes the given RepositoryPlans using a pool of self.jobs workers. Returns a dict
+        mapping the local names of all failed repositories to their errors.
         """
-        subfolders = os.listdir(folder)
-        for subfolder in subfolders:
-            subfolder_abs = os.path.join(folder, subfolder)
-            if os.path.isdir(subfolder_abs):
-                git_dir = os.path.join(subfolder_abs, ".git")
-                local_name = os.path.join(prefix, subfolder)
-                if os.path.isdir(git_dir):
+        pending = [plan for plan in plans if plan.steps()]
+        errors = dict()
+        if not pending:
+            return errors
+
+        click.echo(
+            "Updating {} repositories using up to {} parallel jobs".format(
+                len(pending), self.jobs
+            )
+        )
+        finished = 0
+        for wave in get_plan_waves(pending):
+            with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.jobs
+            ) as executor:
+                futures = {executor.submit(plan.execute): plan for plan in wave}
+                for future in concurrent.futures.as_completed(futures):
+                    plan = futures[future]
+                    finished += 1
+                    try:
+                        future.result()
+                        result = "done"
+                    except Exception as err:
+                        errors[plan.local_name] = err
+                        result = "FAILED ({})".format(err)
                     click.echo(
-                        "Found '{}' in local folder structure.".format(local_name)
+                        "[{}/{}] {} ({}): {}".format(
+                            finished,
+                            len(pending),
+                            plan.local_name,
+                            ", ".join(plan.steps()),
+                            result,
+                        )
                     )
-                    entry = create_rosinstall_entry(subfolder_abs, local_name)
-                    self.rosinstall[local_name] = entry
-                self.parse_folder(subfolder_abs, local_name)
+
+        deferred = [
+            plan.local_name
+            for plan in pending
+            if plan.clone
+            and plan.clone_options.defers_submodules()
+            and plan.local_name not in errors
+        ]
+        if deferred:
+            defer_submodules(packages_dir, deferred)
+        return errors
+
+    def parse_folder(self, folder, config_rosinstall=None):
+        """
+        Finds all git repositories inside folder. Repositories inside other repositories are
+        only searched for if the config contains such nested repositories.
+        """
+
+        def inspect(local_name, repo_path):
+            click.echo("Found '{}' in local folder structure.".format(local_name))
+            return create_rosinstall_entry(repo_path, local_name)
+
+        nested = has_nested_repositories(config_rosinstall or [])
+        for entry in inspect_repositories(folder, inspect, nested):
+            self.rosinstall[entry["git"]["local-name"]] = entry
 
 
 class EnvironmentChooser(click.MultiCommand):
@@ -386,6 +644,71 @@ class EnvironmentChooser(click.MultiCommand):
     is_flag=True,
     help="Prevent git submodules from being cloned",
 )
+@click.option(
+    "--submodule_strategy",
+    type=click.Choice(["recursive", "parallel", "shallow", "lazy"]),
+    default=None,
+    help=(
+        "How submodules are fetched: 'recursive' clones them one at a time, 'parallel' "
+        "fetches them in parallel, 'shallow' additionally fetches only their latest commit "
+        "and 'lazy' defers their initialization until the workspace is built for the first "
+        "time. Defaults to the 'submodule_strategy' setting in the config."
+    ),
+)
+@click.option(
+    "--submodule_jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of submodules fetched in parallel. "
+        "Defaults to the 'submodule_jobs' setting in the config."
+    ),
+)
+@click.option(
+    "--use_mirrors/--no_mirrors",
+    default=None,
+    help=(
+        "Clone new repositories from the local mirror cache and point origin to the real "
+        "remote afterwards. Defaults to the 'use_mirrors' setting in the config."
+    ),
+)
+@click.option(
+    "--clone_depth",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Create new repositories as shallow clones with a history truncated to the given number of commits. "
+        "Can also be set per repository using the 'depth' key in the config file."
+    ),
+)
+@click.option(
+    "--filter",
+    default=None,
+    help=(
+        "Create new repositories as partial clones using the given filter spec, e.g. 'blob:none'. "
+        "Can also be set per repository using the 'filter' key in the config file."
+    ),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of repositories that are updated in parallel. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+@click.option(
+    "--offline",
+    default=False,
+    is_flag=True,
+    help=(
+        "Never access the network. Fails before changing anything if a repository would "
+        "have to be cloned, a requested version is not available locally or a new "
+        "workspace with repositories would have to be created."
+    ),
+)
 @click.pass_context
 def cli(
     ctx,
@@ -394,6 +717,13 @@ def cli(
     ignore_colcon,
     ignore_misc,
     no_submodules,
+    submodule_strategy,
+    submodule_jobs,
+    use_mirrors,
+    clone_depth,
+    filter,
+    jobs,
+    offline,
     local_override_policy,
 ):
     """Adapts an environment to given config file.
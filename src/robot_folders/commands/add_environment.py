@@ -20,10 +20,13 @@
 # THE SOFTWARE.
 #
 """implements the add functionality"""
+import functools
 import os
+import shutil
 import stat
 import subprocess
 import sys
+import tempfile
 
 import click
 import inquirer
@@ -31,8 +34,13 @@ import inquirer
 import robot_folders.helpers.directory_helpers as dir_helpers
 import robot_folders.helpers.build_helpers as build
 import robot_folders.helpers.environment_helpers as environment_helpers
+from robot_folders.helpers.bundle_helpers import BUNDLE_CONFIG_NAME, extract_archive
+from robot_folders.helpers.clone_helpers import CloneOptions
 from robot_folders.helpers.ConfigParser import ConfigFileParser
 from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.job_helpers import rob_folders_command
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.preflight_helpers import run_preflight
 from robot_folders.helpers.ros_version_helpers import *
 from robot_folders.helpers.underlays import UnderlayManager
 
@@ -40,9 +48,25 @@ from robot_folders.helpers.underlays import UnderlayManager
 class EnvCreator(object):
     """Worker class that actually handles the environment creation"""
 
-    def __init__(self, name, no_submodules=False):
+    def __init__(
+        self,
+        name,
+        no_submodules=False,
+        submodule_strategy=None,
+        submodule_jobs=None,
+        use_mirrors=None,
+        clone_depth=None,
+        filter=None,
+    ):
         self.env_name = name
-        self.no_submodules = no_submodules
+        self.clone_options = CloneOptions(
+            no_submodules=no_submodules,
+            submodule_strategy=submodule_strategy,
+            submodule_jobs=submodule_jobs,
+            use_mirrors=use_mirrors,
+            depth=clone_depth,
+            filter=filter,
+        )
         self.build_base_dir = dir_helpers.get_checkout_dir()
         self.demos_dir = os.path.join(
             dir_helpers.get_checkout_dir(), self.env_name, "demos"
@@ -69,6 +93,9 @@ class EnvCreator(object):
 
         self.script_list = list()
         self.build = True
+        self.check_remotes = True
+        self.bundle = None
+        self.state = None
 
         self.create_catkin = False
         self.create_colcon = False
@@ -88,18 +115,160 @@ class EnvCreator(object):
         ros_distro,
         ros2_distro,
         underlays,
+        resume=False,
+        background=False,
     ):
-        """Worker method that does the actual job"""
-        if os.path.exists(os.path.join(dir_helpers.get_checkout_dir(), self.env_name)):
-            # click.echo("An environment with the name \"{}\" already exists. Exiting now."
-            # .format(self.env_name))
-            raise ModuleException(
-                'Environment "{}" already exists'.format(self.env_name), "add"
+        """Worker method that does the actual job. Each step is checkpointed inside the
+        environment, so if resume is set, a failed creation continues with the failed step.
+        If background is set, only the directory skeleton is created and the steps are left
+        for a worker resuming the creation.
+        """
+        env_dir = os.path.join(dir_helpers.get_checkout_dir(), self.env_name)
+        if resume:
+            self.state = environment_helpers.CreationState.load(env_dir)
+            if self.state is None:
+                raise ModuleException(
+                    'Environment "{}" has no unfinished creation to resume'.format(
+                        self.env_name
+                    ),
+                    "add",
+                )
+            click.echo(
+                'Resuming the creation of environment "{}"'.format(self.env_name)
+            )
+            self.state.pid = os.getpid()
+            settings = self.state.settings
+            self.restore_settings(settings, config_file)
+            no_build = settings["no_build"]
+            catkin_creator, colcon_creator = self.create_workspace_creators(
+                "yes" if settings["copy_cmake_lists"] else "no",
+                settings["ros_distro"],
+                settings["ros2_distro"],
+            )
+        else:
+            if os.path.exists(env_dir):
+                # click.echo("An environment with the name \"{}\" already exists. Exiting now."
+                # .format(self.env_name))
+                message = 'Environment "{}" already exists'.format(self.env_name)
+                if os.path.isfile(
+                    os.path.join(env_dir, environment_helpers.CREATION_STATE_FILENAME)
+                ):
+                    message += (
+                        ", but its creation did not finish. Use --resume to continue it"
+                    )
+                raise ModuleException(message, "add")
+
+            has_nobackup = dir_helpers.check_build_on_nobackup(local_build)
+            self.set_build_base_dir(dir_helpers.get_build_base_dir(has_nobackup))
+
+            # If config file is give, parse it
+            if config_file:
+                self.parse_config(config_file)
+            # Otherwise ask the user or check given flags
+            else:
+                if create_misc_ws == "ask":
+                    self.create_misc_ws = click.confirm(
+                        "Would you like to create a misc workspace?", default=True
+                    )
+                else:
+                    self.create_misc_ws = dir_helpers.yes_no_to_bool(create_misc_ws)
+
+                if create_catkin == "ask":
+                    self.create_catkin = click.confirm(
+                        "Would you like to create a catkin_ws?", default=True
+                    )
+                else:
+                    self.create_catkin = dir_helpers.yes_no_to_bool(create_catkin)
+
+                if create_colcon == "ask":
+                    self.create_colcon = click.confirm(
+                        "Would you like to create a colcon_ws?", default=True
+                    )
+                else:
+                    self.create_colcon = dir_helpers.yes_no_to_bool(create_colcon)
+
+            click.echo('Creating environment with name "{}"'.format(self.env_name))
+
+            catkin_creator, colcon_creator = self.create_workspace_creators(
+                copy_cmake_lists, ros_distro, ros2_distro
             )
 
-        has_nobackup = dir_helpers.check_build_on_nobackup(local_build)
-        self.build_base_dir = dir_helpers.get_build_base_dir(has_nobackup)
+            if underlays == "ask":
+                self.underlays.query_underlays()
+            elif underlays == "skip":
+                pass
+            else:
+                raise NotImplementedError(
+                    "Manually passing underlays isn't implemented yet."
+                )
+
+            if self.underlays.underlays:
+                if not no_build and (self.catkin_rosinstall or self.colcon_rosinstall):
+                    click.secho(
+                        "Underlays selected without the 'no-build' option with a specified workspace. "
+                        "Initial build will be deactivated. "
+                        "Please manually build your environment by calling `fzirob make`.",
+                        fg="yellow",
+                    )
+                no_build = True
+
+            # Let's get down to business
+            self.create_directories()
+            self.state = environment_helpers.CreationState(env_dir)
+            self.state.settings = self.get_settings(
+                no_build, catkin_creator, colcon_creator
+            )
+            self.state.settings["background"] = background
+            if not background:
+                self.state.pid = os.getpid()
+            self.state.save()
+            if background:
+                return
+
+        self.state.run_step("demos", self.create_demos)
 
+        if self.create_misc_ws:
+            click.echo("Creating misc workspace")
+            self.state.run_step(
+                "misc_ws",
+                functools.partial(
+                    environment_helpers.MiscCreator,
+                    misc_ws_directory=self.misc_ws_directory,
+                    rosinstall=self.misc_ws_rosinstall,
+                    build_root=self.misc_ws_build_directory,
+                    clone_options=self.clone_options,
+                ),
+            )
+        else:
+            click.echo("Requested to not create a misc workspace")
+
+        # Check if we should create a catkin workspace and create one if desired
+        if catkin_creator:
+            click.echo("Creating catkin_ws")
+            for name, step in catkin_creator.steps():
+                self.state.run_step("catkin_ws {}".format(name), step)
+        else:
+            click.echo("Requested to not create a catkin_ws")
+
+        if colcon_creator:
+            click.echo("Creating colcon_ws")
+            for name, step in colcon_creator.steps():
+                self.state.run_step("colcon_ws {}".format(name), step)
+        else:
+            click.echo("Requested to not create a colcon_ws")
+
+        if not no_build:
+            self.state.run_step(
+                "build",
+                functools.partial(
+                    self.build_workspaces, catkin_creator, colcon_creator
+                ),
+            )
+        self.state.remove()
+
+    def set_build_base_dir(self, build_base_dir):
+        """Sets the directory the workspaces are built in"""
+        self.build_base_dir = build_base_dir
         self.misc_ws_build_directory = os.path.join(
             self.build_base_dir, self.env_name, "misc_ws"
         )
@@ -110,34 +279,9 @@ class EnvCreator(object):
             self.build_base_dir, self.env_name, "colcon_ws", "build"
         )
 
-        # If config file is give, parse it
-        if config_file:
-            self.parse_config(config_file)
-        # Otherwise ask the user or check given flags
-        else:
-            if create_misc_ws == "ask":
-                self.create_misc_ws = click.confirm(
-                    "Would you like to create a misc workspace?", default=True
-                )
-            else:
-                self.create_misc_ws = dir_helpers.yes_no_to_bool(create_misc_ws)
-
-            if create_catkin == "ask":
-                self.create_catkin = click.confirm(
-                    "Would you like to create a catkin_ws?", default=True
-                )
-            else:
-                self.create_catkin = dir_helpers.yes_no_to_bool(create_catkin)
-
-            if create_colcon == "ask":
-                self.create_colcon = click.confirm(
-                    "Would you like to create a colcon_ws?", default=True
-                )
-            else:
-                self.create_colcon = dir_helpers.yes_no_to_bool(create_colcon)
-
-        click.echo('Creating environment with name "{}"'.format(self.env_name))
-
+    def create_workspace_creators(self, copy_cmake_lists, ros_distro, ros2_distro):
+        """Returns the creators of the catkin and colcon workspace or None for workspaces
+        that should not be created. Creating them asks the remaining questions."""
         catkin_creator = None
         if self.create_catkin:
             catkin_creator = environment_helpers.CatkinCreator(
@@ -146,7 +290,7 @@ class EnvCreator(object):
                 rosinstall=self.catkin_rosinstall,
                 copy_cmake_lists=copy_cmake_lists,
                 ros_distro=ros_distro,
-                no_submodules=self.no_submodules,
+                clone_options=self.clone_options,
             )
         colcon_creator = None
         if self.create_colcon:
@@ -155,69 +299,66 @@ class EnvCreator(object):
                 build_directory=self.colcon_build_directory,
                 rosinstall=self.colcon_rosinstall,
                 ros2_distro=ros2_distro,
-                no_submodules=self.no_submodules,
+                clone_options=self.clone_options,
             )
+        return catkin_creator, colcon_creator
+
+    def get_settings(self, no_build, catkin_creator, colcon_creator):
+        """Returns everything needed to resume the creation without asking questions"""
+        return {
+            "bundle": self.bundle,
+            "build_base_dir": self.build_base_dir,
+            "no_build": no_build,
+            "create_misc_ws": self.create_misc_ws,
+            "create_catkin": self.create_catkin,
+            "create_colcon": self.create_colcon,
+            "misc_ws_rosinstall": self.misc_ws_rosinstall,
+            "catkin_rosinstall": self.catkin_rosinstall,
+            "colcon_rosinstall": self.colcon_rosinstall,
+            "script_list": self.script_list,
+            "copy_cmake_lists": bool(
+                catkin_creator and catkin_creator.copy_cmake_lists
+            ),
+            "ros_distro": catkin_creator.ros_distro if catkin_creator else None,
+            "ros2_distro": colcon_creator.ros2_distro if colcon_creator else None,
+            "clone_options": vars(self.clone_options),
+        }
+
+    def restore_settings(self, settings, config_file=None):
+        """Restores the settings stored by get_settings. If a config file is given, the
+        repositories are read from it again, e.g. because a bundle has been extracted again.
+        """
+        self.bundle = settings["bundle"]
+        self.set_build_base_dir(settings["build_base_dir"])
+        self.create_misc_ws = settings["create_misc_ws"]
+        self.create_catkin = settings["create_catkin"]
+        self.create_colcon = settings["create_colcon"]
+        self.misc_ws_rosinstall = settings["misc_ws_rosinstall"]
+        self.catkin_rosinstall = settings["catkin_rosinstall"]
+        self.colcon_rosinstall = settings["colcon_rosinstall"]
+        self.script_list = settings["script_list"]
+        self.clone_options = CloneOptions(**settings["clone_options"])
+        if config_file:
+            self.parse_config(config_file)
 
-        if underlays == "ask":
-            self.underlays.query_underlays()
-        elif underlays == "skip":
-            pass
-        else:
-            raise NotImplementedError(
-                "Manually passing underlays isn't implemented yet."
+    def build_workspaces(self, catkin_creator, colcon_creator):
+        """Builds the workspaces that contain repositories"""
+        if self.create_catkin and self.catkin_rosinstall != "":
+            ros_builder = build.CatkinBuilder(
+                name=catkin_creator.ros_distro, add_help_option=False
             )
+            ros_builder.invoke(None)
+        if self.create_colcon and self.colcon_rosinstall != "":
+            ros2_builder = build.ColconBuilder(
+                name=colcon_creator.ros2_distro, add_help_option=False
+            )
+            ros2_builder.invoke(None)
 
-        if self.underlays.underlays:
-            if not no_build and (self.catkin_rosinstall or self.colcon_rosinstall):
-                click.secho(
-                    "Underlays selected without the 'no-build' option with a specified workspace. "
-                    "Initial build will be deactivated. "
-                    "Please manually build your environment by calling `fzirob make`.",
-                    fg="yellow",
-                )
-            no_build = True
-
-        # Let's get down to business
-        self.create_directories()
+    def create_demos(self):
+        """Creates the demo docs and scripts"""
         self.create_demo_docs()
         self.create_demo_scripts()
 
-        if self.create_misc_ws:
-            click.echo("Creating misc workspace")
-            environment_helpers.MiscCreator(
-                misc_ws_directory=self.misc_ws_directory,
-                rosinstall=self.misc_ws_rosinstall,
-                build_root=self.misc_ws_build_directory,
-                no_submodules=self.no_submodules,
-            )
-        else:
-            click.echo("Requested to not create a misc workspace")
-
-        # Check if we should create a catkin workspace and create one if desired
-        if catkin_creator:
-            click.echo("Creating catkin_ws")
-            catkin_creator.create()
-        else:
-            click.echo("Requested to not create a catkin_ws")
-
-        if colcon_creator:
-            click.echo("Creating colcon_ws")
-            colcon_creator.create()
-        else:
-            click.echo("Requested to not create a colcon_ws")
-
-        if not no_build:
-            if self.create_catkin and self.catkin_rosinstall != "":
-                ros_builder = build.CatkinBuilder(
-                    name=catkin_creator.ros_distro, add_help_option=False
-                )
-                ros_builder.invoke(None)
-            if self.create_colcon and self.colcon_rosinstall != "":
-                ros2_builder = build.ColconBuilder(
-                    name=colcon_creator.ros2_distro, add_help_option=False
-                )
-                ros2_builder.invoke(None)
-
     def create_directories(self):
         """Creates the directory skeleton with build_directories and symlinks"""
         os.mkdir(os.path.join(dir_helpers.get_checkout_dir(), self.env_name))
@@ -250,8 +391,21 @@ class EnvCreator(object):
         )
 
     def parse_config(self, config_file):
-        """Parses a config file to get an environment information"""
+        """Parses a config file to get an environment information. The config is checked
+        before, so all problems are reported before anything is cloned or built."""
         parser = ConfigFileParser(config_file)
+        if self.check_remotes:
+            click.echo("Checking the repositories of the config file")
+        problems, warnings = run_preflight(parser, self.check_remotes)
+        for warning in warnings:
+            click.secho("WARNING: {}: {}".format(config_file, warning), fg="yellow")
+        if problems:
+            raise ModuleException(
+                "The config file {} has the following problems:\n{}".format(
+                    config_file, "\n".join(problems)
+                ),
+                "add",
+            )
 
         (self.create_misc_ws, self.misc_ws_rosinstall) = parser.parse_misc_ws_config()
 
@@ -292,8 +446,83 @@ class EnvCreator(object):
             out_file.write(docstring)
 
 
+def echo_resume_hint(env_dir):
+    """Tells how to continue a creation that failed after its state has been stored"""
+    if os.path.isfile(
+        os.path.join(env_dir, environment_helpers.CREATION_STATE_FILENAME)
+    ):
+        click.echo(
+            "Completed steps have been kept. Run 'fzirob add_environment --resume {}' to "
+            "continue with the failed step.".format(os.path.basename(env_dir))
+        )
+
+
+def start_background_creation(state):
+    """Continues a creation in a detached process that writes its output to a log file
+    inside the environment. Returns the path of the log file."""
+    env_dir = os.path.dirname(state.path)
+    env_name = os.path.basename(env_dir)
+    worker_env = os.environ.copy()
+    # Keeps the worker from treating the new environment as the most recently used one
+    worker_env["ROB_FOLDERS_ACTIVE_ENV"] = env_name
+    log_path = os.path.join(env_dir, environment_helpers.CREATION_LOG_FILENAME)
+    with open(log_path, "a") as log_file:
+        process = subprocess.Popen(
+            rob_folders_command("add_environment", "--resume", env_name),
+            cwd=env_dir,
+            env=worker_env,
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+    # The worker records its pid itself as well, this covers the time until it started
+    state.pid = process.pid
+    state.save()
+    return log_path
+
+
+def resume_in_background(env_dir):
+    """Continues a failed creation in the background"""
+    with EnvironmentLock(os.path.basename(env_dir)):
+        state = environment_helpers.CreationState.load(env_dir)
+        if state is None:
+            raise ModuleException(
+                'Environment "{}" has no unfinished creation to resume'.format(
+                    os.path.basename(env_dir)
+                ),
+                "add",
+            )
+        if state.is_running():
+            raise ModuleException(
+                'Environment "{}" is still being created'.format(
+                    os.path.basename(env_dir)
+                ),
+                "add",
+            )
+        state.settings["background"] = True
+        state.error = None
+        return start_background_creation(state)
+
+
+def echo_background_hint(log_path):
+    """Tells where the progress of a background creation can be followed"""
+    click.echo(
+        "The environment is cloned and built in the background, its output is written "
+        "to {}. Run 'fzirob active_environment' to see the progress.".format(log_path)
+    )
+
+
 @click.command("add_environment", short_help="Add a new environment")
 @click.option("--config_file", help="Create an environment from a given config file.")
+@click.option(
+    "--bundle",
+    type=click.Path(exists=True, dir_okay=False),
+    help=(
+        "Create an environment from an archive written by 'fzirob export_environment'. "
+        "Repositories are cloned from the bundles inside the archive without network access."
+    ),
+)
 @click.option(
     "--no_build", is_flag=True, default=False, help="Do not perform an initial build."
 )
@@ -353,6 +582,60 @@ class EnvCreator(object):
     is_flag=True,
     help="Prevent git submodules from being cloned",
 )
+@click.option(
+    "--submodule_strategy",
+    type=click.Choice(["recursive", "parallel", "shallow", "lazy"]),
+    default=None,
+    help=(
+        "How submodules are fetched: 'recursive' clones them one at a time, 'parallel' "
+        "fetches them in parallel, 'shallow' additionally fetches only their latest commit "
+        "and 'lazy' defers their initialization until the workspace is built for the first "
+        "time. Defaults to the 'submodule_strategy' setting in the config."
+    ),
+)
+@click.option(
+    "--submodule_jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of submodules fetched in parallel. "
+        "Defaults to the 'submodule_jobs' setting in the config."
+    ),
+)
+@click.option(
+    "--use_mirrors/--no_mirrors",
+    default=None,
+    help=(
+        "Clone repositories from the local mirror cache and point origin to the real "
+        "remote afterwards. Defaults to the 'use_mirrors' setting in the config."
+    ),
+)
+@click.option(
+    "--clone_depth",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Create shallow clones with a history truncated to the given number of commits. "
+        "Can also be set per repository using the 'depth' key in the config file."
+    ),
+)
+@click.option(
+    "--filter",
+    default=None,
+    help=(
+        "Create partial clones using the given filter spec, e.g. 'blob:none'. "
+        "Can also be set per repository using the 'filter' key in the config file."
+    ),
+)
+@click.option(
+    "--no_remote_check",
+    is_flag=True,
+    default=False,
+    help=(
+        "Do not check that all repositories and versions of the config file exist before "
+        "creating the environment."
+    ),
+)
 @click.option(
     "--underlays",
     type=click.Choice(["ask", "skip"]),
@@ -362,10 +645,29 @@ class EnvCreator(object):
         'to be used. When set to "skip", no underlays will be configured.'
     ),
 )
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help=(
+        "Continue the creation of an environment that failed with the failed step. "
+        "All other options are taken from the first attempt."
+    ),
+)
+@click.option(
+    "--background",
+    is_flag=True,
+    default=False,
+    help=(
+        "Only create the environment's folders and return, the repositories are cloned "
+        "and built by a detached process."
+    ),
+)
 @click.argument("env_name", nargs=1)
 def cli(
     env_name,
     config_file,
+    bundle,
     no_build,
     create_misc_ws,
     create_catkin,
@@ -375,42 +677,88 @@ def cli(
     ros_distro,
     ros2_distro,
     no_submodules,
+    submodule_strategy,
+    submodule_jobs,
+    use_mirrors,
+    clone_depth,
+    filter,
+    no_remote_check,
     underlays,
+    resume,
+    background,
 ):
     """Adds a new environment and creates the basic needed folders,
     e.g. a colcon_workspace and a catkin_ws."""
-    environment_creator = EnvCreator(env_name, no_submodules=no_submodules)
+    if bundle and config_file:
+        raise ModuleException(
+            "The options --config_file and --bundle cannot be combined", "add"
+        )
+    env_dir = os.path.join(dir_helpers.get_checkout_dir(), env_name)
+    if resume and background:
+        echo_background_hint(resume_in_background(env_dir))
+        return
+    if resume:
+        state = environment_helpers.CreationState.load(env_dir)
+        # Bundles are extracted to a temporary directory, so they have to be extracted again
+        config_file = None
+        bundle = state.settings["bundle"] if state is not None else None
+    environment_creator = EnvCreator(
+        env_name,
+        no_submodules=no_submodules,
+        submodule_strategy=submodule_strategy,
+        submodule_jobs=submodule_jobs,
+        use_mirrors=use_mirrors,
+        clone_depth=clone_depth,
+        filter=filter,
+    )
     environment_creator.build = not no_build
+    environment_creator.check_remotes = not no_remote_check
+    if bundle:
+        environment_creator.bundle = os.path.abspath(bundle)
 
     is_env_active = False
     if os.environ.get("ROB_FOLDERS_ACTIVE_ENV"):
         is_env_active = True
     os.environ["ROB_FOLDERS_ACTIVE_ENV"] = env_name
 
+    bundle_dir = None
     try:
-        environment_creator.create_new_environment(
-            config_file,
-            no_build,
-            create_misc_ws,
-            create_catkin,
-            create_colcon,
-            copy_cmake_lists,
-            local_build,
-            ros_distro,
-            ros2_distro,
-            underlays,
-        )
+        if bundle:
+            bundle_dir = tempfile.mkdtemp(prefix="rob_folders_bundle_")
+            click.echo("Extracting {}".format(bundle))
+            extract_archive(bundle, bundle_dir)
+            config_file = os.path.join(bundle_dir, BUNDLE_CONFIG_NAME)
+        with EnvironmentLock(env_name):
+            environment_creator.create_new_environment(
+                config_file,
+                no_build,
+                create_misc_ws,
+                create_catkin,
+                create_colcon,
+                copy_cmake_lists,
+                local_build,
+                ros_distro,
+                ros2_distro,
+                underlays,
+                resume,
+                background,
+            )
     except subprocess.CalledProcessError as err:
+        echo_resume_hint(env_dir)
         raise (ModuleException(str(err), "add"))
     except Exception as err:
         click.echo(err)
         click.echo("Something went wrong while creating the environment!")
+        echo_resume_hint(env_dir)
         raise (ModuleException(str(err), "add"))
-    click.echo("Initial workspace setup completed")
+    finally:
+        if bundle_dir is not None:
+            shutil.rmtree(bundle_dir)
+    if background:
+        echo_background_hint(start_background_creation(environment_creator.state))
+    else:
+        click.echo("Initial workspace setup completed")
 
     if not is_env_active:
         click.echo("Writing env %s into .cur_env" % env_name)
-        with open(
-            os.path.join(dir_helpers.get_checkout_dir(), ".cur_env"), "w"
-        ) as cur_env_file:
-            cur_env_file.write("{}".format(env_name))
+        dir_helpers.set_last_activated_env(env_name)
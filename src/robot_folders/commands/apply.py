@@ -0,0 +1,432 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Implements provisioning multiple environments from a manifest file"""
+import concurrent.futures
+import os
+import subprocess
+import tempfile
+import time
+
+import click
+import yaml
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.job_helpers import (
+    echo_table,
+    format_duration,
+    rob_folders_command,
+)
+from robot_folders.helpers.ros_version_helpers import (
+    installed_ros_1_versions,
+    installed_ros_2_versions,
+)
+from robot_folders.helpers.ssh_helpers import SshMultiplexer
+from robot_folders.helpers.underlays import UnderlayManager
+
+
+# Default values for all keys allowed inside an environment spec
+SPEC_DEFAULTS = {
+    "config_file": None,
+    "ros_distro": "ask",
+    "ros2_distro": "ask",
+    "underlays": None,
+    "local_build": "no",
+    "copy_cmake_lists": "no",
+    "no_build": False,
+    "local_delete_policy": "keep_all",
+    "local_override_policy": "override",
+    "submodule_strategy": None,
+    "use_mirrors": None,
+    "clone_depth": None,
+    "filter": None,
+}
+
+# Distribution settings of an environment spec and the config sections of the workspaces using
+# them
+DISTRO_SECTIONS = {"ros_distro": "catkin_workspace", "ros2_distro": "colcon_workspace"}
+
+# Sources the environment given as first argument, including its underlays, and runs the
+# remaining arguments inside it, like 'fzirob change_environment' does in an interactive shell
+SOURCE_AND_RUN_SCRIPT = """environment_dir="$1"
+shift
+if [ -f "$environment_dir/setup.sh" ]; then
+  source "$environment_dir/setup.sh"
+elif [ -f "$environment_dir/setup.bash" ]; then
+  source "$environment_dir/setup.bash"
+else
+  source "$ROB_FOLDERS_BASE_DIR/bin/source_environment.sh"
+fi
+exec "$@"
+"""
+
+
+def yes_no(value):
+    """Converts booleans (which is what YAML makes out of yes and no) back to yes / no"""
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    return str(value)
+
+
+class ManifestApplier(object):
+    """Adds or adapts all environments listed in a manifest file"""
+
+    def __init__(self, manifest_file, jobs=2, log_dir=None):
+        self.manifest_file = manifest_file
+        self.jobs = jobs
+        self.log_dir = log_dir
+        self.environments = dict()
+        self.results = dict()
+
+    def parse_manifest(self):
+        """Reads the manifest and merges the defaults into all environment specs"""
+        with open(self.manifest_file, "r") as file_content:
+            manifest = yaml.safe_load(file_content) or dict()
+
+        if not isinstance(manifest.get("environments"), dict):
+            raise ModuleException(
+                "Manifest {} does not contain an 'environments' section".format(
+                    self.manifest_file
+                ),
+                "apply",
+            )
+        defaults = dict(SPEC_DEFAULTS)
+        defaults.update(manifest.get("defaults") or dict())
+        manifest_dir = os.path.dirname(os.path.abspath(self.manifest_file))
+
+        for env_name, env_spec in manifest["environments"].items():
+            spec = dict(defaults)
+            spec.update(env_spec or dict())
+            unknown_keys = set(spec.keys()) - set(SPEC_DEFAULTS.keys())
+            if unknown_keys:
+                raise ModuleException(
+                    "Unknown key(s) for environment '{}': {}".format(
+                        env_name, ", ".join(sorted(unknown_keys))
+                    ),
+                    "apply",
+                )
+            if not spec["config_file"]:
+                raise ModuleException(
+                    "No config_file given for environment '{}'".format(env_name),
+                    "apply",
+                )
+            spec["config_file"] = os.path.join(
+                manifest_dir, os.path.expanduser(spec["config_file"])
+            )
+            if spec["underlays"] is not None:
+                spec["underlays"] = list(spec["underlays"])
+            self.environments[env_name] = spec
+
+        existing = dir_helpers.list_environments()
+        for env_name, spec in self.environments.items():
+            if env_name not in existing:
+                self.resolve_distros(env_name, spec)
+        for env_name, spec in self.environments.items():
+            for underlay in spec["underlays"] or []:
+                if underlay not in self.environments and underlay not in existing:
+                    raise ModuleException(
+                        "Underlay '{}' of environment '{}' neither exists nor is part "
+                        "of the manifest".format(underlay, env_name),
+                        "apply",
+                    )
+
+    def resolve_distros(self, env_name, spec):
+        """Replaces 'ask' as ROS distribution of the workspaces in the config file by the only
+        installed distribution, as the jobs run without a terminal to ask. Raises a
+        ModuleException if the choice is ambiguous."""
+        asked = [key for key in DISTRO_SECTIONS if spec[key] == "ask"]
+        if not asked or not os.path.isfile(spec["config_file"]):
+            return
+        with open(spec["config_file"], "r") as file_content:
+            config = yaml.safe_load(file_content)
+        if not isinstance(config, dict):
+            return
+        installed_versions = {
+            "ros_distro": installed_ros_1_versions,
+            "ros2_distro": installed_ros_2_versions,
+        }
+        for key in asked:
+            if DISTRO_SECTIONS[key] not in config:
+                continue
+            try:
+                installed = installed_versions[key]()
+            except OSError:
+                installed = list()
+            if len(installed) != 1:
+                raise ModuleException(
+                    "Environment '{}' has to set '{}', as {} matching ROS distributions "
+                    "are installed".format(env_name, key, len(installed)),
+                    "apply",
+                )
+            spec[key] = installed[0]
+
+    def get_action(self, env_name):
+        """Returns whether an environment has to be added or adapted"""
+        if env_name in dir_helpers.list_environments():
+            return "adapt"
+        return "add"
+
+    def build_command(self, env_name, action):
+        """Returns the robot_folders command line adding or adapting an environment
+        non-interactively"""
+        spec = self.environments[env_name]
+        options = list()
+        if action == "add":
+            options.extend(
+                [
+                    "--config_file={}".format(spec["config_file"]),
+                    "--local_build={}".format(yes_no(spec["local_build"])),
+                    "--copy_cmake_lists={}".format(yes_no(spec["copy_cmake_lists"])),
+                    "--ros_distro={}".format(spec["ros_distro"]),
+                    "--ros2_distro={}".format(spec["ros2_distro"]),
+                    "--underlays=skip",
+                ]
+            )
+            # Environments with underlays are built once their underlays are set, see
+            # build_make_command
+            if spec["no_build"] or spec["underlays"]:
+                options.append("--no_build")
+        else:
+            options.extend(
+                [
+                    "--local_delete_policy={}".format(spec["local_delete_policy"]),
+                    "--local_override_policy={}".format(spec["local_override_policy"]),
+                ]
+            )
+        if spec["submodule_strategy"]:
+            options.append("--submodule_strategy={}".format(spec["submodule_strategy"]))
+        if spec["use_mirrors"] is not None:
+            options.append("--use_mirrors" if spec["use_mirrors"] else "--no_mirrors")
+        if spec["clone_depth"]:
+            options.append("--clone_depth={}".format(spec["clone_depth"]))
+        if spec["filter"]:
+            options.append("--filter={}".format(spec["filter"]))
+
+        if action == "add":
+            return rob_folders_command("add_environment", *(options + [env_name]))
+        return rob_folders_command(
+            "adapt_environment", *(options + [env_name, spec["config_file"]])
+        )
+
+    def build_make_command(self, env_name, action):
+        """Returns the command line building an environment inside a shell that sourced it
+        together with its underlays or None if the environment is not built separately
+        """
+        spec = self.environments[env_name]
+        if action != "add" or spec["no_build"] or not spec["underlays"]:
+            return None
+        env_dir = os.path.join(dir_helpers.get_checkout_dir(), env_name)
+        return ["bash", "-c", SOURCE_AND_RUN_SCRIPT, "bash", env_dir] + (
+            rob_folders_command("make")
+        )
+
+    def run_job(self, env_name, action):
+        """Adds or adapts a single environment in a separate process writing its output to a
+        log file. Returns the process' return code."""
+        command = self.build_command(env_name, action)
+        job_env = os.environ.copy()
+        # Keeps the job from treating the new environment as the most recently used one
+        job_env["ROB_FOLDERS_ACTIVE_ENV"] = env_name
+        with open(self.log_file(env_name), "w") as log_file:
+            process = subprocess.run(
+                command,
+                env=job_env,
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+            )
+            if process.returncode != 0 or not self.environments[env_name]["underlays"]:
+                return process.returncode
+            underlay_manager = UnderlayManager(env_name)
+            underlay_manager.underlays = self.environments[env_name]["underlays"]
+            underlay_manager.write_underlay_file()
+
+            make_command = self.build_make_command(env_name, action)
+            if make_command is None:
+                return process.returncode
+            log_file.flush()
+            process = subprocess.run(
+                make_command,
+                env=job_env,
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+            )
+        return process.returncode
+
+    def log_file(self, env_name):
+        """Returns the path of the log file for an environment"""
+        return os.path.join(self.log_dir, "{}.log".format(env_name))
+
+    def apply(self):
+        """Processes all environments. Environments are processed in parallel, except for
+        underlays that have to be finished before the environments using them."""
+        if self.log_dir is None:
+            self.log_dir = tempfile.mkdtemp(prefix="rob_folders_apply_")
+        dir_helpers.mkdir_p(self.log_dir)
+
+        pending = list(self.environments.keys())
+        running = dict()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while pending or running:
+                for env_name in list(pending):
+                    dependencies = [
+                        underlay
+                        for underlay in self.environments[env_name]["underlays"] or []
+                        if underlay in self.environments
+                    ]
+                    failed = [
+                        underlay
+                        for underlay in dependencies
+                        if underlay in self.results
+                        and self.results[underlay]["result"] != "ok"
+                    ]
+                    if failed:
+                        pending.remove(env_name)
+                        self.results[env_name] = {
+                            "action": self.get_action(env_name),
+                            "result": "skipped (underlay {} failed)".format(failed[0]),
+                            "duration": 0,
+                        }
+                    elif all(underlay in self.results for underlay in dependencies):
+                        pending.remove(env_name)
+                        action = self.get_action(env_name)
+                        click.echo("Starting to {} '{}'".format(action, env_name))
+                        future = executor.submit(self.run_job, env_name, action)
+                        running[future] = (env_name, action, time.time())
+
+                if not running:
+                    # Everything left waits for each other
+                    for env_name in pending:
+                        self.results[env_name] = {
+                            "action": self.get_action(env_name),
+                            "result": "skipped (cyclic underlays)",
+                            "duration": 0,
+                        }
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    env_name, action, start_time = running.pop(future)
+                    try:
+                        return_code = future.result()
+                        result = "ok" if return_code == 0 else "failed"
+                    except Exception as err:
+                        result = "failed ({})".format(err)
+                    self.results[env_name] = {
+                        "action": action,
+                        "result": result,
+                        "duration": time.time() - start_time,
+                    }
+                    click.echo(
+                        "Finished to {} '{}': {}".format(action, env_name, result)
+                    )
+
+    def echo_summary(self):
+        """Prints a table with the results of all environments"""
+        rows = list()
+        for env_name in self.environments:
+            result = self.results[env_name]
+            rows.append(
+                [
+                    env_name,
+                    result["action"],
+                    result["result"],
+                    format_duration(result["duration"]),
+                    self.log_file(env_name) if result["duration"] else "",
+                ]
+            )
+        echo_table(["Environment", "Action", "Result", "Duration", "Log"], rows)
+
+    def failed(self):
+        """Returns the names of all environments that could not be converged"""
+        return [
+            env_name
+            for env_name, result in self.results.items()
+            if result["result"] != "ok"
+        ]
+
+
+@click.command("apply", short_help="Add or adapt environments from a manifest")
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=2,
+    help="Maximum number of environments that are cloned or built at the same time.",
+)
+@click.option(
+    "--log_dir",
+    default=None,
+    help="Directory to write the per-environment logs to. Defaults to a temporary directory.",
+)
+@click.option(
+    "--dry_run",
+    is_flag=True,
+    default=False,
+    help="Only print which environments would be added or adapted.",
+)
+@click.argument("manifest_file", type=click.Path(exists=True, dir_okay=False))
+def cli(manifest_file, jobs, log_dir, dry_run):
+    """Converges all environments listed in MANIFEST_FILE. Missing environments are added and
+    existing ones are adapted to their config file without asking any questions.
+    Environments are processed in parallel, except that underlays are finished before the
+    environments using them. New environments with underlays are built after sourcing them
+    together with their underlays, unless no_build is set. A manifest looks like this:
+
+    \b
+    defaults:
+      local_build: no
+      ros2_distro: humble
+    environments:
+      base:
+        config_file: base.yaml
+      app:
+        config_file: app.yaml
+        underlays: [base]
+    """
+    applier = ManifestApplier(manifest_file, jobs=jobs, log_dir=log_dir)
+    applier.parse_manifest()
+
+    if dry_run:
+        for env_name in applier.environments:
+            action = applier.get_action(env_name)
+            command = applier.build_command(env_name, action)
+            click.echo(" ".join(["fzirob"] + command[3:]))
+            if applier.build_make_command(env_name, action) is not None:
+                click.echo(
+                    "fzirob change_environment {} && fzirob make".format(env_name)
+                )
+        return
+
+    # The spawned commands inherit the shared connections
+    with SshMultiplexer():
+        applier.apply()
+    applier.echo_summary()
+    failed = applier.failed()
+    if failed:
+        raise ModuleException(
+            "Failed to converge environment(s): {}".format(", ".join(failed)),
+            "apply",
+        )
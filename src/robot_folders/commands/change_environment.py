@@ -29,10 +29,7 @@ from robot_folders.helpers.exceptions import ModuleException
 
 
 def set_active_env(env_name):
-    with open(
-        os.path.join(dir_helpers.get_checkout_dir(), ".cur_env"), "w"
-    ) as cur_env_file:
-        cur_env_file.write("{}".format(env_name))
+    dir_helpers.set_last_activated_env(env_name)
 
 
 class EnvironmentChoice(click.Command):
@@ -25,6 +25,7 @@ import click
 from robot_folders.helpers.workspace_chooser import WorkspaceChooser
 import robot_folders.helpers.clean_helpers as clean
 from robot_folders.helpers.directory_helpers import get_active_env
+from robot_folders.helpers.lock_helpers import EnvironmentLock
 
 
 class CleanChooser(WorkspaceChooser):
@@ -38,15 +39,22 @@ class CleanChooser(WorkspaceChooser):
 
         if name in self.list_commands(ctx):
             if name == "ros":
-                return clean.CatkinCleaner(name=name, add_help_option=False)
+                return clean.CatkinCleaner(name=name, add_help_option=True)
             elif name == "colcon":
-                return clean.ColconCleaner(name=name, add_help_option=False)
+                return clean.ColconCleaner(name=name, add_help_option=True)
         else:
             click.echo("Did not find a workspace with the key < {} >.".format(name))
             return None
 
         return self
 
+    def invoke(self, ctx):
+        if get_active_env() is None:
+            super(CleanChooser, self).invoke(ctx)
+            return
+        with EnvironmentLock(get_active_env()):
+            super(CleanChooser, self).invoke(ctx)
+
 
 @click.command(
     "clean",
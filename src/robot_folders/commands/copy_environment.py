@@ -0,0 +1,229 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Implements the copy command"""
+
+import os
+import shutil
+import subprocess
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.clone_helpers import (
+    COPY_MODES,
+    CloneOptions,
+    copy_repository,
+)
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+
+
+# Build artifacts of the workspaces that are not copied into the new environment
+BUILD_ARTIFACTS = {
+    "misc": ["export"],
+    "ros": [
+        "build",
+        "devel",
+        "install",
+        "build_isolated",
+        "devel_isolated",
+        "install_isolated",
+        "compile_commands.json",
+    ],
+    "colcon": ["build", "install", "log"],
+}
+
+
+class EnvCopier(object):
+    """Worker class that creates a new environment from an existing one"""
+
+    def __init__(self, source_name, target_name, mode="hardlink", clone_options=None):
+        self.source_name = source_name
+        self.target_name = target_name
+        self.mode = mode
+        self.clone_options = clone_options or CloneOptions(use_mirrors=False)
+        self.source_dir = os.path.join(dir_helpers.get_checkout_dir(), source_name)
+        self.target_dir = os.path.join(dir_helpers.get_checkout_dir(), target_name)
+        self.build_base_dir = dir_helpers.get_checkout_dir()
+        self.repositories = list()
+
+    def copy_environment(self, local_build="ask"):
+        """Locks both environments and copies the source to the target"""
+        with EnvironmentLock(self.source_name, shared=True), EnvironmentLock(
+            self.target_name
+        ):
+            self.copy(local_build)
+
+    def copy(self, local_build):
+        """Worker method that does the actual job"""
+        if self.source_name not in dir_helpers.list_environments():
+            raise ModuleException(
+                'Environment "{}" does not exist'.format(self.source_name), "copy"
+            )
+        if os.path.exists(self.target_dir):
+            raise ModuleException(
+                'Environment "{}" already exists'.format(self.target_name), "copy"
+            )
+
+        has_nobackup = dir_helpers.check_build_on_nobackup(local_build)
+        self.build_base_dir = dir_helpers.get_build_base_dir(has_nobackup)
+
+        click.echo(
+            'Copying environment "{}" to "{}"'.format(
+                self.source_name, self.target_name
+            )
+        )
+        build_dir = os.path.join(self.build_base_dir, self.target_name)
+        build_dir_existed = os.path.lexists(build_dir)
+        try:
+            self.copy_files()
+            self.create_build_folders()
+            for source_repo, target_repo in self.repositories:
+                click.echo(
+                    "Copying repository {}".format(
+                        os.path.relpath(target_repo, self.target_dir)
+                    )
+                )
+                copy_repository(source_repo, target_repo, self.mode, self.clone_options)
+        except BaseException:
+            click.echo(
+                'Copying failed. Removing environment "{}"'.format(self.target_name)
+            )
+            self.remove_target(None if build_dir_existed else build_dir)
+            raise
+
+    def remove_target(self, build_dir=None):
+        """Removes the partially created target environment and, if given, its build folder"""
+        for folder in [self.target_dir, build_dir]:
+            if folder is not None and os.path.isdir(folder):
+                shutil.rmtree(folder)
+        if self.mode == "worktree":
+            # Drop the administrative data of worktrees that were created already
+            for source_repo, _ in self.repositories:
+                subprocess.call(["git", "worktree", "prune"], cwd=source_repo)
+
+    def copy_files(self):
+        """Copies all files of the source environment except repositories and build artifacts.
+        The repositories are collected in self.repositories to be copied using git."""
+        ignored_dirs = dict()
+        for key, source_dir in dir_helpers.get_source_dirs(self.source_dir).items():
+            workspace_dir = source_dir if key == "misc" else os.path.dirname(source_dir)
+            ignored_dirs[workspace_dir] = BUILD_ARTIFACTS[key]
+
+        def ignore(folder, names):
+            ignored = list(ignored_dirs.get(folder, []))
+            for name in names:
+                if os.path.exists(os.path.join(folder, name, ".git")):
+                    source_repo = os.path.join(folder, name)
+                    self.repositories.append(
+                        (
+                            source_repo,
+                            os.path.join(
+                                self.target_dir,
+                                os.path.relpath(source_repo, self.source_dir),
+                            ),
+                        )
+                    )
+                    ignored.append(name)
+            return ignored
+
+        shutil.copytree(self.source_dir, self.target_dir, symlinks=True, ignore=ignore)
+
+    def create_build_folders(self):
+        """Creates the build folders of all workspaces. If a remote build is used (e.g.
+        no_backup) they are symlinked into the environment."""
+        links = list()
+        for key, source_dir in dir_helpers.get_source_dirs(self.target_dir).items():
+            if key == "misc":
+                links.append((source_dir, ["export"]))
+            elif key == "ros":
+                links.append(
+                    (os.path.dirname(source_dir), ["build", "devel", "install"])
+                )
+            elif key == "colcon":
+                links.append((os.path.dirname(source_dir), ["build", "log", "install"]))
+
+        for workspace_dir, names in links:
+            build_root = os.path.join(
+                self.build_base_dir,
+                self.target_name,
+                os.path.basename(workspace_dir),
+            )
+            for name in names:
+                local_dir = os.path.join(workspace_dir, name)
+                build_dir = os.path.join(build_root, name)
+                if local_dir != build_dir:
+                    os.makedirs(build_dir, exist_ok=True)
+                    os.symlink(build_dir, local_dir)
+                elif name == "export":
+                    os.makedirs(build_dir, exist_ok=True)
+
+
+@click.command("copy_environment", short_help="Copy an existing environment")
+@click.option(
+    "--mode",
+    type=click.Choice(COPY_MODES),
+    default="hardlink",
+    help=(
+        "How repositories are copied. 'hardlink' creates local clones sharing the object "
+        "files by hardlinks. 'shared' creates clones borrowing the objects of the source "
+        "repositories and 'worktree' creates linked worktrees with a detached HEAD. "
+        "With 'shared' and 'worktree' the copy breaks when the source environment is deleted."
+    ),
+)
+@click.option(
+    "--local_build",
+    type=click.Choice(["yes", "no", "ask"]),
+    default="ask",
+    help=(
+        "If set to 'yes', the environment folder will be used for building directly. "
+        " If set to 'no', builds will be done inside the `no_backup` directory"
+    ),
+)
+@click.option(
+    "--no_submodules",
+    default=False,
+    is_flag=True,
+    help="Prevent git submodules from being initialized",
+)
+@click.argument("source_env", nargs=1)
+@click.argument("target_env", nargs=1)
+def cli(source_env, target_env, mode, local_build, no_submodules):
+    """Creates a new environment TARGET_ENV from the existing environment SOURCE_ENV without
+    downloading any repository again. All repositories keep their checked out branch or commit
+    and their remotes. Demos, underlays and all other files of the environment are copied as
+    well, while build artifacts are not. Uncommitted changes are not copied.
+    """
+    copier = EnvCopier(
+        source_env,
+        target_env,
+        mode=mode,
+        clone_options=CloneOptions(no_submodules=no_submodules, use_mirrors=False),
+    )
+    try:
+        copier.copy_environment(local_build)
+    except subprocess.CalledProcessError as err:
+        raise (ModuleException(str(err), "copy"))
+    click.echo(
+        'Copied environment. Source it with "fzirob change_environment {}" and build it '
+        'with "fzirob make".'.format(target_env)
+    )
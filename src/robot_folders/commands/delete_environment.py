@@ -23,11 +23,13 @@
 Implements the delete command
 """
 import os
-import shutil
 import getpass
 import click
 
 import robot_folders.helpers.directory_helpers as directory_helpers
+from robot_folders.helpers.disk_usage_helpers import get_build_folders
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.trash_helpers import move_to_trash, start_reclaim
 
 
 def append_to_list_if_symlink(path, delete_list):
@@ -51,12 +53,15 @@ def append_to_list_if_folder(path, delete_list):
     return False
 
 
-def delete_folder(path):
-    """Deletes the given path, if it exists and is a folder.
+def delete_folder(path, trash_dirs=None):
+    """Deletes the given path, if it exists and is a folder. The folder is moved into the
+    trash and the trash directory used is added to trash_dirs for reclaiming it later.
     Returns true, if folder exists and was successfully delete."""
     if os.path.exists(path):
         if os.path.isdir(path):
-            shutil.rmtree(path)
+            trash_dir = move_to_trash(path)
+            if trash_dirs is not None and trash_dir is not None:
+                trash_dirs.add(trash_dir)
             return True
     return False
 
@@ -70,6 +75,11 @@ class EnvironmentDeleter(click.Command):
         self.force = False
 
     def invoke(self, ctx):
+        with EnvironmentLock(self.name):
+            self.delete(ctx)
+
+    def delete(self, ctx):
+        """Collects all folders belonging to the environment and deletes them"""
         env_dir = os.path.join(directory_helpers.get_checkout_dir(), self.name)
         catkin_dir = directory_helpers.get_catkin_dir(env_dir)
 
@@ -89,6 +99,11 @@ class EnvironmentDeleter(click.Command):
         else:
             click.echo("No catkin workspace found")
 
+        # Build folders of the other workspaces, e.g. colcon's, symlinked to no_backup
+        for folder in get_build_folders(env_dir):
+            if os.path.realpath(folder) not in delete_list:
+                append_to_list_if_symlink(folder, delete_list)
+
         delete_list.append(env_dir)
 
         # no_backup build base
@@ -116,9 +131,12 @@ class EnvironmentDeleter(click.Command):
 
         if confirmed:
             click.echo("performing deletion!")
+            trash_dirs = set()
             for folder in delete_list:
                 click.echo("Deleting {}".format(folder))
-                delete_folder(folder)
+                delete_folder(folder, trash_dirs)
+            # The deleted folders are freed in the background
+            start_reclaim(trash_dirs)
             click.echo("Successfully deleted environment '{}'".format(self.name))
         else:
             click.echo("Delete request aborted. Nothing happened.")
@@ -0,0 +1,105 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that shows the disk usage of environments"""
+import os
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.cache_helpers import DiskUsageCache
+from robot_folders.helpers.disk_usage_helpers import (
+    AREAS,
+    get_environment_areas,
+    measure_trees,
+)
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.job_helpers import echo_table, format_size
+
+
+@click.command("du", short_help="Show the disk usage of environments")
+@click.option(
+    "--no_cache",
+    is_flag=True,
+    default=False,
+    help="Read the size of every file instead of using the results of previous runs.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of directories read in parallel. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+@click.argument("env_names", nargs=-1)
+def cli(no_cache, jobs, env_names):
+    """Shows the disk space used by the given environments (all environments if none are
+    given), split into sources, build, devel and install spaces, logs, the export folder of
+    the misc workspace and everything else. Build folders on no_backup and the environment's
+    folder in the build base directory are included.
+
+    Directories that did not change since the last run are not read again. Files that
+    changed their size without being replaced are only noticed with --no_cache.
+    """
+    if env_names:
+        unknown = set(env_names) - set(dir_helpers.list_environments())
+        if unknown:
+            raise ModuleException(
+                "Unknown environment(s): {}".format(", ".join(sorted(unknown))), "du"
+            )
+    else:
+        env_names = dir_helpers.list_environments()
+
+    environment_areas = {
+        env_name: get_environment_areas(env_name) for env_name in env_names
+    }
+    cache = None if no_cache else DiskUsageCache()
+    sizes = measure_trees(
+        [path for areas in environment_areas.values() for _, path in areas],
+        jobs,
+        cache,
+    )
+    if cache is not None:
+        cache.save()
+
+    rows = list()
+    counted = set()
+    for env_name, areas in environment_areas.items():
+        area_sizes = dict((area, 0) for area in AREAS)
+        for area, path in areas:
+            path = os.path.realpath(path)
+            if path not in counted:
+                counted.add(path)
+                area_sizes[area] += sizes.get(path, 0)
+        rows.append([env_name] + [area_sizes[area] for area in AREAS])
+    rows.sort(key=lambda row: sum(row[1:]), reverse=True)
+    totals = [sum(row[column] for row in rows) for column in range(1, len(AREAS) + 1)]
+    rows.append(["total"] + totals)
+    echo_table(
+        ["Environment"] + AREAS + ["Total"],
+        [
+            [row[0]] + [format_size(size) for size in row[1:] + [sum(row[1:])]]
+            for row in rows
+        ],
+    )
@@ -0,0 +1,111 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that exports an environment into an archive that can be imported offline"""
+import os
+import shutil
+import tempfile
+
+import click
+
+from robot_folders.helpers.bundle_helpers import write_archive, write_bundle_dir
+from robot_folders.helpers.cache_helpers import ScrapeCache
+from robot_folders.helpers.directory_helpers import get_checkout_dir, list_environments
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.scrape_helpers import EnvironmentScraper
+
+
+class EnvironmentExporter(click.Command):
+    """Scrapes an environment and bundles all of its repositories"""
+
+    def invoke(self, ctx):
+        with EnvironmentLock(self.name, shared=True):
+            self.export(ctx)
+
+    def export(self, ctx):
+        """Exports the environment while holding a shared lock on it"""
+        scraper = EnvironmentScraper(
+            ctx.parent.params["use_commit_id"],
+            ctx.parent.params["nested_repositories"],
+            ScrapeCache(),
+        )
+        out_file = os.path.abspath(ctx.params["out_file"])
+        staging_dir = tempfile.mkdtemp(prefix="rob_folders_export_")
+        try:
+            write_bundle_dir(
+                scraper, os.path.join(get_checkout_dir(), self.name), staging_dir
+            )
+            scraper.cache.save()
+            click.echo("Writing {}".format(out_file))
+            write_archive(staging_dir, out_file)
+        finally:
+            shutil.rmtree(staging_dir)
+
+
+class EnvironmentChooser(click.MultiCommand):
+    """Select the requested environment"""
+
+    def list_commands(self, ctx):
+        return list_environments()
+
+    def get_command(self, ctx, name):
+        # return empty command with the correct name
+        if name in list_environments():
+            cmd = EnvironmentExporter(
+                name=name, params=[click.Argument(param_decls=["out_file"])]
+            )
+            return cmd
+        else:
+            click.echo("No environment with name < %s > found." % name)
+            return None
+
+
+@click.command(
+    "export_environment",
+    cls=EnvironmentChooser,
+    short_help="Export an environment into an archive for offline use",
+    invoke_without_command=True,
+)
+@click.option(
+    "--use_commit_id",
+    is_flag=True,
+    default=False,
+    help="If checked, the exact commit IDs get scraped instead of branch names.",
+)
+@click.option(
+    "--nested_repositories",
+    is_flag=True,
+    default=False,
+    help="Also look for repositories inside other repositories (excluding submodules).",
+)
+@click.pass_context
+def cli(ctx, use_commit_id, nested_repositories):
+    """Exports an environment into a single archive containing its config (as written by
+    scrape_environment including the demo scripts) and a git bundle of every repository.
+    The archive type is chosen from the file name, e.g. env.tar.zst or env.tar.gz.
+    Use 'fzirob add_environment --bundle' to create an environment from the archive without
+    network access.
+    """
+    if ctx.invoked_subcommand is None:
+        click.echo(
+            "No environment specified. Please choose one "
+            "of the available environments!"
+        )
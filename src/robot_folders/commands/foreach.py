@@ -0,0 +1,188 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that runs a shell command in every repository of the active environment"""
+import concurrent.futures
+import fnmatch
+import os
+import shlex
+import subprocess
+import threading
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.repository_helpers import (
+    find_environment_repositories,
+    get_repository_status,
+)
+from robot_folders.helpers.ssh_helpers import SshMultiplexer
+
+
+class RepositoryRunner(object):
+    """Runs a shell command in repositories and prints their output prefixed with the
+    repository name"""
+
+    def __init__(self, command, interleave=False):
+        self.command = command
+        self.interleave = interleave
+        self.output_lock = threading.Lock()
+
+    def echo(self, prefix, lines):
+        """Prints lines prefixed with the repository name without mixing them with the
+        output of other repositories"""
+        with self.output_lock:
+            for line in lines:
+                click.echo("[{}] {}".format(prefix, line.rstrip("\n")))
+
+    def run(self, repo):
+        """Runs the command inside a repository and returns its exit code"""
+        key, local_name, repo_path = repo
+        env = dict(os.environ)
+        env["ROB_FOLDERS_REPO_NAME"] = local_name
+        env["ROB_FOLDERS_REPO_WORKSPACE"] = key
+        process = subprocess.Popen(
+            self.command,
+            shell=True,
+            cwd=repo_path,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+        if self.interleave:
+            for line in process.stdout:
+                self.echo(local_name, [line])
+        else:
+            self.echo(local_name, process.stdout.readlines())
+        process.stdout.close()
+        return process.wait()
+
+
+@click.command("foreach", short_help="Run a command in every repository")
+@click.option(
+    "--ws",
+    "workspaces",
+    type=click.Choice(["ros", "colcon", "misc"]),
+    multiple=True,
+    help="Only use repositories of the given workspace. Can be given multiple times.",
+)
+@click.option(
+    "--name",
+    "patterns",
+    multiple=True,
+    help=(
+        "Only use repositories whose path inside the workspace matches the given glob "
+        "pattern, e.g. 'drivers/*'. Can be given multiple times."
+    ),
+)
+@click.option(
+    "--dirty",
+    is_flag=True,
+    default=False,
+    help="Only use repositories with changed or untracked files.",
+)
+@click.option(
+    "--interleave",
+    is_flag=True,
+    default=False,
+    help=(
+        "Print output lines as soon as they are written instead of printing the output "
+        "of each repository at once when its command finished."
+    ),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of repositories the command runs in at the same time. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+@click.argument("command", nargs=-1, required=True)
+def cli(workspaces, patterns, dirty, interleave, jobs, command):
+    """Runs COMMAND in every repository of the active environment, e.g.
+
+    \b
+    fzirob foreach --ws colcon -- git pull --rebase
+
+    A single argument is run as shell command, so it may contain pipes and redirections
+    when quoted. The name and workspace of each repository are available to the command as
+    ROB_FOLDERS_REPO_NAME and ROB_FOLDERS_REPO_WORKSPACE. Each line of output is prefixed
+    with the name of its repository.
+    """
+    env_dir = dir_helpers.get_env_dir()
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    if len(command) == 1:
+        shell_command = command[0]
+    else:
+        shell_command = " ".join(shlex.quote(arg) for arg in command)
+
+    with EnvironmentLock(os.path.basename(env_dir), shared=True):
+        repos = find_environment_repositories(env_dir, workspaces or None)
+        if patterns:
+            repos = [
+                repo
+                for repo in repos
+                if any(fnmatch.fnmatch(repo[1], pattern) for pattern in patterns)
+            ]
+        if dirty:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                states = list(
+                    executor.map(lambda repo: get_repository_status(repo[2]), repos)
+                )
+            repos = [
+                repo
+                for repo, state in zip(repos, states)
+                if state["changed"] or state["untracked"]
+            ]
+
+        runner = RepositoryRunner(shell_command, interleave)
+        with SshMultiplexer(), concurrent.futures.ThreadPoolExecutor(
+            max_workers=jobs
+        ) as executor:
+            return_codes = list(executor.map(runner.run, repos))
+
+    failed = [
+        (repo, return_code)
+        for repo, return_code in zip(repos, return_codes)
+        if return_code != 0
+    ]
+    click.echo(
+        "\n{} of {} repositories succeeded".format(len(repos) - len(failed), len(repos))
+    )
+    if failed:
+        raise ModuleException(
+            "The command failed in the following repositories:\n{}".format(
+                "\n".join(
+                    "{}/{} (exit code {})".format(key, local_name, return_code)
+                    for (key, local_name, _), return_code in failed
+                )
+            ),
+            "foreach",
+        )
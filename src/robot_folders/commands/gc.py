@@ -0,0 +1,225 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that finds and removes build trees that are not used anymore"""
+import contextlib
+import os
+import time
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.cache_helpers import DiskUsageCache
+from robot_folders.helpers.clean_helpers import clean_folder
+from robot_folders.helpers.disk_usage_helpers import get_build_folders, measure_trees
+from robot_folders.helpers.job_helpers import echo_table, format_size
+from robot_folders.helpers.lock_helpers import checkout_lock
+from robot_folders.helpers.trash_helpers import move_to_trash, start_reclaim
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def get_build_base_dir():
+    """Returns the build base directory on no_backup or None if there is none"""
+    no_backup_dir = config_helpers.get_value_safe(
+        "directories", "no_backup_dir", debug=False
+    )
+    if not no_backup_dir:
+        return None
+    build_base_dir = dir_helpers.get_build_base_dir(use_no_backup=True)
+    return build_base_dir if os.path.isdir(build_base_dir) else None
+
+
+def is_inside(path, directory):
+    """Checks whether path is directory or lies below it"""
+    return os.path.commonpath([path, directory]) == directory
+
+
+def find_orphans(build_base_dir, env_names, link_targets):
+    """Returns the folders inside the build base that neither belong to an environment nor
+    contain the target of a symlink inside an environment, e.g. of a renamed environment
+    """
+    orphans = list()
+    for name in sorted(os.listdir(build_base_dir)):
+        path = os.path.realpath(os.path.join(build_base_dir, name))
+        if name.startswith(".") or name in env_names or not os.path.isdir(path):
+            continue
+        if not any(is_inside(target, path) for target in link_targets):
+            orphans.append(path)
+    return orphans
+
+
+def get_last_use(env_dir, build_folders):
+    """Returns the time an environment has been used last. This is the time it has been
+    sourced or built through robot_folders or, for environments used before this has been
+    recorded, the time of the last change inside its build folders."""
+    paths = [os.path.join(env_dir, dir_helpers.USAGE_MARKER_FILENAME)]
+    for folder in build_folders:
+        paths.append(folder)
+        try:
+            with os.scandir(folder) as entries:
+                paths.extend(entry.path for entry in entries)
+        except OSError:
+            continue
+    last_use = 0
+    for path in paths:
+        try:
+            last_use = max(last_use, os.stat(path).st_mtime)
+        except OSError:
+            continue
+    return last_use or os.stat(env_dir).st_mtime
+
+
+def format_age(timestamp):
+    """Formats the days since timestamp"""
+    return "{} days".format(int((time.time() - timestamp) // SECONDS_PER_DAY))
+
+
+@click.command("gc", short_help="Find and remove unused build trees")
+@click.option(
+    "--unused_days",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Also select the build, devel, install and log folders of environments that have "
+        "not been sourced or built for the given number of days."
+    ),
+)
+@click.option(
+    "--reclaim",
+    is_flag=True,
+    default=False,
+    help=(
+        "Move the selected folders to the trash instead of only listing them. Folders of "
+        "unused environments are emptied, so they can be built again later."
+    ),
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Skip the confirmation when reclaiming. This is meant for automated runs only.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of directories read in parallel when measuring sizes. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+def cli(unused_days, reclaim, force, jobs):
+    """Finds build trees in the no_backup build base that belong to no environment anymore,
+    e.g. because an environment has been deleted or renamed manually, and build symlinks
+    of environments pointing nowhere. With --unused_days, the build folders of environments
+    not used for that long are selected as well. The active and the most recently activated
+    environment are never selected.
+
+    Without --reclaim, the selected folders are only listed together with their size.
+    """
+    # Listing does not change anything, so other commands only have to wait when reclaiming
+    with checkout_lock() if reclaim else contextlib.nullcontext():
+        env_names = dir_helpers.list_environments()
+        checkout_dir = dir_helpers.get_checkout_dir()
+        build_folders = dict()
+        link_targets = set()
+        dangling = list()
+        for env_name in env_names:
+            env_dir = os.path.join(checkout_dir, env_name)
+            build_folders[env_name] = get_build_folders(env_dir)
+            for folder in build_folders[env_name]:
+                if not os.path.islink(folder):
+                    continue
+                target = os.path.realpath(folder)
+                link_targets.add(target)
+                if not os.path.exists(target):
+                    dangling.append(folder)
+
+        selected = list()
+        build_base_dir = get_build_base_dir()
+        if build_base_dir is not None:
+            for orphan in find_orphans(build_base_dir, env_names, link_targets):
+                selected.append(("orphaned", orphan, None))
+
+        if unused_days is not None:
+            protected = {
+                dir_helpers.get_active_env(),
+                dir_helpers.get_last_activated_env(),
+            }
+            deadline = time.time() - unused_days * SECONDS_PER_DAY
+            for env_name in env_names:
+                if env_name in protected:
+                    continue
+                folders = [
+                    os.path.realpath(folder)
+                    for folder in build_folders[env_name]
+                    if os.path.isdir(folder)
+                ]
+                last_use = get_last_use(os.path.join(checkout_dir, env_name), folders)
+                if last_use < deadline:
+                    for folder in folders:
+                        selected.append(("unused", folder, last_use))
+
+        cache = DiskUsageCache()
+        sizes = measure_trees([path for _, path, _ in selected], jobs, cache)
+        cache.save()
+        echo_table(
+            ["Kind", "Path", "Size", "Last used"],
+            [
+                [
+                    kind,
+                    path,
+                    format_size(sizes.get(path, 0)),
+                    format_age(last_use) if last_use else "-",
+                ]
+                for kind, path, last_use in selected
+            ],
+        )
+        total = sum(sizes.values())
+        click.echo("\n{} in {} folders".format(format_size(total), len(selected)))
+        for folder in dangling:
+            click.echo(
+                "{} points to {}, which does not exist anymore".format(
+                    folder, os.readlink(folder)
+                )
+            )
+
+        if not reclaim or not selected:
+            return
+        if not force and not click.confirm(
+            "Move the folders listed above to the trash?", default=False
+        ):
+            click.echo("Nothing happened")
+            return
+        trash_dirs = set()
+        for kind, path, _ in selected:
+            if kind == "orphaned":
+                click.echo("Deleting {}".format(path))
+                trash_dir = move_to_trash(path)
+                if trash_dir is not None:
+                    trash_dirs.add(trash_dir)
+            else:
+                clean_folder(path, trash_dirs)
+        start_reclaim(trash_dirs)
+        click.echo("Reclaiming {} in the background".format(format_size(total)))
@@ -0,0 +1,272 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that tunes the git configuration of all repositories and runs their maintenance"""
+import concurrent.futures
+import os
+import subprocess
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.git_metadata_helpers import (
+    UnsupportedRepository,
+    read_alternates,
+    resolve_git_dirs,
+)
+from robot_folders.helpers.job_helpers import echo_table, format_size
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.repository_helpers import (
+    collect_repositories,
+    find_environment_repositories,
+)
+
+# Settings speeding up status and checkouts of large repositories
+TUNED_CONFIG = {
+    "core.untrackedCache": "true",
+    "feature.manyFiles": "true",
+    "core.commitGraph": "true",
+    "fetch.writeCommitGraph": "true",
+}
+
+
+def has_builtin_fsmonitor():
+    """Checks whether git supports the builtin file system monitor on this platform"""
+    process = subprocess.run(
+        ["git", "fsmonitor--daemon", "status"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+    )
+    return "not supported" not in process.stdout and "not a git command" not in (
+        process.stdout
+    )
+
+
+def get_borrowed_object_dirs():
+    """Returns the object directories other repositories of any environment borrow objects
+    from, e.g. the sources of shared copies. Pruning them would corrupt the borrowers.
+    """
+    borrowed = set()
+    for repo_path in collect_repositories(dir_helpers.list_environments()):
+        try:
+            _, common_dir = resolve_git_dirs(repo_path)
+        except UnsupportedRepository:
+            continue
+        borrowed.update(read_alternates(common_dir))
+    return borrowed
+
+
+def tune_repository(repo_path, fsmonitor=False, repack=True, prune=True):
+    """
+    Applies the TUNED_CONFIG to a repository, repacks it and writes its commit-graph and
+    multi-pack-index. Unreachable objects are only pruned if prune is set. Returns the size
+    of the object database before and after.
+    """
+    _, common_dir = resolve_git_dirs(repo_path)
+    objects_dir = os.path.join(common_dir, "objects")
+    size_before = dir_helpers.get_directory_size(objects_dir)
+
+    config = dict(TUNED_CONFIG)
+    if fsmonitor:
+        config["core.fsmonitor"] = "true"
+    for key, value in config.items():
+        subprocess.check_call(["git", "config", key, value], cwd=repo_path)
+
+    commands = list()
+    if repack:
+        commands.append(["git", "gc", "--quiet"] + ([] if prune else ["--no-prune"]))
+    commands.append(["git", "commit-graph", "write", "--reachable", "--changed-paths"])
+    for command in commands:
+        subprocess.check_call(command, cwd=repo_path, stdout=subprocess.DEVNULL)
+    pack_dir = os.path.join(objects_dir, "pack")
+    # Repositories borrowing all of their objects, e.g. shared copies, have no packs to index
+    if os.path.isdir(pack_dir) and any(
+        name.endswith(".pack") for name in os.listdir(pack_dir)
+    ):
+        subprocess.check_call(
+            ["git", "multi-pack-index", "write"],
+            cwd=repo_path,
+            stdout=subprocess.DEVNULL,
+        )
+    return size_before, dir_helpers.get_directory_size(objects_dir)
+
+
+def schedule_maintenance(repo_paths):
+    """Registers the repositories for git's background maintenance and makes sure it is
+    scheduled"""
+    # Registering writes the global git config, which must not be done in parallel
+    for repo_path in repo_paths[1:]:
+        subprocess.check_call(["git", "maintenance", "register"], cwd=repo_path)
+    # Registers the first repository and sets up the scheduler (cron or systemd timers)
+    returncode = subprocess.call(["git", "maintenance", "start"], cwd=repo_paths[0])
+    if returncode != 0:
+        subprocess.check_call(["git", "maintenance", "register"], cwd=repo_paths[0])
+        click.echo(
+            "Registered the repositories for maintenance, but scheduling it failed. "
+            "Run 'git maintenance start' inside one of them to try again."
+        )
+    else:
+        click.echo(
+            "Scheduled background maintenance of {} repositories".format(
+                len(repo_paths)
+            )
+        )
+
+
+@click.command("git_tune", short_help="Speed up git in all repositories")
+@click.option(
+    "--fsmonitor",
+    is_flag=True,
+    default=False,
+    help=(
+        "Also enable git's builtin file system monitor. "
+        "Ignored on platforms where git does not support it."
+    ),
+)
+@click.option(
+    "--no_repack",
+    is_flag=True,
+    default=False,
+    help="Do not repack the repositories, only update their config and indices.",
+)
+@click.option(
+    "--schedule/--no_schedule",
+    default=True,
+    help="Register the repositories for git's background maintenance (the default).",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of repositories tuned in parallel. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+@click.argument("env_names", nargs=-1)
+def cli(fsmonitor, no_repack, schedule, jobs, env_names):
+    """Tunes all repositories of the given environments (all environments if none are
+    given) for large working trees: Enables the untracked cache, the many files feature
+    and commit-graphs, repacks the repositories and writes their commit-graph and
+    multi-pack-index. Afterwards the repositories are registered for git's background
+    maintenance, which keeps them in shape using a scheduler like cron or systemd.
+
+    Repositories whose objects are borrowed by other repositories, e.g. the sources of
+    shared copies, are repacked without pruning and are not registered for maintenance.
+    Each environment is locked while its repositories are tuned.
+    """
+    if env_names:
+        unknown = set(env_names) - set(dir_helpers.list_environments())
+        if unknown:
+            raise ModuleException(
+                "Unknown environment(s): {}".format(", ".join(sorted(unknown))),
+                "git_tune",
+            )
+    else:
+        env_names = dir_helpers.list_environments()
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    if fsmonitor and not has_builtin_fsmonitor():
+        click.echo("git does not support a builtin fsmonitor on this platform")
+        fsmonitor = False
+
+    borrowed = get_borrowed_object_dirs()
+    results = dict()
+    failed = dict()
+    # Linked worktrees share their object database, so each one is only tuned once
+    tuned_dirs = set()
+    shared_repos = set()
+    for env_name in env_names:
+        env_dir = os.path.join(dir_helpers.get_checkout_dir(), env_name)
+        # Repacking must not race other operations on the environment's repositories
+        with EnvironmentLock(env_name):
+            repo_paths = list()
+            for _, _, repo_path in find_environment_repositories(env_dir):
+                try:
+                    _, common_dir = resolve_git_dirs(repo_path)
+                except UnsupportedRepository:
+                    click.echo("Skipping {}".format(repo_path))
+                    continue
+                common_dir = os.path.realpath(common_dir)
+                if common_dir in tuned_dirs:
+                    continue
+                tuned_dirs.add(common_dir)
+                if os.path.join(common_dir, "objects") in borrowed:
+                    shared_repos.add(repo_path)
+                repo_paths.append(repo_path)
+
+            click.echo("Tuning {} repositories of {}".format(len(repo_paths), env_name))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    executor.submit(
+                        tune_repository,
+                        repo_path,
+                        fsmonitor,
+                        not no_repack,
+                        repo_path not in shared_repos,
+                    ): repo_path
+                    for repo_path in repo_paths
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        results[futures[future]] = future.result()
+                    except subprocess.CalledProcessError as err:
+                        failed[futures[future]] = err
+
+    for repo_path in sorted(shared_repos):
+        click.echo(
+            "Other repositories borrow the objects of {}, so it has not been pruned and "
+            "is not registered for maintenance".format(repo_path)
+        )
+    maintained = sorted(set(results) - shared_repos)
+    if schedule and maintained:
+        schedule_maintenance(maintained)
+
+    rows = list()
+    for repo_path, (size_before, size_after) in sorted(results.items()):
+        rows.append(
+            [
+                repo_path,
+                format_size(size_before),
+                format_size(size_after),
+                format_size(size_before - size_after),
+            ]
+        )
+    echo_table(["Repository", "Before", "After", "Reclaimed"], rows)
+    click.echo(
+        "\nReclaimed {} in total".format(
+            format_size(sum(before - after for before, after in results.values()))
+        )
+    )
+    if failed:
+        raise ModuleException(
+            "Tuning the following repositories failed:\n{}".format(
+                "\n".join(
+                    "{}: {}".format(repo_path, err)
+                    for repo_path, err in sorted(failed.items())
+                )
+            ),
+            "git_tune",
+        )
@@ -25,8 +25,9 @@ import subprocess
 
 from robot_folders.helpers.workspace_chooser import WorkspaceChooser
 import robot_folders.helpers.build_helpers as build
-from robot_folders.helpers.directory_helpers import get_active_env
+from robot_folders.helpers.directory_helpers import get_active_env, mark_env_used
 from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.lock_helpers import EnvironmentLock
 
 
 class BuildChooser(WorkspaceChooser):
@@ -50,8 +51,13 @@ class BuildChooser(WorkspaceChooser):
         return self
 
     def invoke(self, ctx):
+        if get_active_env() is None:
+            super(BuildChooser, self).invoke(ctx)
+            return
         ### may raise an error.
-        super(BuildChooser, self).invoke(ctx)
+        with EnvironmentLock(get_active_env()):
+            mark_env_used(get_active_env())
+            super(BuildChooser, self).invoke(ctx)
 
 
 @click.command(
@@ -0,0 +1,119 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command to manage the local git mirror cache"""
+import os
+import subprocess
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.lock_helpers import checkout_lock
+from robot_folders.helpers.mirror_helpers import MirrorCache
+from robot_folders.helpers.ssh_helpers import SshMultiplexer
+from robot_folders.helpers.repository_helpers import (
+    find_environment_repositories,
+    get_remote_urls,
+)
+
+
+def get_environment_uris(env_names):
+    """Collects the remote URIs of all repositories inside the given environments"""
+    uris = set()
+    for env_name in env_names:
+        env_dir = os.path.join(dir_helpers.get_checkout_dir(), env_name)
+        for _, _, repo_path in find_environment_repositories(env_dir):
+            uris.update(get_remote_urls(repo_path))
+    return uris
+
+
+@click.group("mirrors", short_help="Manage the local git mirror cache")
+def cli():
+    """Manages the cache of bare git mirrors that is used for cloning repositories when
+    mirrors are enabled. Mirrors are shared between all environments, so a repository
+    used in many environments only has to be downloaded once."""
+
+
+@cli.command("list", short_help="List all mirrors")
+def list_mirrors():
+    """Lists all mirrors in the cache together with their remote URIs."""
+    cache = MirrorCache()
+    for path, uri in cache.list_mirrors().items():
+        click.echo("{}: {}".format(uri, path))
+    click.echo("Mirror cache location: {}".format(cache.mirror_dir))
+
+
+@cli.command("update", short_help="Fetch all mirrors")
+@click.argument("env_names", nargs=-1)
+def update(env_names):
+    """Updates all existing mirrors with one fetch each. If environment names are given,
+    mirrors for all repositories of these environments are created or updated instead.
+    """
+    cache = MirrorCache()
+    with SshMultiplexer():
+        failed = update_mirrors(cache, env_names)
+    if failed:
+        raise ModuleException(
+            "Updating the following mirrors failed:\n{}".format("\n".join(failed)),
+            "mirrors",
+        )
+
+
+def update_mirrors(cache, env_names):
+    """Updates the mirrors of the given environments or all mirrors if no environments are
+    given and returns the URIs of the mirrors that failed to update"""
+    if env_names:
+        unknown = set(env_names) - set(dir_helpers.list_environments())
+        if unknown:
+            raise ModuleException(
+                "Unknown environment(s): {}".format(", ".join(sorted(unknown))),
+                "mirrors",
+            )
+        failed = list()
+        for uri in sorted(get_environment_uris(env_names)):
+            try:
+                cache.update(uri)
+            except subprocess.CalledProcessError:
+                click.echo("Failed to update mirror of {}".format(uri))
+                failed.append(uri)
+    else:
+        failed = cache.update_all()
+    return failed
+
+
+@cli.command("gc", short_help="Remove unused mirrors")
+@click.option(
+    "--keep_unused",
+    is_flag=True,
+    default=False,
+    help="Do not remove mirrors that are not used by any environment, only compact them.",
+)
+def gc(keep_unused):
+    """Removes all mirrors that are not referenced by any repository in any environment
+    and compacts the remaining ones."""
+    used_uris = None
+    # Keep environments from being changed while looking for used mirrors
+    with checkout_lock():
+        if not keep_unused:
+            used_uris = get_environment_uris(dir_helpers.list_environments())
+        removed = MirrorCache().gc(used_uris)
+    click.echo("Removed {} unused mirror(s)".format(len(removed)))
@@ -0,0 +1,133 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that fetches the repositories of all environments, e.g. from a timer"""
+import concurrent.futures
+import random
+import subprocess
+import time
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.repository_helpers import collect_repositories
+from robot_folders.helpers.ssh_helpers import SshMultiplexer, get_batch_environment
+
+# Seconds to wait before retrying a failed fetch. The delay doubles with every retry.
+RETRY_DELAY = 5.0
+
+
+def fetch_repository(repo_path, retries=2):
+    """
+    Fetches all remotes of the repository at repo_path, retrying with an exponential backoff.
+    Returns None on success or the error message of the last attempt.
+    """
+    for attempt in range(retries + 1):
+        if attempt:
+            # Randomize the delay, so retries of many repositories are spread out
+            time.sleep(RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(1.0, 1.5))
+        process = subprocess.run(
+            ["git", "fetch", "--all", "--quiet"],
+            cwd=repo_path,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            env=get_batch_environment(),
+        )
+        if process.returncode == 0:
+            return None
+    return process.stderr.strip() or "git fetch exited with {}".format(
+        process.returncode
+    )
+
+
+@click.command("prefetch", short_help="Fetch the repositories of all environments")
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of repositories fetched in parallel. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+@click.option(
+    "--retries",
+    type=click.IntRange(min=0),
+    default=2,
+    show_default=True,
+    help="How often a failed fetch is retried, waiting longer after each attempt.",
+)
+@click.argument("env_names", nargs=-1)
+def cli(env_names, jobs, retries):
+    """Fetches all remotes of every repository in the given environments (all environments
+    if none are given). Only remote-tracking branches and tags are updated, so local branches
+    and working trees stay untouched, while later checkouts and merges of upstream changes
+    do not need to access the network anymore.
+
+    Git never asks for credentials, which makes this command suitable for running from cron
+    or a systemd timer.
+    """
+    if env_names:
+        unknown = set(env_names) - set(dir_helpers.list_environments())
+        if unknown:
+            raise ModuleException(
+                "Unknown environment(s): {}".format(", ".join(sorted(unknown))),
+                "prefetch",
+            )
+    else:
+        env_names = dir_helpers.list_environments()
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+
+    repos = collect_repositories(env_names)
+    click.echo(
+        "Fetching {} repositories using up to {} parallel jobs".format(len(repos), jobs)
+    )
+    failed = dict()
+    with SshMultiplexer(batch=True), concurrent.futures.ThreadPoolExecutor(
+        max_workers=jobs
+    ) as executor:
+        futures = {
+            executor.submit(fetch_repository, repo_path, retries): repo_path
+            for repo_path in repos
+        }
+        for future in concurrent.futures.as_completed(futures):
+            error = future.result()
+            if error is not None:
+                failed[futures[future]] = error
+
+    click.echo(
+        "Fetched {} of {} repositories".format(len(repos) - len(failed), len(repos))
+    )
+    if failed:
+        raise ModuleException(
+            "Fetching the following repositories failed:\n{}".format(
+                "\n".join(
+                    "{}: {}".format(repo_path, error)
+                    for repo_path, error in sorted(failed.items())
+                )
+            ),
+            "prefetch",
+        )
@@ -25,107 +25,48 @@ import click
 
 from yaml import safe_dump as yaml_safe_dump
 
-from robot_folders.helpers.directory_helpers import (
-    get_checkout_dir,
-    get_catkin_dir,
-    get_colcon_dir,
-    list_environments,
-)
-from robot_folders.helpers.repository_helpers import create_rosinstall_entry
+from robot_folders.helpers.cache_helpers import ScrapeCache
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.scrape_helpers import EnvironmentScraper, scrape_all
 
 
-class EnvironmentScraper(click.Command):
+class ScrapeCommand(click.Command):
     """Class that implements the command"""
 
-    def __init__(self, name=None, **attrs):
-        click.Command.__init__(self, name, **attrs)
-
-        self.use_commit_id = False
-
     def invoke(self, ctx):
-        env_dir = os.path.join(get_checkout_dir(), self.name)
-        misc_ws_pkg_dir = os.path.join(env_dir, "misc_ws")
-        catkin_dir = get_catkin_dir(env_dir)
-        catkin_src_dir = os.path.join(catkin_dir, "src")
-        colcon_dir = get_colcon_dir(env_dir)
-        colcon_src_dir = os.path.join(colcon_dir, "src")
-        demos_dir = os.path.join(env_dir, "demos")
-
-        self.use_commit_id = ctx.parent.params["use_commit_id"]
-
-        yaml_data = dict()
-
-        if os.path.isdir(misc_ws_pkg_dir):
-            click.echo("Scraping misc_ws_dir")
-            yaml_data["misc_ws"] = dict()
-            yaml_data["misc_ws"]["rosinstall"] = self.parse_folder(misc_ws_pkg_dir)
-
-        if os.path.isdir(catkin_src_dir):
-            click.echo("Scraping catkin workspace")
-            yaml_data["catkin_workspace"] = dict()
-            yaml_data["catkin_workspace"]["rosinstall"] = self.parse_folder(
-                catkin_src_dir
-            )
-
-        if os.path.isdir(colcon_src_dir):
-            click.echo("Scraping colcon workspace")
-            yaml_data["colcon_workspace"] = dict()
-            yaml_data["colcon_workspace"]["rosinstall"] = self.parse_folder(
-                colcon_src_dir
-            )
-
-        if os.path.isdir(demos_dir):
-            yaml_data["demos"] = dict()
-            script_list = [
-                script_file
-                for script_file in os.listdir(demos_dir)
-                if os.path.isfile(os.path.join(demos_dir, script_file))
-                and os.access(os.path.join(demos_dir, script_file), os.X_OK)
-            ]
-            for script in script_list:
-                script_path = os.path.join(demos_dir, script)
-                with open(script_path, "r") as filecontent:
-                    # content = f.read()
-                    yaml_data["demos"][script] = filecontent.read()
-                    filecontent.close()
+        with EnvironmentLock(self.name, shared=True):
+            self.scrape(ctx)
+
+    def scrape(self, ctx):
+        """Scrapes the environment while holding a shared lock on it"""
+        scraper = EnvironmentScraper(
+            ctx.parent.params["use_commit_id"],
+            ctx.parent.params["nested_repositories"],
+            ScrapeCache(),
+        )
+        yaml_data = scraper.get_config(
+            os.path.join(dir_helpers.get_checkout_dir(), self.name)
+        )
+        scraper.cache.save()
 
         yaml_stream = open(ctx.params["out_file"], "w")
         yaml_safe_dump(
             yaml_data, stream=yaml_stream, encoding="utf-8", allow_unicode=True
         )
 
-    def parse_folder(self, folder):
-        """Recursively parse subfolders"""
-        repos = list()
-        files = os.walk(folder)
-        for elem in files:
-            try:
-                subfolder = elem[0]
-            except UnicodeDecodeError:
-                click.echo("Unicode parsing error within folder {}".format(folder))
-                continue
-            subfolder_abs = os.path.join(folder, subfolder)
-            git_dir = os.path.join(subfolder_abs, ".git")
-            local_name = os.path.relpath(subfolder, folder)
-            if os.path.isdir(git_dir):
-                click.echo(local_name)
-                entry = create_rosinstall_entry(
-                    subfolder_abs, local_name, self.use_commit_id
-                )
-                repos.append(entry)
-        return sorted(repos, key=lambda k: k["git"]["local-name"])
-
 
 class EnvironmentChooser(click.MultiCommand):
     """Select the requested environment"""
 
     def list_commands(self, ctx):
-        return list_environments()
+        return dir_helpers.list_environments()
 
     def get_command(self, ctx, name):
         # return empty command with the correct name
-        if name in list_environments():
-            cmd = EnvironmentScraper(
+        if name in dir_helpers.list_environments():
+            cmd = ScrapeCommand(
                 name=name, params=[click.Argument(param_decls=["out_file"])]
             )
             return cmd
@@ -146,14 +87,55 @@ class EnvironmentChooser(click.MultiCommand):
     default=False,
     help="If checked, the exact commit IDs get scraped instead of branch names.",
 )
+@click.option(
+    "--nested_repositories",
+    is_flag=True,
+    default=False,
+    help="Also look for repositories inside other repositories (excluding submodules).",
+)
+@click.option(
+    "--all",
+    "all_out",
+    type=click.Path(),
+    default=None,
+    metavar="OUT",
+    help=(
+        "Scrape all environments in parallel. If OUT ends with .yaml, all configs are "
+        "written into this file keyed by environment name, otherwise one file per "
+        "environment is written into the directory OUT."
+    ),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of environments scraped in parallel with --all. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
 @click.pass_context
-def cli(ctx, use_commit_id):
+def cli(ctx, use_commit_id, nested_repositories, all_out, jobs):
     """Scrapes an environment configuration into a config file,
        so that it can be given to somebody else. \
        This config file can then be used to initialize the environment
        in another robot_folders configuration.
        """
-    if ctx.invoked_subcommand is None:
+    if all_out is not None:
+        if ctx.invoked_subcommand is not None:
+            raise ModuleException(
+                "--all cannot be combined with an environment name", "scrape"
+            )
+        errors = scrape_all(all_out, use_commit_id, nested_repositories, jobs)
+        if errors:
+            raise ModuleException(
+                "Scraping the following environments failed: {}".format(
+                    ", ".join(sorted(errors))
+                ),
+                "scrape",
+            )
+    elif ctx.invoked_subcommand is None:
         click.echo(
             "No environment specified. Please choose one "
             "of the available environments!"
@@ -0,0 +1,178 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that shows the state of all repositories of an environment"""
+import concurrent.futures
+import os
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.cache_helpers import ScrapeCache
+from robot_folders.helpers.ConfigParser import ConfigFileParser
+from robot_folders.helpers.job_helpers import echo_table
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.repository_helpers import (
+    find_environment_repositories,
+    get_repository_status,
+    is_commit_id,
+    resolve_version,
+)
+
+# Methods of the ConfigFileParser returning the rosinstall of each workspace
+WORKSPACE_PARSERS = {
+    "misc": "parse_misc_ws_config",
+    "ros": "parse_ros_config",
+    "colcon": "parse_ros2_config",
+}
+
+
+def read_config_versions(config_file):
+    """Returns a dict mapping tuples of the workspace key and the local name of every
+    repository in config_file to its version"""
+    parser = ConfigFileParser(config_file)
+    versions = dict()
+    for key, parser_method in WORKSPACE_PARSERS.items():
+        has_workspace, rosinstall = getattr(parser, parser_method)()
+        if not has_workspace or not rosinstall:
+            continue
+        for repo in rosinstall:
+            entry = repo.get("git", dict())
+            if "local-name" in entry:
+                versions[(key, entry["local-name"])] = entry.get("version")
+    return versions
+
+
+def compare_version(repo_path, status, version):
+    """Compares the state of a repository with the version given in a config. Returns
+    'same', 'differs' or '-' if no version is known."""
+    if version is None:
+        return "-"
+    if is_commit_id(version):
+        same = status["commit"] is not None and status["commit"].startswith(version)
+    elif version == status["branch"]:
+        same = True
+    else:
+        same = resolve_version(repo_path, version) == status["commit"]
+    return "same" if same else "differs"
+
+
+def format_changes(status):
+    """Formats the number of changed and untracked files"""
+    changes = list()
+    if status["changed"]:
+        changes.append("{} changed".format(status["changed"]))
+    if status["untracked"]:
+        changes.append("{} untracked".format(status["untracked"]))
+    return ", ".join(changes) or "clean"
+
+
+def format_upstream(status):
+    """Formats the number of commits ahead and behind the upstream branch"""
+    if status["ahead"] is None:
+        return "-"
+    if not status["ahead"] and not status["behind"]:
+        return "up to date"
+    return "+{} -{}".format(status["ahead"], status["behind"])
+
+
+@click.command("status", short_help="Show the state of all repositories")
+@click.option(
+    "--config",
+    "config_file",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help=(
+        "Config file to compare the checked out versions with. "
+        "Defaults to the versions recorded by the last scrape of each repository."
+    ),
+)
+@click.option(
+    "--no_untracked",
+    is_flag=True,
+    default=False,
+    help="Do not look for untracked files, which is faster for large repositories.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of repositories queried in parallel. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+@click.argument("env_name", required=False)
+def cli(config_file, no_untracked, jobs, env_name):
+    """Shows the checked out branch, uncommitted changes, commits ahead and behind the
+    upstream branch and whether the checked out commit differs from the config for every
+    repository of ENV_NAME (the active environment if not given).
+    """
+    env_dir = dir_helpers.get_env_dir(env_name)
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    config_versions = None
+    if config_file is not None:
+        config_versions = read_config_versions(config_file)
+    cache = ScrapeCache()
+
+    def query(repo):
+        key, local_name, repo_path = repo
+        status = get_repository_status(repo_path, untracked=not no_untracked)
+        if config_versions is not None:
+            version = config_versions.get((key, local_name))
+        else:
+            version = cache.last_version(repo_path)
+        return status, compare_version(repo_path, status, version)
+
+    with EnvironmentLock(os.path.basename(env_dir), shared=True):
+        repos = find_environment_repositories(env_dir)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(query, repos))
+
+    rows = list()
+    for (key, local_name, _), (status, config) in zip(repos, results):
+        branch = status["branch"]
+        if branch is None:
+            branch = "({})".format((status["commit"] or "no commit")[:10])
+        rows.append(
+            [
+                key,
+                local_name,
+                branch,
+                format_changes(status),
+                format_upstream(status),
+                config,
+            ]
+        )
+    echo_table(
+        ["Workspace", "Repository", "Branch", "Changes", "Upstream", "Config"], rows
+    )
+
+    dirty = [row for row in rows if row[3] != "clean"]
+    differing = [row for row in rows if row[5] == "differs"]
+    click.echo(
+        "\n{} repositories, {} with changes, {} differing from the config".format(
+            len(rows), len(dirty), len(differing)
+        )
+    )
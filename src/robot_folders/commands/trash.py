@@ -0,0 +1,118 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""Command that shows and empties the trash of deleted environments and build trees"""
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.job_helpers import echo_table, format_size
+from robot_folders.helpers.trash_helpers import (
+    empty_trash,
+    get_known_trash_dirs,
+    is_reclaiming,
+    is_trash_dir,
+    list_trash_entries,
+)
+
+
+def echo_status(trash_dirs):
+    """Prints the number of entries and the size of each trash directory"""
+    rows = list()
+    total_size = 0
+    for trash_dir in trash_dirs:
+        entries = list_trash_entries(trash_dir)
+        size = sum(dir_helpers.get_directory_size(entry) for entry in entries)
+        total_size += size
+        rows.append(
+            [
+                trash_dir,
+                len(entries),
+                format_size(size),
+                "reclaiming" if is_reclaiming(trash_dir) else "-",
+            ]
+        )
+    echo_table(["Trash", "Entries", "Size", "State"], rows)
+    click.echo("\n{} in the trash".format(format_size(total_size)))
+
+
+@click.command("trash", short_help="Show or empty the trash of deleted files")
+@click.option(
+    "--empty",
+    is_flag=True,
+    default=False,
+    help="Delete everything inside the trash instead of showing its state.",
+)
+@click.option(
+    "--status",
+    is_flag=True,
+    default=False,
+    help="Show the number of entries and the size of each trash directory (the default).",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help=(
+        "Number of directory trees deleted in parallel. "
+        "Defaults to the 'jobs' setting in the config."
+    ),
+)
+@click.argument("trash_dirs", nargs=-1, type=click.Path(file_okay=False))
+def cli(empty, status, jobs, trash_dirs):
+    """Deleting an environment or cleaning a workspace only renames the deleted folders into
+    a trash directory on the same filesystem and deletes them in a background process. This
+    command shows the state of the trash directories (all known ones if TRASH_DIRS are not
+    given) or empties them in the foreground, e.g. if the background process has been
+    interrupted. Only directories named .rob_folders_trash or known as trash directories are
+    accepted.
+    """
+    if empty and status:
+        raise ModuleException(
+            "The options --empty and --status cannot be combined", "trash"
+        )
+    unknown = [trash_dir for trash_dir in trash_dirs if not is_trash_dir(trash_dir)]
+    if unknown:
+        raise ModuleException(
+            "Not a trash directory of robot_folders: {}".format(", ".join(unknown)),
+            "trash",
+        )
+    trash_dirs = list(trash_dirs) or get_known_trash_dirs()
+    if not empty:
+        echo_status(trash_dirs)
+        return
+
+    failed = list()
+    for trash_dir in trash_dirs:
+        result = empty_trash(trash_dir, jobs)
+        if result is None:
+            click.echo("{} is being emptied by another process".format(trash_dir))
+            continue
+        deleted, failed_entries = result
+        if deleted:
+            click.echo("Deleted {} entries from {}".format(deleted, trash_dir))
+        failed.extend(failed_entries)
+    if failed:
+        raise ModuleException(
+            "The following entries could not be deleted:\n{}".format("\n".join(failed)),
+            "trash",
+        )
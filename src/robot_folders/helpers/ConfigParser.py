@@ -20,19 +20,170 @@
 # THE SOFTWARE.
 #
 """This module help parsing environment config files"""
+import os
+
 import click
 
 import yaml
 
+# Top level sections of a config file. All of them except demos may contain a rosinstall.
+WORKSPACE_SECTIONS = ["misc_ws", "catkin_workspace", "colcon_workspace"]
+CONFIG_SECTIONS = WORKSPACE_SECTIONS + ["demos"]
+
+# Entries of a repository of type git
+GIT_ENTRY_KEYS = ["local-name", "uri", "version", "depth", "filter", "sparse", "bundle"]
+
+# Repository types known to vcstool
+REPOSITORY_TYPES = ["git", "hg", "svn", "bzr", "tar", "zip"]
+
+
+def normalize_rosinstall(rosinstall, config_dir=None):
+    """Brings optional per-repository entries of a rosinstall into a canonical form.
+
+    Sparse checkout paths may be given as a single string or as a list of paths relative to
+    the repository root. Bundle paths are relative to the directory of the config file.
+    """
+    if not rosinstall:
+        return rosinstall
+    for repo in rosinstall:
+        entry = repo.get("git", dict())
+        if "sparse" in entry:
+            sparse = entry["sparse"]
+            if isinstance(sparse, str):
+                sparse = [sparse]
+            entry["sparse"] = [str(path).strip("/") for path in sparse if path]
+        if "bundle" in entry and config_dir is not None:
+            entry["bundle"] = os.path.join(config_dir, entry["bundle"])
+    return rosinstall
+
 
 class ConfigFileParser(object):
     """Parser for robot_folders environment configs"""
 
     def __init__(self, config_file_name):
+        self.config_dir = os.path.dirname(os.path.abspath(config_file_name))
         with open(config_file_name, "r") as file_content:
             self.data = yaml.load(file_content, Loader=yaml.SafeLoader)
         click.echo("The following config file is passed:\n{}".format(self.data))
 
+    def validate(self):
+        """Checks the structure of the config. Returns a list of all problems found, which
+        prevent using the config, and a list of warnings about unknown sections and entries,
+        which are ignored."""
+        if not isinstance(self.data, dict):
+            return ["The config file does not contain a mapping of sections"], list()
+        problems = list()
+        warnings = list()
+        for section in self.data:
+            if section not in CONFIG_SECTIONS:
+                warnings.append(
+                    "Unknown section '{}' is ignored, expected one of {}".format(
+                        section, ", ".join(CONFIG_SECTIONS)
+                    )
+                )
+        for section in WORKSPACE_SECTIONS:
+            workspace = self.data.get(section)
+            if workspace is None:
+                continue
+            if not isinstance(workspace, dict):
+                problems.append("{}: Expected a mapping".format(section))
+                continue
+            for key in workspace:
+                if key != "rosinstall":
+                    warnings.append(
+                        "{}: Unknown entry '{}' is ignored".format(section, key)
+                    )
+            rosinstall = workspace.get("rosinstall")
+            if rosinstall is not None and not isinstance(rosinstall, list):
+                problems.append("{}: rosinstall has to be a list".format(section))
+            elif rosinstall:
+                rosinstall_problems, rosinstall_warnings = self.validate_rosinstall(
+                    rosinstall
+                )
+                problems.extend(
+                    "{}: {}".format(section, problem) for problem in rosinstall_problems
+                )
+                warnings.extend(
+                    "{}: {}".format(section, warning) for warning in rosinstall_warnings
+                )
+        demos = self.data.get("demos")
+        if demos is not None and not (
+            isinstance(demos, dict)
+            and all(isinstance(script, str) for script in demos.values())
+        ):
+            problems.append("demos: Expected a mapping of script names to scripts")
+        return problems, warnings
+
+    def validate_rosinstall(self, rosinstall):
+        """Checks the repositories of a rosinstall. Returns a list of all problems and a list of
+        all warnings found."""
+        problems = list()
+        warnings = list()
+        local_names = set()
+        for index, repo in enumerate(rosinstall):
+            if not isinstance(repo, dict) or len(repo) != 1:
+                problems.append(
+                    "Entry {} has to map exactly one repository type to its "
+                    "settings".format(index + 1)
+                )
+                continue
+            repo_type, entry = next(iter(repo.items()))
+            if repo_type not in REPOSITORY_TYPES:
+                problems.append(
+                    "Entry {} has unknown repository type '{}'".format(
+                        index + 1, repo_type
+                    )
+                )
+                continue
+            if not isinstance(entry, dict):
+                problems.append("Entry {} has no settings".format(index + 1))
+                continue
+            local_name = entry.get("local-name")
+            if not isinstance(local_name, str) or not local_name:
+                problems.append("Entry {} has no local-name".format(index + 1))
+                continue
+            name = "Repository '{}'".format(local_name)
+            normalized = os.path.normpath(local_name)
+            if os.path.isabs(local_name) or normalized.split(os.sep)[0] == "..":
+                problems.append("{}: local-name has to be a relative path".format(name))
+            if normalized in local_names:
+                problems.append("{}: local-name is used twice".format(name))
+            local_names.add(normalized)
+            if not isinstance(entry.get("uri"), str) or not entry["uri"]:
+                problems.append("{}: No uri given".format(name))
+            if repo_type != "git":
+                continue
+            for key in entry:
+                if key not in GIT_ENTRY_KEYS:
+                    warnings.append(
+                        "{}: Unknown entry '{}' is ignored".format(name, key)
+                    )
+            if "version" in entry and not isinstance(entry["version"], (str, int)):
+                problems.append("{}: version has to be a string".format(name))
+            depth = entry.get("depth")
+            if depth is not None and (
+                isinstance(depth, bool) or not isinstance(depth, int) or depth < 1
+            ):
+                problems.append("{}: depth has to be a positive number".format(name))
+            if "filter" in entry and not isinstance(entry["filter"], str):
+                problems.append("{}: filter has to be a string".format(name))
+            sparse = entry.get("sparse")
+            if sparse is not None and not (
+                isinstance(sparse, str)
+                or (
+                    isinstance(sparse, list)
+                    and all(isinstance(path, str) for path in sparse)
+                )
+            ):
+                problems.append("{}: sparse has to be a list of paths".format(name))
+            if "bundle" in entry and not os.path.isfile(
+                os.path.join(self.config_dir, str(entry["bundle"]))
+            ):
+                problems.append(
+                    "{}: Bundle {} does not exist".format(name, entry["bundle"])
+                )
+        return problems, warnings
+
     def parse_misc_ws_config(self):
         """Parses the misc_ws part of the data"""
         has_misc_ws = False
@@ -40,7 +191,9 @@ class ConfigFileParser(object):
         if "misc_ws" in self.data:
             has_misc_ws = True
             if "rosinstall" in self.data["misc_ws"]:
-                misc_ws_rosinstall = self.data["misc_ws"]["rosinstall"]
+                misc_ws_rosinstall = normalize_rosinstall(
+                    self.data["misc_ws"]["rosinstall"], self.config_dir
+                )
         return has_misc_ws, misc_ws_rosinstall
 
     def parse_ros_config(self):
@@ -50,7 +203,9 @@ class ConfigFileParser(object):
         if "catkin_workspace" in self.data:
             has_catkin = True
             if "rosinstall" in self.data["catkin_workspace"]:
-                ros_rosinstall = self.data["catkin_workspace"]["rosinstall"]
+                ros_rosinstall = normalize_rosinstall(
+                    self.data["catkin_workspace"]["rosinstall"], self.config_dir
+                )
 
         return has_catkin, ros_rosinstall
 
@@ -61,7 +216,9 @@ class ConfigFileParser(object):
         if "colcon_workspace" in self.data:
             has_colcon = True
             if "rosinstall" in self.data["colcon_workspace"]:
-                ros2_rosinstall = self.data["colcon_workspace"]["rosinstall"]
+                ros2_rosinstall = normalize_rosinstall(
+                    self.data["colcon_workspace"]["rosinstall"], self.config_dir
+                )
 
         return has_colcon, ros2_rosinstall
 
@@ -32,6 +32,7 @@ from robot_folders.helpers.directory_helpers import (
     get_colcon_dir,
 )
 from robot_folders.helpers.which import which
+from robot_folders.helpers.clone_helpers import init_lazy_submodules
 from robot_folders.helpers import compilation_db_helpers
 from robot_folders.helpers import config_helpers
 from robot_folders.helpers.exceptions import ModuleException
@@ -212,6 +213,7 @@ class ColconBuilder(Builder):
     def invoke(self, ctx):
         colcon_dir = get_colcon_dir()
         click.echo("Building colcon_ws in {}".format(colcon_dir))
+        init_lazy_submodules(os.path.join(colcon_dir, "src"))
 
         if (
             ctx is not None
@@ -325,6 +327,7 @@ class CatkinBuilder(Builder):
         catkin_dir = get_catkin_dir()
         self.build_dir = os.path.join(catkin_dir, "build")
         click.echo("Building catkin_workspace in {}".format(catkin_dir))
+        init_lazy_submodules(os.path.join(catkin_dir, "src"))
 
         # We abuse the name to code the ros distribution if we're building for the first time.
         try:
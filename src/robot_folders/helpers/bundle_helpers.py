@@ -0,0 +1,217 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module contains helpers for exporting environments into self-contained archives of git
+bundles that can be imported without network access
+"""
+import os
+import subprocess
+import tarfile
+
+import click
+
+from yaml import safe_dump as yaml_safe_dump
+
+from robot_folders.helpers.directory_helpers import get_source_dirs
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.repository_helpers import (
+    get_submodules,
+    is_shallow_repository,
+)
+from robot_folders.helpers.which import which
+
+
+BUNDLE_CONFIG_NAME = "config.yaml"
+BUNDLE_DIR_NAME = "bundles"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# Maps the workspace keys to the sections of the config file
+WORKSPACE_CONFIG_KEYS = {
+    "misc": "misc_ws",
+    "ros": "catkin_workspace",
+    "colcon": "colcon_workspace",
+}
+
+
+def get_submodule_bundle_dir(bundle_path):
+    """Returns the directory containing the bundles of a bundled repository's submodules"""
+    return bundle_path[: -len(".bundle")] + ".modules"
+
+
+def create_bundle(repo_path, bundle_path):
+    """Bundles all refs of the repository at repo_path into bundle_path. Initialized
+    submodules are bundled recursively next to it.
+
+    Returns False if the repository could not be bundled, because it is a shallow clone.
+    """
+    if is_shallow_repository(repo_path):
+        return False
+    os.makedirs(os.path.dirname(bundle_path), exist_ok=True)
+    subprocess.check_call(
+        ["git", "bundle", "create", "--quiet", bundle_path, "--all"], cwd=repo_path
+    )
+    for _, path in get_submodules(repo_path):
+        submodule_path = os.path.join(repo_path, path)
+        if os.path.exists(os.path.join(submodule_path, ".git")):
+            submodule_bundle = os.path.join(
+                get_submodule_bundle_dir(bundle_path), path + ".bundle"
+            )
+            if not create_bundle(submodule_path, submodule_bundle):
+                click.echo(
+                    "WARNING: Submodule {} is a shallow clone and cannot be bundled".format(
+                        submodule_path
+                    )
+                )
+    return True
+
+
+def init_bundled_submodules(repo_path, bundle_path):
+    """Initializes the submodules of a repository cloned from bundle_path using the bundles
+    of its submodules. Submodules that have not been bundled are left uninitialized."""
+    modules_dir = get_submodule_bundle_dir(bundle_path)
+    for name, path in get_submodules(repo_path):
+        submodule_bundle = os.path.join(modules_dir, path + ".bundle")
+        if not os.path.isfile(submodule_bundle):
+            continue
+        subprocess.check_call(
+            ["git", "submodule", "--quiet", "init", "--", path], cwd=repo_path
+        )
+        subprocess.check_call(
+            ["git", "config", "submodule.{}.url".format(name), submodule_bundle],
+            cwd=repo_path,
+        )
+        # Local bundles are not allowed as submodule sources by default
+        subprocess.check_call(
+            [
+                "git",
+                "-c",
+                "protocol.file.allow=always",
+                "submodule",
+                "--quiet",
+                "update",
+                "--",
+                path,
+            ],
+            cwd=repo_path,
+        )
+        init_bundled_submodules(os.path.join(repo_path, path), submodule_bundle)
+    if get_submodules(repo_path):
+        # Point the submodules back to the URLs from .gitmodules
+        subprocess.check_call(["git", "submodule", "--quiet", "sync"], cwd=repo_path)
+
+
+def write_bundle_dir(scraper, env_dir, bundle_dir):
+    """Writes the config of the environment inside env_dir, as created by scraper, and a
+    bundle per repository into bundle_dir. The config's rosinstall entries reference their
+    bundles relative to bundle_dir.
+    """
+    yaml_data = scraper.get_config(env_dir)
+    source_dirs = get_source_dirs(env_dir)
+    for key, config_key in WORKSPACE_CONFIG_KEYS.items():
+        if key not in source_dirs or config_key not in yaml_data:
+            continue
+        for repo in yaml_data[config_key]["rosinstall"]:
+            entry = repo["git"]
+            bundle = os.path.join(BUNDLE_DIR_NAME, key, entry["local-name"] + ".bundle")
+            click.echo("Bundling {}".format(entry["local-name"]))
+            if create_bundle(
+                os.path.join(source_dirs[key], entry["local-name"]),
+                os.path.join(bundle_dir, bundle),
+            ):
+                entry["bundle"] = bundle
+            else:
+                click.echo(
+                    "WARNING: {} is a shallow clone and cannot be bundled. It will be "
+                    "cloned from its remote when importing.".format(entry["local-name"])
+                )
+
+    with open(os.path.join(bundle_dir, BUNDLE_CONFIG_NAME), "w") as yaml_stream:
+        yaml_safe_dump(yaml_data, stream=yaml_stream, allow_unicode=True)
+
+
+def is_zstd_filename(archive_path):
+    """Checks whether an archive should be compressed using zstd judging from its name"""
+    return archive_path.endswith(".zst") or archive_path.endswith(".tzst")
+
+
+def get_zstd():
+    """Returns the path to the zstd executable"""
+    zstd = which("zstd")
+    if zstd is None:
+        raise ModuleException(
+            "zstd is not installed. Install it or use an archive name ending with .tar.gz "
+            "or .tar.xz instead.",
+            "bundle",
+        )
+    return zstd
+
+
+def write_archive(source_dir, archive_path):
+    """Packs the contents of source_dir into archive_path. The compression is chosen based on
+    the file extension: .tar.zst, .tar.gz, .tar.xz, .tar.bz2 or an uncompressed .tar."""
+    if is_zstd_filename(archive_path):
+        process = subprocess.Popen(
+            [get_zstd(), "--quiet", "--force", "-T0", "-o", archive_path],
+            stdin=subprocess.PIPE,
+        )
+        with tarfile.open(fileobj=process.stdin, mode="w|") as archive:
+            archive.add(source_dir, arcname=".")
+        process.stdin.close()
+        if process.wait() != 0:
+            raise ModuleException(
+                "Compressing {} failed".format(archive_path), "bundle"
+            )
+        return
+
+    mode = "w"
+    for extensions, compression in [
+        ((".gz", ".tgz"), "gz"),
+        ((".xz", ".txz"), "xz"),
+        ((".bz2", ".tbz2"), "bz2"),
+    ]:
+        if archive_path.endswith(extensions):
+            mode = "w:" + compression
+    with tarfile.open(archive_path, mode) as archive:
+        archive.add(source_dir, arcname=".")
+
+
+def extract_archive(archive_path, target_dir):
+    """Extracts an archive written by write_archive into target_dir"""
+    with open(archive_path, "rb") as archive_file:
+        is_zstd = archive_file.read(len(ZSTD_MAGIC)) == ZSTD_MAGIC
+    extract_args = dict()
+    if hasattr(tarfile, "data_filter"):
+        extract_args["filter"] = "data"
+
+    if is_zstd:
+        process = subprocess.Popen(
+            [get_zstd(), "--quiet", "--decompress", "--stdout", archive_path],
+            stdout=subprocess.PIPE,
+        )
+        with tarfile.open(fileobj=process.stdout, mode="r|") as archive:
+            archive.extractall(target_dir, **extract_args)
+        if process.wait() != 0:
+            raise ModuleException(
+                "Decompressing {} failed".format(archive_path), "bundle"
+            )
+    else:
+        with tarfile.open(archive_path, "r:*") as archive:
+            archive.extractall(target_dir, **extract_args)
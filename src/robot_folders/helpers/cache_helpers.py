@@ -0,0 +1,210 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module implements caches of expensive results that are stored in the user's cache directory
+and invalidated by a signature of the files the results were computed from.
+"""
+import json
+import os
+import threading
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.git_metadata_helpers import (
+    UnsupportedRepository,
+    resolve_git_dirs,
+)
+from robot_folders.helpers.lock_helpers import FileLock, get_lock_timeout
+from robot_folders.helpers.repository_helpers import create_rosinstall_entry
+
+
+def get_cache_dir():
+    """Returns the directory robot_folders stores its caches in"""
+    cache_home = os.getenv(
+        "XDG_CACHE_HOME", os.path.expandvars(os.path.join("$HOME", ".cache"))
+    )
+    return os.path.join(cache_home, "robot_folders")
+
+
+def get_file_signature(paths):
+    """Returns a list of the modification time and size of each of the given files. Files
+    that do not exist are represented by None."""
+    signature = list()
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+            signature.append([stat_result.st_mtime_ns, stat_result.st_size])
+        except OSError:
+            signature.append(None)
+    return signature
+
+
+class JsonCache(object):
+    """A cache mapping keys to results that are valid as long as their signature does not
+    change. The cache is loaded from and saved to a json file and can be used from multiple
+    threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = self.load()
+        self.changed = dict()
+        self.removed = set()
+        self.mutex = threading.Lock()
+
+    def load(self):
+        """Returns the entries stored in the cache file"""
+        try:
+            with open(self.path) as cache_file:
+                entries = json.load(cache_file)
+        except (IOError, ValueError):
+            return dict()
+        return entries if isinstance(entries, dict) else dict()
+
+    def get(self, key, signature):
+        """Returns the cached result for key or None if there is none with the given
+        signature"""
+        with self.mutex:
+            entry = self.entries.get(key)
+        if entry is not None and entry["signature"] == signature:
+            return entry["value"]
+        return None
+
+    def set(self, key, signature, value):
+        """Stores the result for key together with its signature"""
+        entry = {"signature": signature, "value": value}
+        with self.mutex:
+            self.entries[key] = entry
+            self.changed[key] = entry
+            self.removed.discard(key)
+
+    def keys(self):
+        """Returns the keys of all entries"""
+        with self.mutex:
+            return list(self.entries)
+
+    def remove(self, key):
+        """Removes the entry for key"""
+        with self.mutex:
+            self.entries.pop(key, None)
+            self.changed.pop(key, None)
+            self.removed.add(key)
+
+    def save(self):
+        """Writes all changed and removed entries to the cache file, keeping the entries
+        written by other processes in the meantime"""
+        with self.mutex:
+            if not self.changed and not self.removed:
+                return
+            dir_helpers.mkdir_p(os.path.dirname(self.path))
+            with FileLock(self.path + ".lock", timeout=get_lock_timeout()):
+                entries = self.load()
+                entries.update(self.changed)
+                for key in self.removed:
+                    entries.pop(key, None)
+                dir_helpers.atomic_write(self.path, json.dumps(entries))
+            self.entries = entries
+            self.changed = dict()
+            self.removed = set()
+
+
+class ScrapeCache(JsonCache):
+    """Caches the rosinstall entries of repositories. An entry is valid as long as HEAD, the
+    ref it points to, the refs and the config of the repository are unchanged."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(get_cache_dir(), "scrape_cache.json")
+        JsonCache.__init__(self, path)
+
+    @staticmethod
+    def get_key(repo_path, use_commit_id):
+        """Returns the key of a repository's entry"""
+        return "{}:{}".format(os.path.realpath(repo_path), use_commit_id)
+
+    @staticmethod
+    def get_last_scrape_key(repo_path):
+        """Returns the key of the record of a repository's last scraped version"""
+        return "{}:last".format(os.path.realpath(repo_path))
+
+    def record_scrape(self, repo_path, version):
+        """Records the version a repository has been scraped with last"""
+        key = self.get_last_scrape_key(repo_path)
+        with self.mutex:
+            entry = self.entries.get(key)
+        if entry is None or entry["value"] != version:
+            self.set(key, None, version)
+
+    def last_version(self, repo_path):
+        """Returns the version of a repository recorded by the last scrape, no matter whether
+        it used commit ids or branch names. Returns None if it has never been scraped.
+        """
+        return self.get(self.get_last_scrape_key(repo_path), None)
+
+    @staticmethod
+    def get_signature(repo_path):
+        """Returns the signature of the files a rosinstall entry is read from or None if the
+        repository cannot be read from its files"""
+        try:
+            git_dir, common_dir = resolve_git_dirs(repo_path)
+            with open(os.path.join(git_dir, "HEAD")) as head_file:
+                head = head_file.read().strip()
+        except (UnsupportedRepository, IOError):
+            return None
+        paths = [
+            os.path.join(common_dir, "config"),
+            os.path.join(git_dir, "config.worktree"),
+            os.path.join(common_dir, "packed-refs"),
+            os.path.join(git_dir, "info", "sparse-checkout"),
+        ]
+        if head.startswith("ref: "):
+            paths.append(os.path.join(common_dir, head[len("ref: ") :]))
+        return [head] + get_file_signature(paths)
+
+    def rosinstall_entry(self, repo_path, local_name, use_commit_id=False):
+        """Returns the rosinstall entry of a repository (see create_rosinstall_entry),
+        inspecting the repository only if it changed since its entry was cached"""
+        key = self.get_key(repo_path, use_commit_id)
+        # The signature is taken first, so changes during the inspection invalidate the entry
+        signature = self.get_signature(repo_path)
+        if signature is not None:
+            entry = self.get(key, signature)
+            if entry is not None:
+                entry = dict(entry)
+                entry["local-name"] = local_name
+                self.record_scrape(repo_path, entry.get("version"))
+                return {"git": entry}
+        repo = create_rosinstall_entry(repo_path, local_name, use_commit_id)
+        if signature is not None:
+            self.set(key, signature, dict(repo["git"]))
+        self.record_scrape(repo_path, repo["git"].get("version"))
+        return repo
+
+
+class DiskUsageCache(JsonCache):
+    """Caches the size of the files directly inside a directory together with its
+    subdirectories. An entry is valid as long as the modification time of the directory is
+    unchanged, which changes whenever entries are added, removed or renamed. Files growing
+    in place are not noticed."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(get_cache_dir(), "disk_usage_cache.json")
+        JsonCache.__init__(self, path)
@@ -21,7 +21,6 @@
 #
 """Module that helps cleaning workspaces"""
 import os
-import shutil
 import click
 
 from robot_folders.helpers.directory_helpers import (
@@ -32,10 +31,19 @@ from robot_folders.helpers.directory_helpers import (
 )
 from robot_folders.helpers.which import which
 from robot_folders.helpers import config_helpers
-
-
-def clean_folder(folder):
-    """Deletes everything inside a given folder. The folder itself is not deleted."""
+from robot_folders.helpers.option_helpers import MultipleValuesOption
+from robot_folders.helpers.package_helpers import select_packages
+from robot_folders.helpers.trash_helpers import move_to_trash, start_reclaim
+
+
+def clean_folder(folder, trash_dirs=None):
+    """Deletes everything inside a given folder. The folder itself is not deleted.
+    Subfolders are moved into the trash and the trash directories used are added to
+    trash_dirs. If trash_dirs is not given, the trash is reclaimed in the background right
+    away."""
+    reclaim = trash_dirs is None
+    if reclaim:
+        trash_dirs = set()
     click.echo("Cleaning everything in {}".format(folder))
     if os.path.isdir(folder):
         for the_file in os.listdir(folder):
@@ -48,16 +56,22 @@ def clean_folder(folder):
                 os.unlink(file_path)
             elif os.path.isdir(file_path):
                 click.echo("Deleting folder {}".format(file_path))
-                shutil.rmtree(file_path)
+                trash_dir = move_to_trash(file_path)
+                if trash_dir is not None:
+                    trash_dirs.add(trash_dir)
     else:
         click.echo('Skipping non-existing folder "{}"'.format(folder))
+    if reclaim:
+        start_reclaim(trash_dirs)
 
 
-def confirm_deletion(delete_list):
-    """Requests a confirmation from the user that the mentioned paths should be deleted"""
+def confirm_deletion(delete_list, inside=True):
+    """Requests a confirmation from the user that the mentioned paths should be deleted. If
+    inside is set, the files inside the paths are deleted, otherwise the paths themselves.
+    """
     click.echo(
-        "Going to delete all files inside the following paths:\n{}".format(
-            "\n".join(delete_list)
+        "Going to delete {}the following paths:\n{}".format(
+            "all files inside " if inside else "", "\n".join(delete_list)
         )
     )
 
@@ -74,14 +88,75 @@ def confirm_deletion(delete_list):
 class Cleaner(click.Command):
     """General cleaner class"""
 
-    # Dummy variable to satisfy the linter
-    clean_list = list()
+    def __init__(self, *args, **kwargs):
+        params = [
+            MultipleValuesOption(
+                ["--packages"],
+                help="Only delete the build and install files of the given packages.",
+            ),
+            MultipleValuesOption(
+                ["--packages-above", "packages_above"],
+                help=(
+                    "Only delete the build and install files of the given packages and all "
+                    "packages recursively depending on them."
+                ),
+            ),
+        ]
+
+        if "params" in kwargs and kwargs["params"]:
+            kwargs["params"].extend(params)
+        else:
+            kwargs["params"] = params
+        super().__init__(*args, **kwargs)
+        self.clean_list = list()
 
     def clean(self):
         """General clean function"""
         if confirm_deletion(self.clean_list):
+            trash_dirs = set()
             for folder in self.clean_list:
-                clean_folder(folder)
+                clean_folder(folder, trash_dirs)
+            start_reclaim(trash_dirs)
+        else:
+            click.echo("Cleaning not confirmed. Aborting now")
+        click.echo("")
+
+    @staticmethod
+    def get_selected_packages(ctx, workspace_dir):
+        """Returns the packages selected using --packages and --packages-above or None if
+        the whole workspace should be cleaned"""
+        if ctx is None:
+            return None
+        names = ctx.params.get("packages") or ()
+        names_above = ctx.params.get("packages_above") or ()
+        if not names and not names_above:
+            return None
+        return select_packages(os.path.join(workspace_dir, "src"), names, names_above)
+
+    def get_package_paths(self, workspace_dir, package):
+        """Returns the build and install paths of a package that may exist"""
+        raise NotImplementedError()
+
+    def clean_packages(self, workspace_dir, packages):
+        """Deletes the build and install paths of the given packages"""
+        click.echo("Cleaning the packages {}".format(", ".join(packages)))
+        delete_list = [
+            path
+            for package in packages
+            for path in self.get_package_paths(workspace_dir, package)
+            if os.path.lexists(path)
+        ]
+        if not delete_list:
+            click.echo("Nothing to clean\n")
+            return
+        if confirm_deletion(delete_list, inside=False):
+            trash_dirs = set()
+            for path in delete_list:
+                click.echo("Deleting {}".format(path))
+                trash_dir = move_to_trash(path)
+                if trash_dir is not None:
+                    trash_dirs.add(trash_dir)
+            start_reclaim(trash_dirs)
         else:
             click.echo("Cleaning not confirmed. Aborting now")
         click.echo("")
@@ -90,9 +165,29 @@ class Cleaner(click.Command):
 class CatkinCleaner(Cleaner):
     """Cleaner class for catkin workspace"""
 
+    def get_package_paths(self, workspace_dir, package):
+        """Returns the paths of a package for catkin_make, catkin_make_isolated and catkin
+        build. Files installed directly into the merged spaces (e.g. python modules) are
+        not covered."""
+        paths = [
+            os.path.join(workspace_dir, "build", package),
+            os.path.join(workspace_dir, "build_isolated", package),
+            os.path.join(workspace_dir, "devel_isolated", package),
+            os.path.join(workspace_dir, "devel", ".private", package),
+            os.path.join(workspace_dir, "logs", package),
+        ]
+        for space in ["devel", "install", "install_isolated"]:
+            for subdir in ["include", "lib", "share"]:
+                paths.append(os.path.join(workspace_dir, space, subdir, package))
+        return paths
+
     def invoke(self, ctx):
         click.echo("========== Cleaning catkin workspace ==========")
         catkin_dir = get_catkin_dir()
+        packages = self.get_selected_packages(ctx, catkin_dir)
+        if packages is not None:
+            self.clean_packages(catkin_dir, packages)
+            return
         self.clean_list.append(os.path.join(catkin_dir, "build"))
         self.clean_list.append(os.path.join(catkin_dir, "build_isolated"))
         self.clean_list.append(os.path.join(catkin_dir, "devel"))
@@ -106,9 +201,37 @@ class CatkinCleaner(Cleaner):
 class ColconCleaner(Cleaner):
     """Cleaner class for colcon workspace"""
 
+    @staticmethod
+    def has_merged_install(colcon_dir):
+        """Checks whether the workspace has been installed with --merge-install"""
+        try:
+            with open(
+                os.path.join(colcon_dir, "install", ".colcon_install_layout")
+            ) as layout_file:
+                return layout_file.read().strip() == "merged"
+        except IOError:
+            return False
+
+    def get_package_paths(self, workspace_dir, package):
+        """Returns the build and install paths of a package. Packages inside a merged
+        install space cannot be separated, so only their build paths are returned."""
+        paths = [os.path.join(workspace_dir, "build", package)]
+        if not self.has_merged_install(workspace_dir):
+            paths.append(os.path.join(workspace_dir, "install", package))
+        return paths
+
     def invoke(self, ctx):
         click.echo("========== Cleaning colcon workspace ==========")
         colcon_dir = get_colcon_dir()
+        packages = self.get_selected_packages(ctx, colcon_dir)
+        if packages is not None:
+            if self.has_merged_install(colcon_dir):
+                click.echo(
+                    "The install space is merged, so installed files of the packages are "
+                    "kept. Clean the whole workspace to remove them."
+                )
+            self.clean_packages(colcon_dir, packages)
+            return
         self.clean_list.append(os.path.join(colcon_dir, "build"))
         self.clean_list.append(os.path.join(colcon_dir, "log"))
         self.clean_list.append(os.path.join(colcon_dir, "install"))
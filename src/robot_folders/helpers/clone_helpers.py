@@ -0,0 +1,625 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module contains helpers around getting repositories into a workspace
+"""
+import copy
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+
+import click
+
+from yaml import dump as yaml_dump
+
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.bundle_helpers import init_bundled_submodules
+from robot_folders.helpers.mirror_helpers import MirrorCache
+from robot_folders.helpers.ssh_helpers import SshMultiplexer
+from robot_folders.helpers.repository_helpers import (
+    fetch_version,
+    get_sparse_paths,
+    get_upstream,
+    is_commit_id,
+    set_sparse_paths,
+)
+
+
+SUBMODULE_STRATEGIES = ["recursive", "parallel", "shallow", "lazy"]
+COPY_MODES = ["hardlink", "shared", "worktree"]
+LAZY_SUBMODULES_FILENAME = ".rob_folders_lazy_submodules"
+
+# How often cloning missing repositories is retried and the seconds to wait before the first
+# retry. The delay doubles with every retry.
+CLONE_RETRIES = 2
+RETRY_DELAY = 5.0
+
+
+class CloneOptions(object):
+    """Bundles all options that influence how repositories are cloned"""
+
+    def __init__(
+        self,
+        no_submodules=False,
+        use_mirrors=None,
+        depth=None,
+        filter=None,
+        sparse=None,
+        submodule_strategy=None,
+        submodule_jobs=None,
+        quiet=False,
+    ):
+        self.no_submodules = no_submodules
+        if use_mirrors is None:
+            use_mirrors = config_helpers.get_value_safe_default(
+                "git", "use_mirrors", False, debug=False
+            )
+        self.use_mirrors = use_mirrors
+        self.depth = depth
+        self.filter = filter
+        self.sparse = sparse
+        if submodule_strategy is None:
+            submodule_strategy = config_helpers.get_value_safe_default(
+                "git", "submodule_strategy", "recursive", debug=False
+            )
+        self.submodule_strategy = submodule_strategy
+        if submodule_jobs is None:
+            submodule_jobs = config_helpers.get_value_safe_default(
+                "git", "submodule_jobs", 8, debug=False
+            )
+        self.submodule_jobs = submodule_jobs
+        # Suppresses the progress output of git, e.g. when cloning in parallel
+        self.quiet = quiet
+
+    def for_repo(self, repo_entry):
+        """Returns a copy of the options with the per-repository settings ('depth', 'filter'
+        and 'sparse') of a rosinstall git entry applied"""
+        repo_options = copy.copy(self)
+        if "depth" in repo_entry:
+            repo_options.depth = repo_entry["depth"]
+        if "filter" in repo_entry:
+            repo_options.filter = repo_entry["filter"]
+        if "sparse" in repo_entry:
+            repo_options.sparse = repo_entry["sparse"]
+            if repo_options.filter is None:
+                # Sparse checkouts only pay off when blobs outside of them are not downloaded
+                repo_options.filter = "blob:none"
+        return repo_options
+
+    def requires_git_clone(self):
+        """Checks whether these options can only be handled by calling git directly instead of
+        importing with vcstool"""
+        return bool(self.depth or self.filter or self.sparse)
+
+    def clones_submodules(self):
+        """Checks whether submodules should be initialized right when cloning"""
+        return not self.no_submodules and self.submodule_strategy != "lazy"
+
+    def defers_submodules(self):
+        """Checks whether submodule initialization is deferred until the first build"""
+        return not self.no_submodules and self.submodule_strategy == "lazy"
+
+    def submodule_clone_args(self):
+        """Returns the arguments passed to git clone for fetching submodules"""
+        if not self.clones_submodules():
+            return []
+        args = ["--recurse-submodules"]
+        if self.submodule_strategy in ["parallel", "shallow"]:
+            args.extend(["--jobs", str(self.submodule_jobs)])
+        if self.submodule_strategy == "shallow":
+            args.append("--shallow-submodules")
+        return args
+
+    def submodule_update_args(self):
+        """Returns the arguments passed to git submodule update"""
+        args = ["--init", "--recursive"]
+        if self.quiet:
+            args.append("--quiet")
+        if self.submodule_strategy in ["parallel", "shallow", "lazy"]:
+            args.extend(["--jobs", str(self.submodule_jobs)])
+        if self.submodule_strategy == "shallow":
+            args.extend(["--depth", "1"])
+        return args
+
+
+def update_submodules(package_dir, clone_options):
+    """Initializes and updates all submodules of the given repository recursively"""
+    if os.path.isfile(os.path.join(package_dir, ".gitmodules")):
+        subprocess.check_call(
+            ["git", "submodule", "update"] + clone_options.submodule_update_args(),
+            cwd=package_dir,
+        )
+
+
+def add_config_to_env(env, settings):
+    """Returns a copy of env (or the current environment) passing the given config settings
+    to all git commands run with it"""
+    env = dict(os.environ if env is None else env)
+    index = int(env.get("GIT_CONFIG_COUNT", "0"))
+    for key, value in settings:
+        env["GIT_CONFIG_KEY_{}".format(index)] = key
+        env["GIT_CONFIG_VALUE_{}".format(index)] = value
+        index += 1
+    env["GIT_CONFIG_COUNT"] = str(index)
+    return env
+
+
+def get_submodule_paths(package_dir):
+    """Returns a dict mapping the names of all submodules in package_dir's .gitmodules to
+    their paths"""
+    output = subprocess.run(
+        [
+            "git",
+            "config",
+            "-f",
+            ".gitmodules",
+            "--get-regexp",
+            r"^submodule\..*\.path$",
+        ],
+        cwd=package_dir,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    paths = dict()
+    for line in output.splitlines():
+        key, path = line.split(" ", 1)
+        paths[key[len("submodule.") : -len(".path")]] = path
+    return paths
+
+
+def copy_submodules(source_dir, package_dir, clone_options, env=None):
+    """Initializes the submodules of package_dir, a copy of source_dir, recursively. Submodules
+    checked out in the source are cloned from there instead of their remotes. Their origin
+    is pointed to the real remote afterwards."""
+    if not os.path.isfile(os.path.join(package_dir, ".gitmodules")):
+        return
+    subprocess.check_call(["git", "submodule", "--quiet", "init"], cwd=package_dir)
+    paths = get_submodule_paths(package_dir)
+    copied = [
+        name
+        for name, path in paths.items()
+        if os.path.exists(os.path.join(source_dir, path, ".git"))
+    ]
+    settings = [("protocol.file.allow", "always")]
+    settings.extend(
+        (
+            "submodule.{}.url".format(name),
+            os.path.realpath(os.path.join(source_dir, paths[name])),
+        )
+        for name in copied
+    )
+    subprocess.check_call(
+        ["git", "submodule", "update"]
+        + [
+            arg for arg in clone_options.submodule_update_args() if arg != "--recursive"
+        ],
+        cwd=package_dir,
+        env=add_config_to_env(env, settings),
+    )
+    for name, path in paths.items():
+        submodule_dir = os.path.join(package_dir, path)
+        if not os.path.exists(os.path.join(submodule_dir, ".git")):
+            continue
+        if name in copied:
+            url = subprocess.check_output(
+                ["git", "config", "--get", "submodule.{}.url".format(name)],
+                cwd=package_dir,
+                universal_newlines=True,
+            ).strip()
+            set_origin(submodule_dir, url)
+        copy_submodules(
+            os.path.join(source_dir, path), submodule_dir, clone_options, env
+        )
+
+
+def defer_submodules(target_dir, local_names):
+    """Remembers repositories whose submodules should be initialized with the first build"""
+    lazy_file = os.path.join(target_dir, LAZY_SUBMODULES_FILENAME)
+    deferred = list()
+    if os.path.isfile(lazy_file):
+        with open(lazy_file, "r") as in_file:
+            deferred = [line.strip() for line in in_file.readlines()]
+    pending = [
+        local_name
+        for local_name in local_names
+        if local_name not in deferred
+        and os.path.isfile(os.path.join(target_dir, local_name, ".gitmodules"))
+    ]
+    if pending:
+        with open(lazy_file, "a") as out_file:
+            for local_name in pending:
+                out_file.write(local_name + "\n")
+
+
+def init_lazy_submodules(target_dir, clone_options=None):
+    """Initializes the submodules of all repositories inside target_dir whose submodule
+    initialization has been deferred"""
+    lazy_file = os.path.join(target_dir, LAZY_SUBMODULES_FILENAME)
+    if not os.path.isfile(lazy_file):
+        return
+    if clone_options is None:
+        clone_options = CloneOptions(use_mirrors=False)
+    with open(lazy_file, "r") as in_file:
+        local_names = [line.strip() for line in in_file.readlines() if line.strip()]
+    with SshMultiplexer():
+        for local_name in local_names:
+            package_dir = os.path.join(target_dir, local_name)
+            if os.path.isdir(package_dir):
+                click.echo("Initializing submodules of {}".format(local_name))
+                update_submodules(package_dir, clone_options)
+    os.remove(lazy_file)
+
+
+def set_origin(package_dir, uri):
+    """Points the origin remote of the given repository to uri"""
+    subprocess.check_call(["git", "remote", "set-url", "origin", uri], cwd=package_dir)
+
+
+def clone_repository(uri, package_dir, clone_options, version=None):
+    """Clones a single repository into package_dir and checks out version, if given.
+
+    When mirrors are used, the clone is done from the local mirror and origin is pointed to the
+    original URI afterwards. Submodules are initialized only after that, so relative submodule
+    URLs get resolved against the real remote.
+    """
+    source = uri
+    if clone_options.use_mirrors:
+        source = MirrorCache().update(uri)
+        if clone_options.requires_git_clone():
+            # depth and filter are ignored for plain local paths
+            source = "file://" + source
+
+    clone_cmd = ["git", "clone"]
+    if clone_options.quiet:
+        clone_cmd.append("--quiet")
+    if clone_options.depth:
+        clone_cmd.extend(["--depth", str(clone_options.depth)])
+    if clone_options.filter:
+        clone_cmd.extend(["--filter", clone_options.filter])
+    if clone_options.sparse:
+        clone_cmd.append("--sparse")
+    checkout_commit = version and is_commit_id(version)
+    if checkout_commit:
+        clone_cmd.append("--no-checkout")
+    elif version:
+        clone_cmd.extend(["--branch", version])
+    if not clone_options.use_mirrors:
+        clone_cmd.extend(clone_options.submodule_clone_args())
+    subprocess.check_call(clone_cmd + [source, package_dir])
+
+    if clone_options.use_mirrors:
+        set_origin(package_dir, uri)
+    if clone_options.sparse:
+        set_sparse_paths(package_dir, clone_options.sparse)
+    if checkout_commit:
+        if clone_options.depth:
+            fetch_version(package_dir, version, clone_options.depth)
+        checkout_cmd = ["git", "checkout"]
+        if clone_options.quiet:
+            checkout_cmd.append("--quiet")
+        subprocess.check_call(checkout_cmd + [version], cwd=package_dir)
+    if checkout_commit or clone_options.use_mirrors:
+        if clone_options.clones_submodules():
+            update_submodules(package_dir, clone_options)
+
+
+def clone_from_bundle(bundle_path, uri, package_dir, clone_options, version=None):
+    """Clones a repository from a git bundle created by an environment export and points its
+    origin to uri afterwards. Submodules are cloned from their bundles as well, so no network
+    access is needed."""
+    bundle_options = copy.copy(clone_options)
+    bundle_options.use_mirrors = False
+    bundle_options.depth = None
+    bundle_options.filter = None
+    bundle_options.no_submodules = True
+    clone_repository(bundle_path, package_dir, bundle_options, version)
+    set_origin(package_dir, uri)
+    if not clone_options.no_submodules:
+        init_bundled_submodules(package_dir, bundle_path)
+
+
+def import_rosinstall(rosinstall, target_dir, clone_options):
+    """Clones all packages from a rosinstall structure into target_dir.
+
+    Repositories are imported using vcstool. Repositories that require options vcstool
+    cannot handle (such as a clone depth) are cloned one by one using git directly, as well as
+    repositories that come with a git bundle.
+    """
+    if not rosinstall:
+        return
+
+    # All repositories share their ssh connections, including those cloned by vcstool
+    with SshMultiplexer():
+        os.makedirs(target_dir, exist_ok=True)
+
+        vcs_rosinstall = list()
+        for repo in rosinstall:
+            if "git" in repo and "bundle" in repo["git"]:
+                entry = repo["git"]
+                click.echo("Cloning {} from bundle".format(entry["local-name"]))
+                clone_from_bundle(
+                    entry["bundle"],
+                    entry["uri"],
+                    os.path.join(target_dir, entry["local-name"]),
+                    clone_options.for_repo(entry),
+                    entry.get("version"),
+                )
+            elif (
+                "git" in repo
+                and clone_options.for_repo(repo["git"]).requires_git_clone()
+            ):
+                entry = repo["git"]
+                click.echo("Cloning {}".format(entry["local-name"]))
+                clone_repository(
+                    entry["uri"],
+                    os.path.join(target_dir, entry["local-name"]),
+                    clone_options.for_repo(entry),
+                    entry.get("version"),
+                )
+            else:
+                vcs_rosinstall.append(repo)
+
+        if vcs_rosinstall:
+            vcs_import(vcs_rosinstall, target_dir, clone_options)
+
+        if clone_options.defers_submodules():
+            defer_submodules(
+                target_dir,
+                [repo["git"]["local-name"] for repo in rosinstall if "git" in repo],
+            )
+
+
+def is_cloned(repo, target_dir):
+    """Checks whether the repository of a rosinstall entry has been cloned into target_dir
+    completely"""
+    repo_type, entry = next(iter(repo.items()))
+    package_dir = os.path.join(target_dir, entry["local-name"])
+    if not os.path.isdir(package_dir):
+        return False
+    if repo_type != "git":
+        return True
+    # Fails if HEAD has not been written yet. Leftovers inside another repository report the
+    # other repository's top level.
+    process = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel", "HEAD"],
+        cwd=package_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    if process.returncode != 0:
+        return False
+    return os.path.realpath(process.stdout.splitlines()[0]) == os.path.realpath(
+        package_dir
+    )
+
+
+def get_missing_repositories(rosinstall, target_dir):
+    """Returns the entries of a rosinstall that have not been cloned into target_dir. Leftovers
+    of failed clones are removed, so the repositories can be cloned again."""
+    missing = [repo for repo in rosinstall if not is_cloned(repo, target_dir)]
+    for repo in missing:
+        package_dir = os.path.join(target_dir, next(iter(repo.values()))["local-name"])
+        if os.path.isdir(package_dir):
+            click.echo("Removing incomplete clone {}".format(package_dir))
+            shutil.rmtree(package_dir)
+    return missing
+
+
+def import_missing(rosinstall, target_dir, clone_options, retries=CLONE_RETRIES):
+    """Clones all packages from a rosinstall structure that are not inside target_dir yet (see
+    import_rosinstall). Repositories that failed to clone are retried with an exponential
+    backoff."""
+    if not rosinstall:
+        return
+    for attempt in range(retries + 1):
+        missing = get_missing_repositories(rosinstall, target_dir)
+        if not missing:
+            break
+        if attempt:
+            delay = RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(1.0, 1.5)
+            click.echo(
+                "Retrying to clone {} repositories in {:.0f} seconds".format(
+                    len(missing), delay
+                )
+            )
+            time.sleep(delay)
+        try:
+            import_rosinstall(missing, target_dir, clone_options)
+        except subprocess.CalledProcessError:
+            if attempt == retries:
+                raise
+    # Repositories cloned by failed attempts have not been registered yet
+    if clone_options.defers_submodules():
+        defer_submodules(
+            target_dir,
+            [repo["git"]["local-name"] for repo in rosinstall if "git" in repo],
+        )
+
+
+def vcs_import(rosinstall, target_dir, clone_options):
+    """Imports the repositories of a rosinstall structure into target_dir using vcstool"""
+    import_list = rosinstall
+    if clone_options.use_mirrors:
+        import_list = MirrorCache().redirect_rosinstall(rosinstall)
+
+    # Dump the rosinstall to a file and use vcstool for getting the packages
+    with tempfile.NamedTemporaryFile(
+        mode="w", prefix="rob_folders_rosinstall_", suffix=".yaml", delete=False
+    ) as rosinstall_content:
+        yaml_dump(import_list, rosinstall_content)
+        rosinstall_filename = rosinstall_content.name
+
+    # vcstool only knows about plain recursive clones. Submodules of the other strategies
+    # (and all submodules when using mirrors) are updated after importing.
+    vcs_env = os.environ.copy()
+    update_afterwards = False
+    import_cmd = ["vcs", "import"]
+    if clone_options.clones_submodules():
+        if clone_options.use_mirrors or clone_options.submodule_strategy == "shallow":
+            update_afterwards = True
+        else:
+            import_cmd.append("--recursive")
+            if clone_options.submodule_strategy == "parallel":
+                # Make the clones spawned by vcstool fetch submodules in parallel
+                index = int(vcs_env.get("GIT_CONFIG_COUNT", "0"))
+                vcs_env["GIT_CONFIG_COUNT"] = str(index + 1)
+                vcs_env["GIT_CONFIG_KEY_{}".format(index)] = "submodule.fetchJobs"
+                vcs_env["GIT_CONFIG_VALUE_{}".format(index)] = str(
+                    clone_options.submodule_jobs
+                )
+    try:
+        subprocess.check_call(
+            import_cmd + ["--input", rosinstall_filename, "."],
+            cwd=target_dir,
+            env=vcs_env,
+        )
+    finally:
+        os.remove(rosinstall_filename)
+
+    for repo in rosinstall:
+        if "git" not in repo or "uri" not in repo["git"]:
+            continue
+        package_dir = os.path.join(target_dir, repo["git"]["local-name"])
+        if clone_options.use_mirrors:
+            click.echo(
+                "Pointing origin of {} to {}".format(package_dir, repo["git"]["uri"])
+            )
+            set_origin(package_dir, repo["git"]["uri"])
+        if update_afterwards:
+            update_submodules(package_dir, clone_options)
+
+
+def copy_repository(source_dir, package_dir, mode="hardlink", clone_options=None):
+    """Creates a copy of the local repository source_dir in package_dir without downloading it
+    again. The checked out branch (or commit, if detached), all local branches with their
+    upstreams and all remotes are preserved. Submodules checked out in the source are copied
+    from there as well.
+
+    Modes:
+      - hardlink: Local clone with hardlinked objects. The copy is independent of the source.
+      - shared: Clone using the source's object store as alternate. Nothing is copied, but the
+        copy breaks if the source repository is removed or pruned.
+      - worktree: Linked worktree of the source repository. As a branch can only be checked out
+        in one worktree, the copy gets a detached HEAD.
+    """
+    if clone_options is None:
+        clone_options = CloneOptions(use_mirrors=False)
+    branch = subprocess.check_output(
+        ["git", "rev-parse", "--abbrev-ref", "HEAD"],
+        cwd=source_dir,
+        universal_newlines=True,
+    ).strip()
+    commit = subprocess.check_output(
+        ["git", "rev-parse", "HEAD"], cwd=source_dir, universal_newlines=True
+    ).strip()
+    update_env = None
+
+    if mode == "worktree":
+        subprocess.check_call(
+            ["git", "worktree", "add", "--quiet", "--detach", package_dir, commit],
+            cwd=source_dir,
+        )
+    elif mode in ["hardlink", "shared"]:
+        clone_cmd = ["git", "clone", "--quiet", "--no-checkout"]
+        if mode == "shared":
+            clone_cmd.append("--shared")
+            # Let submodules borrow objects from the source's submodules as well
+            update_env = add_config_to_env(
+                None,
+                [
+                    ("submodule.alternateLocation", "superproject"),
+                    ("submodule.alternateErrorStrategy", "info"),
+                ],
+            )
+        subprocess.check_call(clone_cmd + [source_dir, package_dir])
+
+        # The clone's origin is the source repository. Replace all remotes by the ones of the
+        # source, so that the copy fetches from the real remotes.
+        subprocess.check_call(["git", "remote", "remove", "origin"], cwd=package_dir)
+        remotes = subprocess.check_output(
+            ["git", "remote"], cwd=source_dir, universal_newlines=True
+        ).split()
+        for remote in remotes:
+            url = subprocess.check_output(
+                ["git", "remote", "get-url", remote],
+                cwd=source_dir,
+                universal_newlines=True,
+            ).strip()
+            subprocess.check_call(
+                ["git", "remote", "add", remote, url], cwd=package_dir
+            )
+        # Take over the local and remote-tracking branches of the source. Its objects are
+        # available already, so this does not transfer anything.
+        subprocess.check_call(
+            [
+                "git",
+                "fetch",
+                "--quiet",
+                "--no-tags",
+                "--update-head-ok",
+                source_dir,
+                "+refs/heads/*:refs/heads/*",
+                "+refs/remotes/*:refs/remotes/*",
+            ],
+            cwd=package_dir,
+        )
+        local_branches = subprocess.check_output(
+            ["git", "for-each-ref", "--format=%(refname:short)", "refs/heads"],
+            cwd=source_dir,
+            universal_newlines=True,
+        ).split()
+        for local_branch in local_branches:
+            upstream = get_upstream(source_dir, local_branch)
+            if upstream is None:
+                continue
+            for key, value in zip(["remote", "merge"], upstream):
+                subprocess.check_call(
+                    ["git", "config", "branch.{}.{}".format(local_branch, key), value],
+                    cwd=package_dir,
+                )
+
+        if branch == "HEAD":
+            subprocess.check_call(
+                ["git", "checkout", "--quiet", "--detach", commit], cwd=package_dir
+            )
+        else:
+            subprocess.check_call(
+                ["git", "checkout", "--quiet", "-B", branch, commit], cwd=package_dir
+            )
+    else:
+        raise ValueError("Unknown copy mode '{}'".format(mode))
+
+    sparse_paths = get_sparse_paths(source_dir)
+    if sparse_paths:
+        set_sparse_paths(package_dir, sparse_paths)
+
+    if os.path.isfile(os.path.join(package_dir, ".gitmodules")):
+        if clone_options.clones_submodules():
+            copy_submodules(source_dir, package_dir, clone_options, update_env)
+        elif clone_options.defers_submodules():
+            defer_submodules(
+                os.path.dirname(package_dir), [os.path.basename(package_dir)]
+            )
@@ -25,10 +25,15 @@ import os
 import errno
 import getpass
 import subprocess
+import tempfile
 
 import click
 
 import robot_folders.helpers.config_helpers as config_helpers
+from robot_folders.helpers.exceptions import ModuleException
+
+# Touched whenever an environment is sourced or built
+USAGE_MARKER_FILENAME = ".rob_folders_used"
 
 
 def get_base_dir():
@@ -52,6 +57,21 @@ def get_last_activated_env():
         return None
 
 
+def set_last_activated_env(env_name):
+    """Stores the given environment as the most recently sourced one"""
+    atomic_write(os.path.join(get_checkout_dir(), ".cur_env"), env_name)
+    mark_env_used(env_name)
+
+
+def mark_env_used(env_name):
+    """Records that an environment has been used right now"""
+    env_dir = os.path.join(get_checkout_dir(), env_name)
+    if os.path.isdir(env_dir):
+        with open(os.path.join(env_dir, USAGE_MARKER_FILENAME), "a"):
+            pass
+        os.utime(os.path.join(env_dir, USAGE_MARKER_FILENAME))
+
+
 def get_active_env():
     """Returns the currently sourced environment. If none is sourced, this will return None"""
     try:
@@ -75,6 +95,23 @@ def get_active_env_path():
     return os.path.join(get_checkout_dir(), active_env)
 
 
+def get_env_dir(env_name=None):
+    """Returns the directory of the given environment or of the active one if env_name is
+    None. Raises a ModuleException if the environment does not exist."""
+    if env_name is None:
+        env_dir = get_active_env_path()
+        if env_dir is None:
+            raise ModuleException(
+                "No environment given and no environment is active", "directory"
+            )
+        return env_dir
+    if env_name not in list_environments():
+        raise ModuleException(
+            "Environment '{}' does not exist".format(env_name), "directory"
+        )
+    return os.path.join(get_checkout_dir(), env_name)
+
+
 def mkdir_p(path):
     """Checks whether a directory exists, otherwise it will be created."""
     try:
@@ -86,6 +123,50 @@ def mkdir_p(path):
             raise
 
 
+def atomic_write(path, content):
+    """Writes content to path, so that readers either see the old or the new content"""
+    file_handle, tmp_path = tempfile.mkstemp(
+        prefix=".{}.".format(os.path.basename(path)),
+        dir=os.path.dirname(os.path.abspath(path)),
+    )
+    try:
+        with os.fdopen(file_handle, "w") as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def get_directory_size(path):
+    """Returns the disk space used by all files below path in bytes. Files with multiple
+    hard links are counted once and symlinks are not followed."""
+    size = 0
+    seen_inodes = set()
+    pending = [path]
+    while pending:
+        try:
+            entries = list(os.scandir(pending.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                stat_result = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat_result.st_nlink > 1:
+                if (stat_result.st_dev, stat_result.st_ino) in seen_inodes:
+                    continue
+                seen_inodes.add((stat_result.st_dev, stat_result.st_ino))
+            size += stat_result.st_blocks * 512
+    return size
+
+
 def recursive_rmdir(path):
     """Recursively deletes a path"""
     for i in os.listdir(path):
@@ -151,6 +232,22 @@ def get_colcon_dir(env_dir=""):
     return os.path.join(cur_env_path, "colcon_ws")
 
 
+def get_source_dirs(env_dir):
+    """Returns a dict mapping the workspace keys ('misc', 'ros', 'colcon') of all workspaces
+    present inside an environment to their source directories."""
+    source_dirs = dict()
+    misc_ws_dir = os.path.join(env_dir, "misc_ws")
+    if os.path.isdir(misc_ws_dir):
+        source_dirs["misc"] = misc_ws_dir
+    catkin_src_dir = os.path.join(get_catkin_dir(env_dir), "src")
+    if os.path.isdir(catkin_src_dir):
+        source_dirs["ros"] = catkin_src_dir
+    colcon_src_dir = os.path.join(get_colcon_dir(env_dir), "src")
+    if os.path.isdir(colcon_src_dir):
+        source_dirs["colcon"] = colcon_src_dir
+    return source_dirs
+
+
 def yes_no_to_bool(bool_str):
     """
     Converts a yes/no string to a bool
@@ -0,0 +1,204 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module contains helper functions for measuring the disk usage of environments, including
+their build trees outside of the checkout directory
+"""
+import concurrent.futures
+import os
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers import config_helpers
+
+# Areas of an environment in the order they are reported
+AREAS = ["src", "build", "devel/install", "log", "misc export", "other"]
+# Folders of the catkin and colcon workspaces and the area they belong to
+WORKSPACE_AREAS = [
+    ("src", "src"),
+    ("build", "build"),
+    ("build_isolated", "build"),
+    ("devel", "devel/install"),
+    ("devel_isolated", "devel/install"),
+    ("install", "devel/install"),
+    ("install_isolated", "devel/install"),
+    ("log", "log"),
+    ("logs", "log"),
+]
+
+
+def scan_directory(path, cache=None):
+    """
+    Returns the disk space used by the files directly inside path, the names of its
+    subdirectories and the device, inode and size of files with multiple hard links, which
+    are only counted once in total. Unchanged directories are read from the cache.
+    """
+    signature = None
+    if cache is not None:
+        try:
+            signature = [os.stat(path, follow_symlinks=False).st_mtime_ns]
+        except OSError:
+            return 0, list(), list()
+        value = cache.get(path, signature)
+        if value is not None:
+            return value
+    size = 0
+    subdirs = list()
+    links = list()
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    stat_result = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if stat_result.st_nlink > 1:
+                    links.append(
+                        [
+                            stat_result.st_dev,
+                            stat_result.st_ino,
+                            stat_result.st_blocks * 512,
+                        ]
+                    )
+                else:
+                    size += stat_result.st_blocks * 512
+    except OSError:
+        return 0, list(), list()
+    value = [size, sorted(subdirs), links]
+    if cache is not None:
+        cache.set(path, signature, value)
+    return value
+
+
+def measure_trees(roots, jobs=None, cache=None):
+    """
+    Returns a dict mapping each of the given directories to the disk space used below it.
+    Directories are scanned in parallel. Roots inside other roots are only counted for
+    themselves and identical roots are only counted once. Symlinks are not followed.
+    """
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    roots = [os.path.realpath(root) for root in roots]
+    root_set = set(roots)
+    scanned = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {
+            executor.submit(scan_directory, root, cache): root
+            for root in root_set
+            if os.path.isdir(root)
+        }
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                path = pending.pop(future)
+                scanned[path] = future.result()
+                for name in scanned[path][1]:
+                    subdir = os.path.join(path, name)
+                    if subdir not in root_set:
+                        pending[executor.submit(scan_directory, subdir, cache)] = subdir
+
+    if cache is not None:
+        prune_cache(cache, root_set, scanned)
+
+    sizes = dict()
+    seen_inodes = set()
+    for root in roots:
+        if root in sizes:
+            continue
+        size = 0
+        pending = [root] if root in scanned else []
+        while pending:
+            path = pending.pop()
+            files_size, subdirs, links = scanned[path]
+            size += files_size
+            for device, inode, link_size in links:
+                if (device, inode) not in seen_inodes:
+                    seen_inodes.add((device, inode))
+                    size += link_size
+            for name in subdirs:
+                subdir = os.path.join(path, name)
+                if subdir in scanned and subdir not in root_set:
+                    pending.append(subdir)
+        sizes[root] = size
+    return sizes
+
+
+def prune_cache(cache, roots, scanned):
+    """Removes the cache entries of directories below the roots that do not exist anymore"""
+    prefixes = tuple(os.path.join(root, "") for root in roots)
+    for key in cache.keys():
+        if key.startswith(prefixes) and key not in scanned:
+            cache.remove(key)
+
+
+def get_environment_areas(env_name):
+    """
+    Returns a list of the areas of an environment and their directories. Build folders
+    symlinked into the build base are resolved and the environment's folders in the build
+    base are counted as well.
+    """
+    env_dir = os.path.join(dir_helpers.get_checkout_dir(), env_name)
+    areas = list()
+    for workspace_dir in [
+        dir_helpers.get_catkin_dir(env_dir),
+        dir_helpers.get_colcon_dir(env_dir),
+    ]:
+        for folder, area in WORKSPACE_AREAS:
+            path = os.path.join(workspace_dir, folder)
+            if os.path.isdir(path):
+                areas.append((area, path))
+    misc_ws_dir = os.path.join(env_dir, "misc_ws")
+    if os.path.isdir(misc_ws_dir):
+        areas.append(("src", misc_ws_dir))
+        export_dir = os.path.join(misc_ws_dir, "export")
+        if os.path.isdir(export_dir):
+            areas.append(("misc export", export_dir))
+    areas.append(("other", env_dir))
+    no_backup_dir = config_helpers.get_value_safe(
+        "directories", "no_backup_dir", debug=False
+    )
+    if no_backup_dir:
+        build_base_env_dir = os.path.join(
+            dir_helpers.get_build_base_dir(use_no_backup=True), env_name
+        )
+        if os.path.isdir(build_base_env_dir):
+            areas.append(("other", build_base_env_dir))
+    return areas
+
+
+def get_build_folders(env_dir):
+    """Returns the build, devel, install and log folders of an environment's workspaces and
+    the export folder of its misc workspace. The folders may be symlinks."""
+    folders = list()
+    for workspace_dir in [
+        dir_helpers.get_catkin_dir(env_dir),
+        dir_helpers.get_colcon_dir(env_dir),
+    ]:
+        for folder, area in WORKSPACE_AREAS:
+            if area != "src":
+                folders.append(os.path.join(workspace_dir, folder))
+    folders.append(os.path.join(env_dir, "misc_ws", "export"))
+    return [folder for folder in folders if os.path.lexists(folder)]
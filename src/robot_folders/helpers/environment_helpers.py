@@ -22,6 +22,9 @@
 """
 Module with helper classes to create workspaces
 """
+import copy
+import functools
+import json
 import os
 import subprocess
 
@@ -33,9 +36,141 @@ import robot_folders.helpers.config_helpers as config_helpers
 import robot_folders.helpers.build_helpers as build_helpers
 import robot_folders.helpers.directory_helpers as dir_helpers
 from robot_folders.helpers import config_helpers
+from robot_folders.helpers.clone_helpers import CloneOptions, import_missing
 from robot_folders.helpers.ros_version_helpers import *
 
-from yaml import dump as yaml_dump
+
+CREATION_STATE_FILENAME = ".rob_folders_creation.json"
+# Output of an environment creation running in the background
+CREATION_LOG_FILENAME = ".rob_folders_creation.log"
+# Written when a background creation finished, until the result has been shown once
+CREATION_DONE_FILENAME = ".rob_folders_creation.done"
+
+
+class CreationState(object):
+    """
+    Checkpoints of an environment's creation. They are stored inside the environment, so a
+    creation that failed can be resumed with the first step that has not been completed.
+    """
+
+    def __init__(self, env_dir):
+        self.path = os.path.join(env_dir, CREATION_STATE_FILENAME)
+        self.settings = dict()
+        self.completed = list()
+        self.current_step = None
+        self.error = None
+        self.pid = None
+
+    @classmethod
+    def load(cls, env_dir):
+        """Returns the stored state of an environment or None if there is none"""
+        state = cls(env_dir)
+        try:
+            with open(state.path) as state_file:
+                data = json.load(state_file)
+        except (IOError, ValueError):
+            return None
+        state.settings = data["settings"]
+        state.completed = data["completed"]
+        state.current_step = data.get("current_step")
+        state.error = data.get("error")
+        state.pid = data.get("pid")
+        return state
+
+    def save(self):
+        """Writes the state into the environment"""
+        dir_helpers.atomic_write(
+            self.path,
+            json.dumps(
+                {
+                    "settings": self.settings,
+                    "completed": self.completed,
+                    "current_step": self.current_step,
+                    "error": self.error,
+                    "pid": self.pid,
+                },
+                indent=2,
+            ),
+        )
+
+    def run_step(self, name, function):
+        """Runs a step unless it has been completed before"""
+        if name in self.completed:
+            click.echo("Skipping {} (completed before)".format(name))
+            return
+        self.current_step = name
+        self.error = None
+        self.save()
+        try:
+            function()
+        except BaseException as err:
+            self.error = str(err) or type(err).__name__
+            self.save()
+            raise
+        self.completed.append(name)
+        self.current_step = None
+        self.save()
+
+    def is_running(self):
+        """Checks whether the process creating the environment is still alive"""
+        if self.pid is None:
+            return False
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def remove(self):
+        """Removes the state after the creation finished. Background creations leave a
+        marker, so their completion can be reported."""
+        if self.settings.get("background"):
+            dir_helpers.atomic_write(
+                os.path.join(os.path.dirname(self.path), CREATION_DONE_FILENAME),
+                "{}\n".format(len(self.completed)),
+            )
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def get_creation_progress(env_dir):
+    """
+    Returns a line describing the creation of an environment or None if it has been created
+    in the foreground or its completion has been reported before. The completion of a
+    background creation is only reported once.
+    """
+    env_name = os.path.basename(env_dir)
+    done_file = os.path.join(env_dir, CREATION_DONE_FILENAME)
+    if os.path.isfile(done_file):
+        os.remove(done_file)
+        return 'Creation of environment "{}" finished'.format(env_name)
+    state = CreationState.load(env_dir)
+    if state is None:
+        return None
+    log_file = os.path.join(env_dir, CREATION_LOG_FILENAME)
+    log_hint = " (log: {})".format(log_file) if os.path.isfile(log_file) else ""
+    if state.is_running():
+        return 'Creating environment "{}": {} steps done, running {}{}'.format(
+            env_name, len(state.completed), state.current_step or "setup", log_hint
+        )
+    return (
+        'Creation of environment "{}" stopped in step {}: {}{}. '
+        "Run 'fzirob add_environment --resume {}' to continue it.".format(
+            env_name,
+            state.current_step or "setup",
+            state.error or "interrupted",
+            log_hint,
+            env_name,
+        )
+    )
+
+
+def symlink_p(source, link_name):
+    """Creates a symlink unless it exists already"""
+    if not os.path.islink(link_name):
+        os.symlink(source, link_name)
 
 
 class MiscCreator(object):
@@ -44,43 +179,23 @@ class MiscCreator(object):
     """
 
     def __init__(
-        self, misc_ws_directory, build_root, rosinstall=None, no_submodules=False
+        self, misc_ws_directory, build_root, rosinstall=None, clone_options=None
     ):
 
         self.misc_ws_directory = misc_ws_directory
         self.build_root = build_root
-        self.no_submodules = no_submodules
+        self.clone_options = clone_options or CloneOptions()
+        if self.clone_options.submodule_strategy == "lazy":
+            # The misc workspace is never built by robot_folders, so there is nothing to
+            # defer the submodule initialization to.
+            self.clone_options = copy.copy(self.clone_options)
+            self.clone_options.submodule_strategy = "parallel"
 
         self.create_build_folders()
         self.add_rosinstall(rosinstall)
 
     def add_rosinstall(self, rosinstall):
-        if rosinstall:
-            # Dump the rosinstall to a file and use vcstool for getting the packages
-            rosinstall_filename = "/tmp/rob_folders_rosinstall"
-            with open(rosinstall_filename, "w") as rosinstall_content:
-                yaml_dump(rosinstall, rosinstall_content)
-
-            os.makedirs(self.misc_ws_directory, exist_ok=True)
-            if self.no_submodules:
-                process = subprocess.check_call(
-                    ["vcs", "import", "--input", rosinstall_filename, "."],
-                    cwd=self.misc_ws_directory,
-                )
-            else:
-                process = subprocess.check_call(
-                    [
-                        "vcs",
-                        "import",
-                        "--recursive",
-                        "--input",
-                        rosinstall_filename,
-                        ".",
-                    ],
-                    cwd=self.misc_ws_directory,
-                )
-
-            os.remove(rosinstall_filename)
+        import_missing(rosinstall, self.misc_ws_directory, self.clone_options)
 
     def create_build_folders(self):
         """
@@ -91,9 +206,9 @@ class MiscCreator(object):
         local_export_dir_name = os.path.join(self.misc_ws_directory, "export")
 
         if local_export_dir_name != export_directory:
-            os.symlink(export_directory, local_export_dir_name)
+            symlink_p(export_directory, local_export_dir_name)
 
-        os.makedirs(export_directory)
+        os.makedirs(export_directory, exist_ok=True)
 
 
 class CatkinCreator(object):
@@ -108,23 +223,33 @@ class CatkinCreator(object):
         rosinstall,
         copy_cmake_lists="ask",
         ros_distro="ask",
-        no_submodules=False,
+        clone_options=None,
     ):
         self.catkin_directory = catkin_directory
         self.build_directory = build_directory
         self.copy_cmake_lists = copy_cmake_lists
         self.ros_distro = ros_distro
         self.rosinstall = rosinstall
-        self.no_submodules = no_submodules
+        self.clone_options = clone_options or CloneOptions()
 
         self.ask_questions()
         self.ros_global_dir = "/opt/ros/{}".format(self.ros_distro)
 
     def create(self):
-        self.create_catkin_skeleton()
-        self.build()
-        self.clone_packages(self.rosinstall)
-
+        for _, step in self.steps():
+            step()
+
+    def steps(self):
+        """Returns the steps of creating the workspace as tuples of a name and a function"""
+        return [
+            ("skeleton", self.create_catkin_skeleton),
+            ("initial build", self.build),
+            ("clone", functools.partial(self.clone_packages, self.rosinstall)),
+            ("CMakeLists.txt", self.copy_toplevel_cmake_lists),
+        ]
+
+    def copy_toplevel_cmake_lists(self):
+        """Replaces the CMakeLists.txt symlink in the src folder by a copy, if requested"""
         if self.copy_cmake_lists:
             if os.path.exists(
                 os.path.join(self.catkin_directory, "src", "CMakeLists.txt")
@@ -189,9 +314,9 @@ class CatkinCreator(object):
         no_backup)
         """
         # Create directories and symlinks, if necessary
-        os.mkdir(self.catkin_directory)
-        os.mkdir(os.path.join(self.catkin_directory, "src"))
-        os.makedirs(self.build_directory)
+        os.makedirs(self.catkin_directory, exist_ok=True)
+        os.makedirs(os.path.join(self.catkin_directory, "src"), exist_ok=True)
+        os.makedirs(self.build_directory, exist_ok=True)
 
         local_build_dir_name = os.path.join(self.catkin_directory, "build")
         (catkin_base_dir, _) = os.path.split(self.build_directory)
@@ -205,43 +330,21 @@ class CatkinCreator(object):
         click.echo("install_dir: {}".format(catkin_install_directory))
 
         if local_build_dir_name != self.build_directory:
-            os.symlink(self.build_directory, local_build_dir_name)
-            os.makedirs(catkin_devel_directory)
-            os.symlink(catkin_devel_directory, local_devel_dir_name)
-            os.makedirs(catkin_install_directory)
-            os.symlink(catkin_install_directory, local_install_dir_name)
+            symlink_p(self.build_directory, local_build_dir_name)
+            os.makedirs(catkin_devel_directory, exist_ok=True)
+            symlink_p(catkin_devel_directory, local_devel_dir_name)
+            os.makedirs(catkin_install_directory, exist_ok=True)
+            symlink_p(catkin_install_directory, local_install_dir_name)
 
     def clone_packages(self, rosinstall):
         """
         Clone in packages froma rosinstall structure
         """
-        # copy packages
-        if rosinstall != "":
-            # Dump the rosinstall to a file and use vcstools for getting the packages
-            rosinstall_filename = "/tmp/rob_folders_rosinstall"
-            with open(rosinstall_filename, "w") as rosinstall_content:
-                yaml_dump(rosinstall, rosinstall_content)
-
-            os.makedirs(os.path.join(self.catkin_directory, "src"), exist_ok=True)
-            if self.no_submodules:
-                process = subprocess.check_call(
-                    ["vcs", "import", "--input", rosinstall_filename, "src"],
-                    cwd=self.catkin_directory,
-                )
-            else:
-                process = subprocess.check_call(
-                    [
-                        "vcs",
-                        "import",
-                        "--recursive",
-                        "--input",
-                        rosinstall_filename,
-                        "src",
-                    ],
-                    cwd=self.catkin_directory,
-                )
-
-            os.remove(rosinstall_filename)
+        import_missing(
+            rosinstall,
+            os.path.join(self.catkin_directory, "src"),
+            self.clone_options,
+        )
 
 
 class ColconCreator(object):
@@ -255,21 +358,28 @@ class ColconCreator(object):
         build_directory,
         rosinstall,
         ros2_distro="ask",
-        no_submodules=False,
+        clone_options=None,
     ):
         self.colcon_directory = colcon_directory
         self.build_directory = build_directory
         self.ros2_distro = ros2_distro
         self.rosinstall = rosinstall
-        self.no_submodules = no_submodules
+        self.clone_options = clone_options or CloneOptions()
 
         self.ask_questions()
 
     def create(self):
         """Actually creates the workspace"""
-        self.create_colcon_skeleton()
-        self.build()
-        self.clone_packages(self.rosinstall)
+        for _, step in self.steps():
+            step()
+
+    def steps(self):
+        """Returns the steps of creating the workspace as tuples of a name and a function"""
+        return [
+            ("skeleton", self.create_colcon_skeleton),
+            ("initial build", self.build),
+            ("clone", functools.partial(self.clone_packages, self.rosinstall)),
+        ]
 
     def ask_questions(self):
         """
@@ -307,9 +417,9 @@ class ColconCreator(object):
         no_backup)
         """
         # Create directories and symlinks, if necessary
-        os.mkdir(self.colcon_directory)
-        os.mkdir(os.path.join(self.colcon_directory, "src"))
-        os.makedirs(self.build_directory)
+        os.makedirs(self.colcon_directory, exist_ok=True)
+        os.makedirs(os.path.join(self.colcon_directory, "src"), exist_ok=True)
+        os.makedirs(self.build_directory, exist_ok=True)
 
         local_build_dir_name = os.path.join(self.colcon_directory, "build")
         (colcon_base_dir, _) = os.path.split(self.build_directory)
@@ -323,40 +433,18 @@ class ColconCreator(object):
         click.echo("install_dir: {}".format(colcon_install_directory))
 
         if local_build_dir_name != self.build_directory:
-            os.symlink(self.build_directory, local_build_dir_name)
-            os.makedirs(colcon_log_directory)
-            os.symlink(colcon_log_directory, local_log_dir_name)
-            os.makedirs(colcon_install_directory)
-            os.symlink(colcon_install_directory, local_install_dir_name)
+            symlink_p(self.build_directory, local_build_dir_name)
+            os.makedirs(colcon_log_directory, exist_ok=True)
+            symlink_p(colcon_log_directory, local_log_dir_name)
+            os.makedirs(colcon_install_directory, exist_ok=True)
+            symlink_p(colcon_install_directory, local_install_dir_name)
 
     def clone_packages(self, rosinstall):
         """
         Clone packages from rosinstall structure
         """
-        # copy packages
-        if rosinstall != "":
-            # Dump the rosinstall to a file and use vcstool for getting the packages
-            rosinstall_filename = "/tmp/rob_folders_rosinstall"
-            with open(rosinstall_filename, "w") as rosinstall_content:
-                yaml_dump(rosinstall, rosinstall_content)
-
-            os.makedirs(os.path.join(self.colcon_directory, "src"), exist_ok=True)
-            if self.no_submodules:
-                process = subprocess.check_call(
-                    ["vcs", "import", "--input", rosinstall_filename, "src"],
-                    cwd=self.colcon_directory,
-                )
-            else:
-                process = subprocess.check_call(
-                    [
-                        "vcs",
-                        "import",
-                        "--recursive",
-                        "--input",
-                        rosinstall_filename,
-                        "src",
-                    ],
-                    cwd=self.colcon_directory,
-                )
-
-            os.remove(rosinstall_filename)
+        import_missing(
+            rosinstall,
+            os.path.join(self.colcon_directory, "src"),
+            self.clone_options,
+        )
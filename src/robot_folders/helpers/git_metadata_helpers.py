@@ -0,0 +1,308 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module reads the metadata of git repositories (HEAD, refs, config) directly from the files
+inside the git directory. This is a lot faster than spawning git or loading GitPython for every
+repository. Repositories using features that are not supported here raise an
+UnsupportedRepository exception, so callers can fall back to GitPython.
+"""
+import os
+import re
+
+
+class UnsupportedRepository(Exception):
+    """Raised when a repository cannot be read without the help of git"""
+
+
+def resolve_git_dirs(repo_path):
+    """
+    Returns a tuple of the git directory of the worktree at repo_path and the common git
+    directory shared by all worktrees. Follows 'gitdir:' files as used by linked worktrees
+    and submodules.
+    """
+    git_dir = os.path.join(repo_path, ".git")
+    if os.path.isfile(git_dir):
+        with open(git_dir) as git_file:
+            content = git_file.read().strip()
+        if not content.startswith("gitdir:"):
+            raise UnsupportedRepository("Invalid .git file in {}".format(repo_path))
+        git_dir = os.path.join(repo_path, content[len("gitdir:") :].strip())
+    if not os.path.isdir(git_dir):
+        raise UnsupportedRepository("No git directory found in {}".format(repo_path))
+    git_dir = os.path.normpath(git_dir)
+
+    common_dir = git_dir
+    commondir_file = os.path.join(git_dir, "commondir")
+    if os.path.isfile(commondir_file):
+        with open(commondir_file) as in_file:
+            common_dir = os.path.normpath(os.path.join(git_dir, in_file.read().strip()))
+    return git_dir, common_dir
+
+
+def read_alternates(common_dir):
+    """Returns the real paths of the object directories a repository borrows objects from,
+    e.g. because it has been cloned using --shared or --reference"""
+    objects_dir = os.path.join(common_dir, "objects")
+    try:
+        with open(os.path.join(objects_dir, "info", "alternates")) as in_file:
+            lines = in_file.read().splitlines()
+    except IOError:
+        return list()
+    return [
+        os.path.realpath(os.path.join(objects_dir, line.strip()))
+        for line in lines
+        if line.strip() and not line.startswith("#")
+    ]
+
+
+def _parse_value(value):
+    """Parses a config value, handling quotes, escapes and trailing comments"""
+    result = list()
+    in_quotes = False
+    index = 0
+    while index < len(value):
+        char = value[index]
+        if char == "\\" and index + 1 < len(value):
+            index += 1
+            result.append(
+                {"n": "\n", "t": "\t", "b": "\b"}.get(value[index], value[index])
+            )
+        elif char == '"':
+            in_quotes = not in_quotes
+        elif char in "#;" and not in_quotes:
+            break
+        else:
+            result.append(char)
+        index += 1
+    return "".join(result).strip()
+
+
+def parse_config(path):
+    """
+    Parses a git config file. Returns a list of tuples (section, subsection, key, value) in
+    the order of the file. Section and key names are lower case, subsections keep their case.
+    Keys without a value get the value None.
+    """
+    entries = list()
+    if not os.path.isfile(path):
+        return entries
+    with open(path) as config_file:
+        lines = config_file.read().splitlines()
+
+    section = None
+    subsection = None
+    line_iter = iter(lines)
+    for line in line_iter:
+        line = line.strip()
+        # Join continuation lines
+        while line.endswith("\\") and not line.endswith("\\\\"):
+            line = line[:-1] + next(line_iter, "").strip()
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("["):
+            match = re.match(
+                r'^\[\s*([\w.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\](.*)$', line
+            )
+            if match is None:
+                raise UnsupportedRepository("Cannot parse config line {}".format(line))
+            section = match.group(1).lower()
+            subsection = None
+            if match.group(2) is not None:
+                subsection = re.sub(r"\\(.)", r"\1", match.group(2))
+            elif "." in section:
+                # Deprecated [section.subsection] syntax
+                section, subsection = section.split(".", 1)
+            line = match.group(3).strip()
+            if not line or line[0] in "#;":
+                continue
+        if section is None:
+            raise UnsupportedRepository("Config entry outside of a section")
+        if section in ("include", "includeif"):
+            raise UnsupportedRepository("Config includes are not supported")
+        key, sep, value = line.partition("=")
+        entries.append(
+            (
+                section,
+                subsection,
+                key.strip().lower(),
+                _parse_value(value) if sep else None,
+            )
+        )
+    return entries
+
+
+class GitMetadata(object):
+    """Reads HEAD, refs, remotes and config of a repository from the git directory"""
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.git_dir, self.common_dir = resolve_git_dirs(repo_path)
+        self.config = parse_config(os.path.join(self.common_dir, "config"))
+        if self.get_bool("extensions", None, "worktreeconfig", False):
+            self.config.extend(
+                parse_config(os.path.join(self.git_dir, "config.worktree"))
+            )
+        if self.get_all("extensions", None, "refstorage") not in ([], ["files"]):
+            raise UnsupportedRepository("Only the files ref storage is supported")
+        self._packed_refs = None
+
+    def get_all(self, section, subsection, key):
+        """Returns all values of the given config key in the order of the config files"""
+        return [
+            entry[3]
+            for entry in self.config
+            if entry[:3] == (section.lower(), subsection, key.lower())
+        ]
+
+    def get(self, section, subsection, key, default=None):
+        """Returns the last value of the given config key or default if it is not set"""
+        values = self.get_all(section, subsection, key)
+        return values[-1] if values else default
+
+    def get_bool(self, section, subsection, key, default=False):
+        """Returns the given config key interpreted as boolean"""
+        values = self.get_all(section, subsection, key)
+        if not values:
+            return default
+        if values[-1] is None:
+            return True
+        return values[-1].lower() in ("true", "yes", "on", "1")
+
+    def remotes(self):
+        """Returns a list of tuples of the name and the URLs of all remotes"""
+        names = list()
+        for section, subsection, key, _ in self.config:
+            if section == "remote" and key == "url" and subsection not in names:
+                names.append(subsection)
+        return [(name, self.get_all("remote", name, "url")) for name in names]
+
+    def upstream(self, branch):
+        """Returns a tuple of the remote and merge ref tracked by branch or None"""
+        remote = self.get("branch", branch, "remote")
+        merge = self.get("branch", branch, "merge")
+        if remote is None or merge is None:
+            return None
+        return remote, merge
+
+    def _read_head(self):
+        """Returns the content of HEAD, which is either a commit id or 'ref: <ref>'"""
+        with open(os.path.join(self.git_dir, "HEAD")) as head_file:
+            return head_file.read().strip()
+
+    def active_branch(self):
+        """Returns the name of the checked out branch or None if HEAD is detached"""
+        head = self._read_head()
+        if head.startswith("ref: refs/heads/"):
+            return head[len("ref: refs/heads/") :]
+        if re.match(r"^[0-9a-f]{40}([0-9a-f]{24})?$", head):
+            return None
+        raise UnsupportedRepository("Cannot interpret HEAD {}".format(head))
+
+    def packed_refs(self):
+        """Returns a dict of all refs in the packed-refs file"""
+        if self._packed_refs is None:
+            self._packed_refs = dict()
+            path = os.path.join(self.common_dir, "packed-refs")
+            if os.path.isfile(path):
+                with open(path) as packed_file:
+                    for line in packed_file:
+                        if line.startswith(("#", "^")):
+                            continue
+                        parts = line.split()
+                        if len(parts) == 2:
+                            self._packed_refs[parts[1]] = parts[0]
+        return self._packed_refs
+
+    def resolve_ref(self, ref):
+        """Resolves a ref like 'refs/heads/main' to a commit id. Returns None if it does
+        not exist."""
+        for _ in range(10):
+            path = os.path.join(self.common_dir, ref)
+            if os.path.isfile(path):
+                with open(path) as ref_file:
+                    value = ref_file.read().strip()
+            else:
+                value = self.packed_refs().get(ref)
+                if value is None:
+                    return None
+            if not value.startswith("ref: "):
+                return value
+            ref = value[len("ref: ") :]
+        raise UnsupportedRepository("Too many symbolic refs for {}".format(ref))
+
+    def head_commit(self):
+        """Returns the commit id HEAD points to"""
+        branch = self.active_branch()
+        if branch is None:
+            return self._read_head()
+        commit = self.resolve_ref("refs/heads/" + branch)
+        if commit is None:
+            raise UnsupportedRepository("Branch {} has no commits".format(branch))
+        return commit
+
+
+class GitPythonMetadata(object):
+    """Provides the interface of GitMetadata using GitPython for repositories that cannot be
+    read directly"""
+
+    def __init__(self, repo_path):
+        import git
+
+        self.repo = git.Repo(repo_path)
+
+    def remotes(self):
+        """Returns a list of tuples of the name and the URLs of all remotes"""
+        return [(remote.name, list(remote.urls)) for remote in self.repo.remotes]
+
+    def upstream(self, branch):
+        """Returns a tuple of the remote and merge ref tracked by branch or None"""
+        tracking = self.repo.heads[branch].tracking_branch()
+        if tracking is None:
+            return None
+        return tracking.remote_name, "refs/heads/" + tracking.remote_head
+
+    def active_branch(self):
+        """Returns the name of the checked out branch or None if HEAD is detached"""
+        if self.repo.head.is_detached:
+            return None
+        return self.repo.active_branch.name
+
+    def head_commit(self):
+        """Returns the commit id HEAD points to"""
+        return self.repo.head.commit.hexsha
+
+    def get_bool(self, section, subsection, key, default=False):
+        """Returns the given config key interpreted as boolean"""
+        name = section if subsection is None else '{} "{}"'.format(section, subsection)
+        return self.repo.config_reader().get_value(name, key, default)
+
+
+def read_with_fallback(repo_path, reader):
+    """
+    Calls reader with a GitMetadata of the repository at repo_path and returns its result.
+    If the repository cannot be read from the files directly, reader is called with a
+    GitPythonMetadata instead.
+    """
+    try:
+        return reader(GitMetadata(repo_path))
+    except (UnsupportedRepository, IOError, UnicodeDecodeError):
+        return reader(GitPythonMetadata(repo_path))
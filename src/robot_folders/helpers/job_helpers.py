@@ -0,0 +1,65 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Helpers for running robot_folders jobs in separate processes and reporting their results
+"""
+import sys
+
+import click
+
+
+def rob_folders_command(*args):
+    """Returns the command line for running robot_folders with the given arguments in a new
+    process using the current python interpreter"""
+    return [sys.executable, "-m", "robot_folders.main"] + list(args)
+
+
+def format_duration(seconds):
+    """Formats a duration given in seconds as human readable string"""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    if minutes:
+        return "{}m{:02d}s".format(minutes, seconds)
+    return "{}s".format(seconds)
+
+
+def format_size(num_bytes):
+    """Formats a number of bytes as human readable string"""
+    if abs(num_bytes) < 1024:
+        return "{} B".format(int(num_bytes))
+    size = float(num_bytes)
+    for unit in ["KiB", "MiB", "GiB"]:
+        size /= 1024
+        if abs(size) < 1024:
+            return "{:.1f} {}".format(size, unit)
+    return "{:.1f} TiB".format(size / 1024)
+
+
+def echo_table(headers, rows):
+    """Prints rows of strings as table with aligned columns"""
+    widths = [len(header) for header in headers]
+    for row in rows:
+        widths = [max(width, len(str(cell))) for width, cell in zip(widths, row)]
+    line_format = "  ".join("{{:<{}}}".format(width) for width in widths)
+    click.echo(line_format.format(*headers).rstrip())
+    click.echo("  ".join("-" * width for width in widths))
+    for row in rows:
+        click.echo(line_format.format(*[str(cell) for cell in row]).rstrip())
@@ -0,0 +1,186 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Helpers for running robot_folders operations concurrently using advisory file locks
+"""
+import fcntl
+import os
+import threading
+import time
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.exceptions import ModuleException
+
+
+LOCK_DIR_NAME = ".locks"
+CHECKOUT_LOCK_NAME = ".checkout.lock"
+
+
+def get_lock_timeout():
+    """Returns the lock timeout in seconds set through ROB_FOLDERS_LOCK_TIMEOUT or None, if
+    locks should be waited for forever"""
+    timeout = os.environ.get("ROB_FOLDERS_LOCK_TIMEOUT")
+    if timeout is None or timeout == "":
+        return None
+    return float(timeout)
+
+
+class FileLock(object):
+    """Advisory lock on a file using flock. Can be used as a context manager.
+
+    Locks are reentrant within one thread, so nested operations on the same environment do
+    not block each other, while other threads wait just like other processes. A timeout of
+    None waits forever, a timeout of 0 fails immediately if the lock is taken.
+    """
+
+    # Locks held by the current thread: path -> [file object, shared, count]
+    _local = threading.local()
+
+    @classmethod
+    def held_locks(cls):
+        """Returns the locks held by the current thread"""
+        if not hasattr(cls._local, "held"):
+            cls._local.held = dict()
+        return cls._local.held
+
+    def __init__(self, path, shared=False, timeout=None, description=None):
+        self.path = os.path.abspath(path)
+        self.shared = shared
+        self.timeout = timeout
+        self.description = description or self.path
+
+    def acquire(self):
+        """Takes the lock, waiting for other processes holding it"""
+        if self.path in FileLock.held_locks():
+            held = FileLock.held_locks()[self.path]
+            if held[1] and not self.shared:
+                raise ModuleException(
+                    "Cannot upgrade shared lock on {}".format(self.description),
+                    "lock",
+                )
+            held[2] += 1
+            return
+
+        dir_helpers.mkdir_p(os.path.dirname(self.path))
+        lock_file = open(self.path, "a")
+        operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        start = time.time()
+        waiting = False
+        while True:
+            try:
+                fcntl.flock(lock_file.fileno(), operation | fcntl.LOCK_NB)
+                if self.is_current(lock_file):
+                    break
+                # The holder removed the lock file before releasing it
+                lock_file.close()
+                lock_file = open(self.path, "a")
+                continue
+            except BlockingIOError:
+                if self.timeout is not None and time.time() - start >= self.timeout:
+                    lock_file.close()
+                    raise ModuleException(
+                        "Timed out waiting for {} after {:.0f}s".format(
+                            self.description, self.timeout
+                        ),
+                        "lock",
+                    )
+                if not waiting:
+                    click.echo(
+                        "Waiting for {}, which is used by another process".format(
+                            self.description
+                        ),
+                        err=True,
+                    )
+                    waiting = True
+                time.sleep(0.1)
+        FileLock.held_locks()[self.path] = [lock_file, self.shared, 1]
+
+    def is_current(self, lock_file):
+        """Checks whether lock_file is still the file at the lock's path"""
+        try:
+            return os.path.samestat(os.fstat(lock_file.fileno()), os.stat(self.path))
+        except OSError:
+            return False
+
+    def release(self):
+        """Releases the lock once all nested acquisitions are released"""
+        held = FileLock.held_locks()[self.path]
+        held[2] -= 1
+        if held[2] == 0:
+            del FileLock.held_locks()[self.path]
+            fcntl.flock(held[0].fileno(), fcntl.LOCK_UN)
+            held[0].close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class EnvironmentLock(object):
+    """Locks an environment. Holds a shared checkout-level lock at the same time, so
+    operations spanning all environments can lock out all environment operations."""
+
+    def __init__(self, env_name, shared=False, timeout=None):
+        if timeout is None:
+            timeout = get_lock_timeout()
+        lock_dir = os.path.join(dir_helpers.get_checkout_dir(), LOCK_DIR_NAME)
+        self.checkout_lock = FileLock(
+            os.path.join(lock_dir, CHECKOUT_LOCK_NAME),
+            shared=True,
+            timeout=timeout,
+            description="the checkout directory",
+        )
+        self.env_lock = FileLock(
+            os.path.join(lock_dir, "{}.lock".format(env_name)),
+            shared=shared,
+            timeout=timeout,
+            description="environment '{}'".format(env_name),
+        )
+
+    def __enter__(self):
+        self.checkout_lock.acquire()
+        try:
+            self.env_lock.acquire()
+        except BaseException:
+            self.checkout_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.env_lock.release()
+        self.checkout_lock.release()
+
+
+def checkout_lock(timeout=None):
+    """Returns an exclusive lock on the whole checkout directory"""
+    if timeout is None:
+        timeout = get_lock_timeout()
+    return FileLock(
+        os.path.join(dir_helpers.get_checkout_dir(), LOCK_DIR_NAME, CHECKOUT_LOCK_NAME),
+        timeout=timeout,
+        description="the checkout directory",
+    )
@@ -0,0 +1,176 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module implements a local cache of bare git mirrors that is shared by all environments
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+
+import click
+
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.cache_helpers import get_cache_dir
+from robot_folders.helpers.lock_helpers import FileLock, get_lock_timeout
+
+
+def get_mirror_dir():
+    """Get the directory where git mirrors are stored from the userconfig"""
+    mirror_config = config_helpers.get_value_safe(
+        "directories", "mirror_dir", debug=False
+    )
+    if mirror_config == "" or mirror_config is None:
+        mirror_config = os.path.join(get_cache_dir(), "mirrors")
+    return os.path.expanduser(mirror_config)
+
+
+def normalize_uri(uri):
+    """Strips trailing slashes and '.git' suffixes so that equivalent URIs share a mirror"""
+    normalized = uri.strip().rstrip("/")
+    if normalized.endswith(".git"):
+        normalized = normalized[: -len(".git")]
+    return normalized
+
+
+class MirrorCache(object):
+    """Manages bare mirror repositories keyed by their remote URI"""
+
+    def __init__(self, mirror_dir=None):
+        if mirror_dir is None:
+            mirror_dir = get_mirror_dir()
+        self.mirror_dir = mirror_dir
+
+    def mirror_path(self, uri):
+        """Returns the path of the mirror belonging to the given URI"""
+        normalized = normalize_uri(uri)
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+        name = os.path.basename(normalized) or "repo"
+        return os.path.join(self.mirror_dir, "{}-{}.git".format(name, digest))
+
+    def has_mirror(self, uri):
+        """Checks whether a mirror for the given URI exists already"""
+        return os.path.isdir(self.mirror_path(uri))
+
+    def update(self, uri):
+        """Creates or updates the mirror for the given URI and returns its path.
+
+        An existing mirror is updated with a single fetch. New mirrors are cloned into a
+        temporary location first, so an interrupted clone never leaves a broken mirror behind.
+        """
+        path = self.mirror_path(uri)
+        with self.lock(path):
+            if os.path.isdir(path):
+                click.echo("Updating mirror of {}".format(uri))
+                subprocess.check_call(
+                    ["git", "--git-dir", path, "fetch", "--prune", "--quiet", "origin"]
+                )
+            else:
+                click.echo("Creating mirror of {}".format(uri))
+                tmp_path = path + ".tmp"
+                if os.path.exists(tmp_path):
+                    shutil.rmtree(tmp_path)
+                subprocess.check_call(
+                    ["git", "clone", "--mirror", "--quiet", uri, tmp_path]
+                )
+                # Allow shallow and partial clones from the mirror
+                for key in ["uploadpack.allowFilter", "uploadpack.allowAnySHA1InWant"]:
+                    subprocess.check_call(
+                        ["git", "--git-dir", tmp_path, "config", key, "true"]
+                    )
+                os.rename(tmp_path, path)
+        return path
+
+    def lock(self, path):
+        """Returns a lock guarding the mirror at path against concurrent updates"""
+        return FileLock(
+            path + ".lock",
+            timeout=get_lock_timeout(),
+            description="mirror {}".format(os.path.basename(path)),
+        )
+
+    def list_mirrors(self):
+        """Returns a dict mapping all existing mirror paths to their remote URI"""
+        mirrors = dict()
+        if not os.path.isdir(self.mirror_dir):
+            return mirrors
+        for entry in sorted(os.listdir(self.mirror_dir)):
+            path = os.path.join(self.mirror_dir, entry)
+            if not entry.endswith(".git") or not os.path.isdir(path):
+                continue
+            try:
+                uri = subprocess.check_output(
+                    ["git", "--git-dir", path, "config", "--get", "remote.origin.url"],
+                    universal_newlines=True,
+                ).strip()
+            except subprocess.CalledProcessError:
+                uri = None
+            mirrors[path] = uri
+        return mirrors
+
+    def update_all(self):
+        """Fetches all existing mirrors. Returns a list of URIs that failed to update."""
+        failed = list()
+        for path, uri in self.list_mirrors().items():
+            if uri is None:
+                click.echo("Skipping mirror without origin: {}".format(path))
+                continue
+            try:
+                self.update(uri)
+            except subprocess.CalledProcessError:
+                click.echo("Failed to update mirror of {}".format(uri))
+                failed.append(uri)
+        return failed
+
+    def gc(self, used_uris=None):
+        """Removes mirrors whose URI is not in used_uris and compacts the remaining ones.
+
+        If used_uris is None, no mirror is removed. Returns the list of removed mirror paths.
+        """
+        removed = list()
+        used_paths = None
+        if used_uris is not None:
+            used_paths = set(self.mirror_path(uri) for uri in used_uris)
+        for path in self.list_mirrors():
+            if used_paths is not None and path not in used_paths:
+                click.echo("Removing unused mirror {}".format(path))
+                with self.lock(path):
+                    shutil.rmtree(path)
+                removed.append(path)
+            else:
+                subprocess.check_call(
+                    ["git", "--git-dir", path, "gc", "--auto", "--quiet"]
+                )
+        return removed
+
+    def redirect_rosinstall(self, rosinstall):
+        """Updates the mirrors of all git entries and returns a copy of the rosinstall with the
+        URIs pointing to the mirrors."""
+        redirected = list()
+        for repo in rosinstall:
+            if "git" in repo and "uri" in repo["git"]:
+                entry = dict(repo["git"])
+                entry["uri"] = self.update(entry["uri"])
+                redirected.append({"git": entry})
+            else:
+                redirected.append(repo)
+        return redirected
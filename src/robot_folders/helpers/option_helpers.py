@@ -29,3 +29,34 @@ class SwallowAllOption(click.Option):
                 our_parser.process = parser_process
                 break
         return retval
+
+
+class MultipleValuesOption(click.Option):
+    """Option that takes all values after it up to the next option, e.g.
+    '--packages pkg_a pkg_b'"""
+
+    def __init__(self, *args, **kwargs):
+        nargs = kwargs.pop("nargs", -1)
+
+        if nargs != -1:
+            raise ValueError("nargs has to be -1")
+
+        kwargs.setdefault("type", click.UNPROCESSED)
+        kwargs.setdefault("default", ())
+        super(MultipleValuesOption, self).__init__(*args, **kwargs)
+
+    def add_to_parser(self, parser, ctx):
+        def parser_process(value, state):
+            values = [value]
+            while state.rargs and not state.rargs[0].startswith("-"):
+                values.append(state.rargs.pop(0))
+            self._previous_parser_process(tuple(values), state)
+
+        retval = super(MultipleValuesOption, self).add_to_parser(parser, ctx)
+        for name in self.opts:
+            our_parser = parser._long_opt.get(name) or parser._short_opt.get(name)
+            if our_parser:
+                self._previous_parser_process = our_parser.process
+                our_parser.process = parser_process
+                break
+        return retval
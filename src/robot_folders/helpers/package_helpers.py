@@ -0,0 +1,114 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module contains helper functions for finding the ROS packages of a workspace and their
+dependencies by reading their package.xml files
+"""
+import os
+import xml.etree.ElementTree as ElementTree
+
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.repository_helpers import IGNORE_MARKERS
+
+PACKAGE_FILENAME = "package.xml"
+# Tags of all package.xml formats declaring a dependency on another package
+DEPENDENCY_TAGS = [
+    "depend",
+    "build_depend",
+    "build_export_depend",
+    "buildtool_depend",
+    "buildtool_export_depend",
+    "exec_depend",
+    "run_depend",
+    "test_depend",
+    "doc_depend",
+]
+
+
+def parse_package_xml(path):
+    """Returns the name of the package described by a package.xml file and the names of all
+    packages it depends on. Conditional dependencies are always included."""
+    try:
+        root = ElementTree.parse(path).getroot()
+    except (ElementTree.ParseError, IOError) as err:
+        raise ModuleException("Cannot read {}: {}".format(path, err), "packages")
+    name = root.findtext("name")
+    if not name:
+        raise ModuleException("{} does not contain a name".format(path), "packages")
+    dependencies = set()
+    for tag in DEPENDENCY_TAGS:
+        for element in root.findall(tag):
+            if element.text and element.text.strip():
+                dependencies.add(element.text.strip())
+    return name.strip(), dependencies
+
+
+def find_packages(src_dir):
+    """
+    Returns a dict mapping the name of every package inside src_dir to its path and its
+    dependencies. Like colcon and catkin, the search does not descend into packages, hidden
+    folders and folders containing an ignore marker.
+    """
+    packages = dict()
+    for root, dirs, files in os.walk(src_dir, followlinks=True):
+        if any(marker in files for marker in IGNORE_MARKERS):
+            dirs[:] = []
+            continue
+        if PACKAGE_FILENAME in files:
+            dirs[:] = []
+            name, dependencies = parse_package_xml(os.path.join(root, PACKAGE_FILENAME))
+            packages[name] = (root, dependencies)
+            continue
+        dirs[:] = sorted(folder for folder in dirs if not folder.startswith("."))
+    return packages
+
+
+def get_packages_above(names, packages):
+    """Returns the given packages together with all packages recursively depending on them"""
+    dependents = dict()
+    for name, (_, dependencies) in packages.items():
+        for dependency in dependencies:
+            dependents.setdefault(dependency, set()).add(name)
+    selected = set()
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependents.get(name, set()))
+    return selected
+
+
+def select_packages(src_dir, names=(), names_above=()):
+    """Returns the sorted names of the given packages and the packages recursively depending
+    on the packages given as names_above. Unknown package names raise a ModuleException.
+    """
+    packages = find_packages(src_dir)
+    unknown = (set(names) | set(names_above)) - set(packages)
+    if unknown:
+        raise ModuleException(
+            "The following packages do not exist in {}: {}".format(
+                src_dir, ", ".join(sorted(unknown))
+            ),
+            "packages",
+        )
+    return sorted(set(names) | get_packages_above(names_above, packages))
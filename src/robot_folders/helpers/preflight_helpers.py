@@ -0,0 +1,121 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Helpers for checking an environment config before anything is cloned or built
+"""
+import concurrent.futures
+import subprocess
+
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.ConfigParser import WORKSPACE_SECTIONS
+from robot_folders.helpers.repository_helpers import is_commit_id
+from robot_folders.helpers.ssh_helpers import SshMultiplexer, get_batch_environment
+
+# Seconds to wait for a remote to answer
+REMOTE_TIMEOUT = 60
+
+
+def check_remote(uri, version=None):
+    """
+    Checks that the repository at uri can be reached and that version is one of its branches
+    or tags. Commit ids cannot be checked without fetching, so only the uri is checked for
+    them. Returns None if everything is fine or a description of the problem.
+    """
+    if version is None or is_commit_id(version):
+        patterns = ["HEAD"]
+    else:
+        patterns = [str(version)]
+    try:
+        process = subprocess.run(
+            ["git", "ls-remote", uri] + patterns,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            env=get_batch_environment(),
+            timeout=REMOTE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        return "{} did not answer within {} seconds".format(uri, REMOTE_TIMEOUT)
+    if process.returncode != 0:
+        lines = process.stderr.strip().splitlines()
+        return "Cannot access {}: {}".format(
+            uri, lines[-1] if lines else "unknown error"
+        )
+    if patterns == ["HEAD"]:
+        return None
+    refs = [line.split("\t")[-1] for line in process.stdout.splitlines()]
+    for ref in ["refs/heads/{}".format(version), "refs/tags/{}".format(version)]:
+        if ref in refs:
+            return None
+    return "Version '{}' does not exist in {}".format(version, uri)
+
+
+def get_remote_checks(parser):
+    """Returns a list of tuples (workspace section, local name, uri, version) of all git
+    repositories in the config that are cloned from a remote"""
+    checks = list()
+    for section in WORKSPACE_SECTIONS:
+        rosinstall = (parser.data.get(section) or dict()).get("rosinstall") or list()
+        for repo in rosinstall:
+            entry = repo.get("git")
+            # Bundled repositories are cloned without accessing the remote
+            if entry is None or "bundle" in entry:
+                continue
+            version = entry.get("version")
+            checks.append(
+                (
+                    section,
+                    entry["local-name"],
+                    entry["uri"],
+                    None if version is None else str(version),
+                )
+            )
+    return checks
+
+
+def run_preflight(parser, check_remotes=True, jobs=None):
+    """
+    Validates the config read by a ConfigFileParser and checks all remotes and versions of
+    its git repositories in parallel. Returns a list of all problems and a list of all
+    warnings found.
+    """
+    problems, warnings = parser.validate()
+    if problems or not check_remotes:
+        return problems, warnings
+    checks = get_remote_checks(parser)
+    if not checks:
+        return problems, warnings
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    with SshMultiplexer(batch=True), concurrent.futures.ThreadPoolExecutor(
+        max_workers=jobs
+    ) as executor:
+        results = list(
+            executor.map(lambda check: check_remote(check[2], check[3]), checks)
+        )
+    for (section, local_name, _, _), error in zip(checks, results):
+        if error is not None:
+            problems.append(
+                "{}: Repository '{}': {}".format(section, local_name, error)
+            )
+    return problems, warnings
@@ -22,62 +22,106 @@
 """
 This module contains helper functions around managing git repositories
 """
-import git
+import concurrent.futures
+import os
+import re
+import subprocess
+import threading
+
 import click
+from robot_folders.helpers import config_helpers
+import robot_folders.helpers.directory_helpers as dir_helpers
 from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.git_metadata_helpers import read_with_fallback
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+
+# Folders containing one of these files are skipped when searching for repositories
+IGNORE_MARKERS = ["COLCON_IGNORE", "CATKIN_IGNORE", "AMENT_IGNORE"]
+# Folders that never contain repositories belonging to a workspace
+SKIPPED_DIRS = [".git", "build", "devel", "install", "log"]
+
+# Repositories are inspected in parallel, but the user should be asked one question at a time
+PROMPT_LOCK = threading.Lock()
+
+
+def read_head(metadata, use_commit_id):
+    """
+    Reads the remotes, the active branch, the upstream of the active branch and (if the HEAD
+    is detached or use_commit_id is set) the commit id from a repository's metadata
+    """
+    branch = metadata.active_branch()
+    commit = None
+    if branch is None or use_commit_id:
+        commit = metadata.head_commit()
+    upstream = metadata.upstream(branch) if branch is not None else None
+    return metadata.remotes(), branch, upstream, commit
+
+
+def choose_remote(repo_path, remotes, branch, upstream):
+    """
+    Asks the user which of the given remotes should be used, defaulting to the remote of the
+    upstream branch. Returns the index of the chosen remote.
+    """
+    click.echo("Found multiple remotes for repo {}.".format(repo_path))
+    upstream_remote = None
+    if branch is not None:
+        if upstream is None:
+            raise ModuleException(
+                'Branch "{}" from repository "{}" does not have a tracking branch configured. Cannot scrape environment.'.format(
+                    branch, repo_path
+                ),
+                "repository_helpers",
+                1,
+            )
+
+        upstream_remote = upstream[0]
+    default = None
+    for index, (name, urls) in enumerate(remotes):
+        click.echo("{}: {} ({})".format(index, name, urls[0]))
+        if name == upstream_remote:
+            default = index
+    valid_choice = -1
+    while valid_choice < 0:
+        choice = click.prompt(
+            "Which one do you want to use?",
+            type=int,
+            default=default,
+            show_default=True,
+        )
+        if choice >= 0 and choice < len(remotes):
+            valid_choice = choice
+        else:
+            click.echo("Invalid choice: '{}'".format(choice))
+    click.echo(
+        "Selected remote {} ({})".format(remotes[choice][0], remotes[choice][1][0])
+    )
+    return choice
 
 
 def parse_repository(repo_path, use_commit_id):
     """
     Parses a repository path and returns the remote URL and the version (branch/commit)
     """
-    repo = git.Repo(repo_path)
-    remotes = repo.remotes
+    remotes, branch, upstream, commit = read_with_fallback(
+        repo_path, lambda metadata: read_head(metadata, use_commit_id)
+    )
+    if not remotes:
+        raise ModuleException(
+            'Repository "{}" does not have any remote configured.'.format(repo_path),
+            "repository_helpers",
+            1,
+        )
     choice = 0
 
-    detached_head = repo.head.is_detached
-
     if len(remotes) > 1:
-        click.echo("Found multiple remotes for repo {}.".format(repo_path))
-        upstream_remote = None
-        if not detached_head:
-            upstream_branch = repo.active_branch.tracking_branch()
-            if upstream_branch == None:
-                raise ModuleException(
-                    'Branch "{}" from repository "{}" does not have a tracking branch configured. Cannot scrape environment.'.format(
-                        repo.active_branch, repo_path
-                    ),
-                    "repository_helpers",
-                    1,
-                )
-
-            upstream_remote = upstream_branch.name.split("/")[0]
-        default = None
-        for index, remote in enumerate(remotes):
-            click.echo("{}: {} ({})".format(index, remote.name, remote.url))
-            if remote.name == upstream_remote:
-                default = index
-        valid_choice = -1
-        while valid_choice < 0:
-            choice = click.prompt(
-                "Which one do you want to use?",
-                type=int,
-                default=default,
-                show_default=True,
-            )
-            if choice >= 0 and choice < len(remotes):
-                valid_choice = choice
-            else:
-                click.echo("Invalid choice: '{}'".format(choice))
-        click.echo(
-            "Selected remote {} ({})".format(remotes[choice].name, remotes[choice].url)
-        )
-    url = remotes[choice].url
+        with PROMPT_LOCK:
+            choice = choose_remote(repo_path, remotes, branch, upstream)
+    url = remotes[choice][1][0]
 
-    if detached_head or use_commit_id:
-        version = repo.head.commit.hexsha
+    if branch is None or use_commit_id:
+        version = commit
     else:
-        version = repo.active_branch.name
+        version = branch
     return url, version
 
 
@@ -92,4 +136,368 @@ def create_rosinstall_entry(repo_path, local_name, use_commit_id=False):
     url, version = parse_repository(repo_path, use_commit_id)
     repo["git"]["uri"] = url
     repo["git"]["version"] = version
+
+    sparse_paths = get_sparse_paths(repo_path)
+    if sparse_paths is not None:
+        repo["git"]["sparse"] = sparse_paths
     return repo
+
+
+def get_sparse_paths(repo_path):
+    """
+    Returns the list of sparse checkout paths of a repository in cone mode or None, if the
+    repository does not use a sparse checkout
+    """
+
+    def get_config_flag(key, default):
+        output = subprocess.run(
+            ["git", "config", "--type=bool", "--get", key],
+            cwd=repo_path,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout.strip()
+        return output == "true" if output else default
+
+    # Most repositories do not use sparse checkouts, which can be told without running git
+    if not read_with_fallback(
+        repo_path, lambda metadata: metadata.get_bool("core", None, "sparsecheckout")
+    ):
+        return None
+    # Sparse checkout settings usually live in the worktree config, so ask git for them
+    if not get_config_flag("core.sparseCheckout", False):
+        return None
+    if not get_config_flag("core.sparseCheckoutCone", True):
+        click.echo(
+            "Repository {} uses a sparse checkout in non-cone mode. "
+            "Only cone mode is supported, so the full repository will be used.".format(
+                repo_path
+            )
+        )
+        return None
+    output = subprocess.check_output(
+        ["git", "sparse-checkout", "list"], cwd=repo_path, universal_newlines=True
+    )
+    return [path for path in output.splitlines() if path]
+
+
+def set_sparse_paths(repo_path, sparse_paths):
+    """
+    Restricts the working tree of a repository to the given paths using a sparse checkout
+    in cone mode
+    """
+    subprocess.check_call(
+        ["git", "sparse-checkout", "set", "--cone"] + list(sparse_paths), cwd=repo_path
+    )
+
+
+def get_remote_urls(repo_path):
+    """
+    Returns the URLs of all remotes configured for the repository at repo_path
+    """
+    remotes = read_with_fallback(repo_path, lambda metadata: metadata.remotes())
+    return [url for _, urls in remotes for url in urls]
+
+
+def get_submodules(repo_path):
+    """
+    Returns a list of tuples of the name and the path of all submodules declared in the
+    .gitmodules file of the repository at repo_path
+    """
+    if not os.path.isfile(os.path.join(repo_path, ".gitmodules")):
+        return []
+    try:
+        output = subprocess.check_output(
+            [
+                "git",
+                "config",
+                "--file",
+                ".gitmodules",
+                "--get-regexp",
+                r"^submodule\..*\.path$",
+            ],
+            cwd=repo_path,
+            universal_newlines=True,
+        )
+    except subprocess.CalledProcessError:
+        return []
+    submodules = list()
+    for line in output.splitlines():
+        key, path = line.split(" ", 1)
+        submodules.append((key[len("submodule.") : -len(".path")], path))
+    return submodules
+
+
+def get_upstream(repo_path, branch):
+    """
+    Returns a tuple of the remote name and the merge ref configured as upstream of the given
+    branch or None, if the branch does not track anything
+    """
+    upstream = list()
+    for key in ["remote", "merge"]:
+        try:
+            upstream.append(
+                subprocess.check_output(
+                    ["git", "config", "--get", "branch.{}.{}".format(branch, key)],
+                    cwd=repo_path,
+                    universal_newlines=True,
+                ).strip()
+            )
+        except subprocess.CalledProcessError:
+            return None
+    return tuple(upstream)
+
+
+def find_repositories(folder, nested=False):
+    """
+    Recursively searches folder for git repositories. Returns a sorted list of tuples
+    containing the path relative to folder and the absolute path of each repository.
+
+    The search does not descend into repositories unless nested is set, in which case
+    submodules are still skipped. Build artifacts and folders marked with one of the
+    IGNORE_MARKERS are skipped as well.
+    """
+    repos = list()
+    pending = [(folder, False)]
+    while pending:
+        path, in_repo = pending.pop()
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+        names = set(entry.name for entry in entries)
+        is_repo = False
+        if path != folder and ".git" in names:
+            if in_repo and os.path.isfile(os.path.join(path, ".git")):
+                # Submodules are handled by their parent repository
+                continue
+            is_repo = True
+            repos.append((os.path.relpath(path, folder), path))
+        if (is_repo and not nested) or names.intersection(IGNORE_MARKERS):
+            continue
+        for entry in entries:
+            if entry.name not in SKIPPED_DIRS and entry.is_dir(follow_symlinks=False):
+                pending.append((entry.path, in_repo or is_repo))
+    return sorted(repos)
+
+
+def find_environment_repositories(env_dir, workspaces=None, nested=False):
+    """
+    Finds the repositories of all workspaces inside the environment at env_dir. Returns a list
+    of tuples of the workspace key ('misc', 'ros' or 'colcon'), the path relative to the
+    workspace's source folder and the absolute path of each repository. If workspaces is
+    given, only the workspaces with these keys are searched.
+    """
+    repos = list()
+    for key, source_dir in sorted(dir_helpers.get_source_dirs(env_dir).items()):
+        if workspaces is None or key in workspaces:
+            for local_name, repo_path in find_repositories(source_dir, nested):
+                repos.append((key, local_name, repo_path))
+    return repos
+
+
+def collect_repositories(env_names):
+    """Returns the sorted paths of all repositories inside the given environments"""
+    repos = set()
+    for env_name in env_names:
+        env_dir = os.path.join(dir_helpers.get_checkout_dir(), env_name)
+        with EnvironmentLock(env_name, shared=True):
+            for _, _, repo_path in find_environment_repositories(env_dir):
+                repos.add(os.path.realpath(repo_path))
+    return sorted(repos)
+
+
+def inspect_repositories(folder, inspect, nested=False, jobs=None):
+    """
+    Finds all repositories inside folder (see find_repositories) and calls
+    inspect(local_name, repo_path) for each of them using a pool of jobs threads. Returns the
+    list of results sorted by local name.
+    """
+    repos = find_repositories(folder, nested)
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(lambda repo: inspect(*repo), repos))
+
+
+def get_repository_status(repo_path, untracked=True):
+    """
+    Queries the state of the working tree of a repository with a single 'git status' call.
+    Returns a dict containing the checked out 'branch' (None if HEAD is detached), the
+    'commit', the numbers of 'changed' and 'untracked' files and the number of commits
+    'ahead' and 'behind' of the upstream branch (both None without an upstream).
+    """
+    output = subprocess.check_output(
+        [
+            "git",
+            # Lets git remember which directories contain untracked files
+            "-c",
+            "core.untrackedCache=true",
+            "status",
+            "--porcelain=v2",
+            "--branch",
+            "--untracked-files={}".format("normal" if untracked else "no"),
+        ],
+        cwd=repo_path,
+        universal_newlines=True,
+    )
+    status = {
+        "branch": None,
+        "commit": None,
+        "changed": 0,
+        "untracked": 0,
+        "ahead": None,
+        "behind": None,
+    }
+    for line in output.splitlines():
+        if line.startswith("# branch.oid "):
+            commit = line.split(" ", 2)[2]
+            status["commit"] = commit if commit != "(initial)" else None
+        elif line.startswith("# branch.head "):
+            branch = line.split(" ", 2)[2]
+            status["branch"] = branch if branch != "(detached)" else None
+        elif line.startswith("# branch.ab "):
+            ahead, behind = line.split(" ")[2:4]
+            status["ahead"] = int(ahead)
+            status["behind"] = -int(behind)
+        elif line.startswith(("1 ", "2 ", "u ")):
+            status["changed"] += 1
+        elif line.startswith("? "):
+            status["untracked"] += 1
+    return status
+
+
+def is_commit_id(version):
+    """
+    Checks whether a version string looks like a (possibly abbreviated) commit id
+    """
+    return re.match(r"^[0-9a-f]{7,40}$", str(version)) is not None
+
+
+def is_shallow_repository(repo_path):
+    """
+    Checks whether the repository at repo_path is a shallow clone
+    """
+    output = subprocess.check_output(
+        ["git", "rev-parse", "--is-shallow-repository"],
+        cwd=repo_path,
+        universal_newlines=True,
+    )
+    return output.strip() == "true"
+
+
+def has_local_commit(repo_path, revision):
+    """
+    Checks whether revision can be resolved to a commit that is available locally
+    """
+    returncode = subprocess.call(
+        ["git", "rev-parse", "--verify", "--quiet", "{}^{{commit}}".format(revision)],
+        cwd=repo_path,
+        stdout=subprocess.DEVNULL,
+    )
+    return returncode == 0
+
+
+def resolve_version(repo_path, version):
+    """
+    Resolves version (branch, tag or commit id) to the id of a commit that is available
+    locally. Branches that only exist as remote-tracking branches of origin are considered
+    as well. Returns None if the version is not available locally.
+    """
+    revisions = [version]
+    if not is_commit_id(version):
+        revisions.append("refs/remotes/origin/{}".format(version))
+    for revision in revisions:
+        process = subprocess.run(
+            [
+                "git",
+                "rev-parse",
+                "--verify",
+                "--quiet",
+                "{}^{{commit}}".format(revision),
+            ],
+            cwd=repo_path,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if process.returncode == 0:
+            return process.stdout.strip()
+    return None
+
+
+def has_local_version(repo_path, version):
+    """
+    Checks whether version (branch, tag or commit id) can be checked out without fetching
+    """
+    return resolve_version(repo_path, version) is not None
+
+
+def track_remote_branch(repo_path, branch):
+    """
+    Makes sure the fetch refspecs of origin cover the given branch. Single-branch clones
+    (e.g. shallow ones) only track one branch, so other branches could not be checked out
+    by name otherwise.
+    """
+    refspecs = subprocess.check_output(
+        ["git", "config", "--get-all", "remote.origin.fetch"],
+        cwd=repo_path,
+        universal_newlines=True,
+    ).split()
+    wanted = "+refs/heads/{0}:refs/remotes/origin/{0}".format(branch)
+    if "+refs/heads/*:refs/remotes/origin/*" not in refspecs and wanted not in refspecs:
+        subprocess.check_call(
+            ["git", "remote", "set-branches", "--add", "origin", branch], cwd=repo_path
+        )
+
+
+def fetch_version(repo_path, version, depth=None):
+    """
+    Fetches only the given version (branch, tag or commit id) from origin. Branches are stored
+    as remote-tracking branches, so they can be checked out by name afterwards.
+
+    If depth is given and the repository is a shallow clone, only that many commits are
+    fetched. Should a commit id not be fetchable directly, the history is deepened until it
+    becomes reachable.
+    """
+    depth_args = []
+    if depth and is_shallow_repository(repo_path):
+        depth_args = ["--depth", str(depth)]
+    if is_commit_id(version):
+        refspecs = [version]
+    else:
+        refspecs = [
+            "+refs/heads/{0}:refs/remotes/origin/{0}".format(version),
+            "+refs/tags/{0}:refs/tags/{0}".format(version),
+        ]
+    for refspec in refspecs:
+        returncode = subprocess.call(
+            ["git", "fetch", "--quiet"] + depth_args + ["origin", refspec],
+            cwd=repo_path,
+            stderr=subprocess.DEVNULL,
+        )
+        if returncode == 0:
+            if refspec.startswith("+refs/heads/"):
+                track_remote_branch(repo_path, version)
+            return
+
+    # The server may refuse to serve arbitrary commits. Deepen the history step by step
+    # until the requested version becomes reachable.
+    deepen_by = depth or 1
+    while is_shallow_repository(repo_path) and not has_local_commit(repo_path, version):
+        deepen_by *= 2
+        click.echo("Deepening history of {} to find {}".format(repo_path, version))
+        subprocess.check_call(
+            ["git", "fetch", "--quiet", "--deepen", str(deepen_by), "origin"],
+            cwd=repo_path,
+        )
+    if not has_local_commit(repo_path, version):
+        subprocess.check_call(
+            [
+                "git",
+                "fetch",
+                "--quiet",
+                "origin",
+                "+refs/heads/*:refs/remotes/origin/*",
+                "+refs/tags/*:refs/tags/*",
+            ],
+            cwd=repo_path,
+        )
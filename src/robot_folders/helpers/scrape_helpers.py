@@ -0,0 +1,161 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+This module contains helpers for scraping environments into the config format used to create
+them
+"""
+import concurrent.futures
+import os
+
+import click
+
+from yaml import safe_dump as yaml_safe_dump
+
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.cache_helpers import ScrapeCache
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers.lock_helpers import EnvironmentLock
+from robot_folders.helpers.repository_helpers import (
+    create_rosinstall_entry,
+    inspect_repositories,
+)
+
+
+class EnvironmentScraper(object):
+    """Creates the config data describing an environment's workspaces and demo scripts"""
+
+    def __init__(self, use_commit_id=False, nested_repositories=False, cache=None):
+        self.use_commit_id = use_commit_id
+        self.nested_repositories = nested_repositories
+        self.cache = cache
+
+    def get_config(self, env_dir):
+        """Returns the config data describing the environment inside env_dir"""
+        misc_ws_pkg_dir = os.path.join(env_dir, "misc_ws")
+        catkin_dir = dir_helpers.get_catkin_dir(env_dir)
+        catkin_src_dir = os.path.join(catkin_dir, "src")
+        colcon_dir = dir_helpers.get_colcon_dir(env_dir)
+        colcon_src_dir = os.path.join(colcon_dir, "src")
+        demos_dir = os.path.join(env_dir, "demos")
+
+        yaml_data = dict()
+
+        if os.path.isdir(misc_ws_pkg_dir):
+            click.echo("Scraping misc_ws_dir")
+            yaml_data["misc_ws"] = dict()
+            yaml_data["misc_ws"]["rosinstall"] = self.parse_folder(misc_ws_pkg_dir)
+
+        if os.path.isdir(catkin_src_dir):
+            click.echo("Scraping catkin workspace")
+            yaml_data["catkin_workspace"] = dict()
+            yaml_data["catkin_workspace"]["rosinstall"] = self.parse_folder(
+                catkin_src_dir
+            )
+
+        if os.path.isdir(colcon_src_dir):
+            click.echo("Scraping colcon workspace")
+            yaml_data["colcon_workspace"] = dict()
+            yaml_data["colcon_workspace"]["rosinstall"] = self.parse_folder(
+                colcon_src_dir
+            )
+
+        if os.path.isdir(demos_dir):
+            yaml_data["demos"] = dict()
+            script_list = [
+                script_file
+                for script_file in os.listdir(demos_dir)
+                if os.path.isfile(os.path.join(demos_dir, script_file))
+                and os.access(os.path.join(demos_dir, script_file), os.X_OK)
+            ]
+            for script in script_list:
+                script_path = os.path.join(demos_dir, script)
+                with open(script_path, "r") as filecontent:
+                    # content = f.read()
+                    yaml_data["demos"][script] = filecontent.read()
+                    filecontent.close()
+
+        return yaml_data
+
+    def parse_folder(self, folder):
+        """Finds all repositories inside folder and creates their rosinstall entries"""
+
+        def inspect(local_name, repo_path):
+            click.echo(local_name)
+            if self.cache is not None:
+                return self.cache.rosinstall_entry(
+                    repo_path, local_name, self.use_commit_id
+                )
+            return create_rosinstall_entry(repo_path, local_name, self.use_commit_id)
+
+        return inspect_repositories(folder, inspect, self.nested_repositories)
+
+
+def is_lockfile(path):
+    """Checks whether path names a single yaml file instead of a directory"""
+    return os.path.splitext(path)[1] in (".yaml", ".yml")
+
+
+def scrape_all(out_path, use_commit_id=False, nested_repositories=False, jobs=None):
+    """
+    Scrapes all environments in parallel. If out_path is a yaml file, all configs are written
+    into it keyed by the environment name. Otherwise, out_path is used as directory and each
+    environment is written into its own file. Returns a dict mapping the names of all
+    environments that failed to their errors.
+    """
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    scraper = EnvironmentScraper(use_commit_id, nested_repositories, ScrapeCache())
+
+    def scrape_environment(env_name):
+        with EnvironmentLock(env_name, shared=True):
+            return scraper.get_config(
+                os.path.join(dir_helpers.get_checkout_dir(), env_name)
+            )
+
+    configs = dict()
+    errors = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(scrape_environment, env_name): env_name
+            for env_name in dir_helpers.list_environments()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            env_name = futures[future]
+            try:
+                configs[env_name] = future.result()
+            except Exception as err:
+                click.echo("Scraping {} failed: {}".format(env_name, err))
+                errors[env_name] = err
+    scraper.cache.save()
+
+    if is_lockfile(out_path):
+        dir_helpers.atomic_write(out_path, yaml_safe_dump(configs, allow_unicode=True))
+    else:
+        if not os.path.isdir(out_path):
+            os.makedirs(out_path)
+        for env_name, yaml_data in configs.items():
+            dir_helpers.atomic_write(
+                os.path.join(out_path, env_name + ".yaml"),
+                yaml_safe_dump(yaml_data, allow_unicode=True),
+            )
+    click.echo("Scraped {} environment(s) into {}".format(len(configs), out_path))
+    return errors
@@ -0,0 +1,215 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Helpers for sharing ssh connections between the git operations on many repositories
+"""
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.git_metadata_helpers import (
+    UnsupportedRepository,
+    parse_config,
+)
+
+# Set while connections are multiplexed, so nested operations and subprocesses reuse them
+CONTROL_DIR_VARIABLE = "ROB_FOLDERS_SSH_CONTROL_DIR"
+
+# Seconds an idle master connection stays open, in case closing it on exit fails
+CONTROL_PERSIST = 60
+
+
+def is_ssh_command(command):
+    """Checks whether command runs ssh, so ssh's options can be added to it"""
+    try:
+        program = shlex.split(command)[0]
+    except (ValueError, IndexError):
+        return False
+    return os.path.basename(program) == "ssh"
+
+
+def add_batch_mode(command):
+    """Returns the ssh command with BatchMode enabled, so ssh never asks for passwords.
+    Commands running other programs are returned unchanged."""
+    if "BatchMode=yes" in command or not is_ssh_command(command):
+        return command
+    return command + " -o BatchMode=yes"
+
+
+def get_batch_environment():
+    """Returns the process environment for running git without asking for credentials"""
+    env = dict(os.environ)
+    env["GIT_TERMINAL_PROMPT"] = "0"
+    env["GIT_SSH_COMMAND"] = add_batch_mode(env.get("GIT_SSH_COMMAND") or "ssh")
+    return env
+
+
+def get_config_paths():
+    """Returns the system and global git config files in the order git reads them"""
+    global_config = os.environ.get("GIT_CONFIG_GLOBAL")
+    if global_config:
+        return ["/etc/gitconfig", global_config]
+    config_home = os.getenv(
+        "XDG_CONFIG_HOME", os.path.expandvars(os.path.join("$HOME", ".config"))
+    )
+    return [
+        "/etc/gitconfig",
+        os.path.join(config_home, "git", "config"),
+        os.path.expanduser(os.path.join("~", ".gitconfig")),
+    ]
+
+
+def get_configured_ssh_command():
+    """Returns core.sshCommand from the system and global git config or None if it is not
+    set"""
+    command = None
+    for path in get_config_paths():
+        for section, subsection, key, value in parse_config(path):
+            if section == "core" and subsection is None and key == "sshcommand":
+                command = value
+    return command
+
+
+def get_base_ssh_command():
+    """Returns the ssh command git would use without multiplexing or None if git uses a
+    custom program that might not understand ssh's options"""
+    if os.environ.get("GIT_SSH"):
+        return None
+    command = os.environ.get("GIT_SSH_COMMAND")
+    if not command:
+        try:
+            command = get_configured_ssh_command()
+        except UnsupportedRepository:
+            # Let git resolve config includes
+            command = subprocess.run(
+                ["git", "config", "--global", "--get", "core.sshCommand"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            ).stdout.strip()
+        command = command or "ssh"
+    if not is_ssh_command(command):
+        return None
+    return command
+
+
+def get_multiplexing_command(base_command, control_dir, batch=False):
+    """Returns the ssh command sharing one master connection per host, user and port through
+    sockets inside control_dir"""
+    options = [
+        "ControlMaster=auto",
+        "ControlPath={}".format(os.path.join(control_dir, "%C")),
+        "ControlPersist={}".format(CONTROL_PERSIST),
+    ]
+    if batch:
+        options.append("BatchMode=yes")
+    return " ".join(
+        [base_command] + ["-o {}".format(shlex.quote(option)) for option in options]
+    )
+
+
+class SshMultiplexer(object):
+    """Makes all git commands run while it is entered share their ssh connections to the same
+    host, so the handshake and authentication are only done once per host.
+
+    This sets GIT_SSH_COMMAND, which is inherited by subprocesses like vcstool. Nothing is
+    changed if multiplexing is disabled in the config or git uses a custom ssh program. Inside
+    an outer multiplexer, its connections are reused. If batch is set, ssh never asks for
+    passwords, even if the outer multiplexer allows it.
+    """
+
+    def __init__(self, batch=False):
+        self.batch = batch
+        self.control_dir = None
+        self.saved_environment = dict()
+
+    def is_enabled(self):
+        """Checks whether connections should be multiplexed"""
+        if os.environ.get(CONTROL_DIR_VARIABLE):
+            return False
+        return config_helpers.get_value_safe_default(
+            "git", "ssh_multiplexing", True, debug=False
+        )
+
+    def set_environment(self, name, value):
+        """Sets an environment variable, remembering its previous value"""
+        self.saved_environment[name] = os.environ.get(name)
+        os.environ[name] = value
+
+    def restore_environment(self):
+        """Restores all environment variables changed by set_environment"""
+        for name, value in self.saved_environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        self.saved_environment = dict()
+
+    def close_connections(self):
+        """Closes all master connections opened while being entered"""
+        for socket_name in os.listdir(self.control_dir):
+            subprocess.call(
+                [
+                    "ssh",
+                    "-o",
+                    "ControlPath={}".format(
+                        os.path.join(self.control_dir, socket_name)
+                    ),
+                    "-O",
+                    "exit",
+                    "robot_folders",
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+
+    def __enter__(self):
+        outer_command = os.environ.get("GIT_SSH_COMMAND")
+        if os.environ.get(CONTROL_DIR_VARIABLE) and self.batch and outer_command:
+            self.set_environment("GIT_SSH_COMMAND", add_batch_mode(outer_command))
+        if not self.is_enabled():
+            return self
+        base_command = get_base_ssh_command()
+        if base_command is None:
+            return self
+        # Socket paths are limited to about 100 characters, so keep the directory short
+        self.control_dir = tempfile.mkdtemp(prefix="rf-ssh-")
+        self.set_environment(
+            "GIT_SSH_COMMAND",
+            get_multiplexing_command(base_command, self.control_dir, self.batch),
+        )
+        self.set_environment(CONTROL_DIR_VARIABLE, self.control_dir)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.restore_environment()
+        if self.control_dir is None:
+            return
+        try:
+            self.close_connections()
+        except OSError:
+            pass
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+        self.control_dir = None
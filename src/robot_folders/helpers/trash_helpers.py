@@ -0,0 +1,308 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+"""
+Helpers for deleting large directory trees quickly. Trees are renamed into a trash directory on
+the same filesystem, which is atomic and instant, and the trash is reclaimed by a background
+process deleting many subtrees in parallel.
+"""
+import concurrent.futures
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import click
+
+import robot_folders.helpers.directory_helpers as dir_helpers
+from robot_folders.helpers import config_helpers
+from robot_folders.helpers.cache_helpers import get_cache_dir
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.job_helpers import rob_folders_command
+from robot_folders.helpers.lock_helpers import FileLock, get_lock_timeout
+
+TRASH_DIR_NAME = ".rob_folders_trash"
+# Taken while a trash directory is reclaimed, so only one process deletes its entries
+RECLAIM_LOCK_NAME = ".reclaim.lock"
+# Depth below a trashed tree at which subtrees are deleted in parallel
+FAN_OUT_DEPTH = 2
+
+
+def get_registry_path():
+    """Returns the file listing the trash directories created next to trashed paths"""
+    return os.path.join(get_cache_dir(), "trash_dirs.json")
+
+
+def read_registry():
+    """Returns the trash directories created next to trashed paths"""
+    try:
+        with open(get_registry_path()) as registry_file:
+            trash_dirs = json.load(registry_file)
+    except (IOError, ValueError):
+        return list()
+    return trash_dirs if isinstance(trash_dirs, list) else list()
+
+
+def register_trash_dir(trash_dir):
+    """Adds a trash directory to the registry"""
+    registry_path = get_registry_path()
+    dir_helpers.mkdir_p(os.path.dirname(registry_path))
+    with FileLock(registry_path + ".lock", timeout=get_lock_timeout()):
+        trash_dirs = read_registry()
+        if trash_dir not in trash_dirs:
+            trash_dirs.append(trash_dir)
+            dir_helpers.atomic_write(registry_path, json.dumps(trash_dirs))
+
+
+def get_known_trash_dirs():
+    """Returns the trash directories of the checkout and no_backup directory followed by the
+    registered ones"""
+    trash_dirs = [os.path.join(dir_helpers.get_checkout_dir(), TRASH_DIR_NAME)]
+    no_backup_dir = config_helpers.get_value_safe(
+        "directories", "no_backup_dir", debug=False
+    )
+    if no_backup_dir and os.path.isdir(os.path.expanduser(no_backup_dir)):
+        trash_dirs.append(
+            os.path.join(
+                dir_helpers.get_build_base_dir(use_no_backup=True), TRASH_DIR_NAME
+            )
+        )
+    for trash_dir in read_registry():
+        if trash_dir not in trash_dirs:
+            trash_dirs.append(trash_dir)
+    return trash_dirs
+
+
+def get_device(path):
+    """Returns the device of a path or of its nearest existing parent"""
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev
+
+
+def is_trash_dir(path):
+    """Checks whether path is a trash directory created by robot_folders"""
+    path = os.path.abspath(path)
+    return os.path.basename(path) == TRASH_DIR_NAME or path in [
+        os.path.abspath(trash_dir) for trash_dir in get_known_trash_dirs()
+    ]
+
+
+def is_inside(path, directory):
+    """Checks whether path is directory or lies below it"""
+    return os.path.commonpath([path, directory]) == directory
+
+
+def get_mount_point(path):
+    """Returns the mount point of the filesystem path is on"""
+    path = os.path.realpath(path)
+    device = os.stat(path).st_dev
+    while os.path.dirname(path) != path:
+        parent = os.path.dirname(path)
+        if os.stat(parent).st_dev != device:
+            break
+        path = parent
+    return path
+
+
+def get_trash_dir(path):
+    """Returns a trash directory on the filesystem of path that does not lie inside path. If
+    none of the known trash directories qualifies, one is created at the mount point of the
+    filesystem. Returns None if that is not possible either."""
+    parent_dir = os.path.dirname(path)
+    device = os.stat(parent_dir).st_dev
+    for trash_dir in get_known_trash_dirs():
+        if get_device(trash_dir) == device and not is_inside(trash_dir, path):
+            break
+    else:
+        trash_dir = os.path.join(get_mount_point(parent_dir), TRASH_DIR_NAME)
+        if is_inside(trash_dir, path):
+            return None
+        try:
+            dir_helpers.mkdir_p(trash_dir)
+        except OSError:
+            return None
+        register_trash_dir(trash_dir)
+    dir_helpers.mkdir_p(trash_dir)
+    return trash_dir
+
+
+def move_to_trash(path):
+    """Moves a file or directory into the trash. Paths that cannot be renamed, e.g. mount
+    points, are deleted right away. Returns the trash directory used or None."""
+    # Resolves symlinks to the parent, e.g. a build folder on no_backup, but not to the path
+    abs_path = os.path.join(
+        os.path.realpath(os.path.dirname(os.path.abspath(path))),
+        os.path.basename(os.path.abspath(path)),
+    )
+    try:
+        trash_dir = get_trash_dir(abs_path)
+        if trash_dir is None:
+            raise OSError("No trash directory for {}".format(abs_path))
+        entry_dir = tempfile.mkdtemp(
+            prefix=time.strftime("%Y%m%d-%H%M%S-"), dir=trash_dir
+        )
+        try:
+            os.rename(abs_path, os.path.join(entry_dir, os.path.basename(abs_path)))
+        except OSError:
+            os.rmdir(entry_dir)
+            raise
+        return trash_dir
+    except OSError:
+        if os.path.isdir(abs_path) and not os.path.islink(abs_path):
+            shutil.rmtree(abs_path)
+        else:
+            os.unlink(abs_path)
+        return None
+
+
+def list_trash_entries(trash_dir):
+    """Returns the paths of all entries inside a trash directory"""
+    try:
+        names = os.listdir(trash_dir)
+    except OSError:
+        return list()
+    return [
+        os.path.join(trash_dir, name)
+        for name in sorted(names)
+        if not name.startswith(".")
+    ]
+
+
+def collect_subtrees(path, depth):
+    """Returns the directories depth levels below path. Shallower parts of the tree are left
+    for deleting path itself."""
+    if depth == 0 or os.path.islink(path) or not os.path.isdir(path):
+        return [path]
+    subtrees = list()
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subtrees.extend(collect_subtrees(entry.path, depth - 1))
+    except OSError:
+        pass
+    return subtrees
+
+
+def delete_entry(entry):
+    """Deletes a file or directory tree inside the trash, ignoring errors"""
+    if os.path.isdir(entry) and not os.path.islink(entry):
+        shutil.rmtree(entry, ignore_errors=True)
+    else:
+        try:
+            os.unlink(entry)
+        except OSError:
+            pass
+
+
+def reclaim_entries(entries, jobs):
+    """Deletes trash entries, deleting their subtrees in parallel. Returns the entries that
+    could not be deleted."""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        subtrees = list()
+        for entry in entries:
+            subtrees.extend(collect_subtrees(entry, FAN_OUT_DEPTH + 1))
+        list(executor.map(delete_entry, subtrees))
+    failed = list()
+    for entry in entries:
+        delete_entry(entry)
+        if os.path.lexists(entry):
+            failed.append(entry)
+    return failed
+
+
+def is_reclaiming(trash_dir):
+    """Checks whether a process is reclaiming a trash directory right now"""
+    if not os.path.isdir(trash_dir):
+        return False
+    try:
+        with FileLock(os.path.join(trash_dir, RECLAIM_LOCK_NAME), timeout=0):
+            return False
+    except ModuleException:
+        return True
+
+
+def empty_trash(trash_dir, jobs=None):
+    """
+    Deletes everything inside a trash directory, including entries added meanwhile. Returns
+    the number of deleted entries and the entries that could not be deleted, or None if
+    another process is reclaiming the trash directory already.
+    """
+    if not is_trash_dir(trash_dir):
+        raise ModuleException(
+            "{} is not a trash directory of robot_folders".format(trash_dir), "trash"
+        )
+    if not os.path.isdir(trash_dir):
+        return 0, list()
+    if jobs is None:
+        jobs = config_helpers.get_value_safe_default("git", "jobs", 8, debug=False)
+    lock_path = os.path.join(trash_dir, RECLAIM_LOCK_NAME)
+    try:
+        lock = FileLock(lock_path, timeout=0)
+        lock.acquire()
+    except ModuleException:
+        return None
+    try:
+        seen = set()
+        failed = list()
+        while True:
+            entries = [
+                entry for entry in list_trash_entries(trash_dir) if entry not in seen
+            ]
+            if not entries:
+                break
+            seen.update(entries)
+            failed.extend(reclaim_entries(entries, jobs))
+    finally:
+        # Removed while still holding the lock, FileLock notices that a waiting process
+        # locked the removed file
+        try:
+            os.unlink(lock_path)
+        except OSError:
+            pass
+        lock.release()
+    return len(seen) - len(failed), failed
+
+
+def start_reclaim(trash_dirs):
+    """Empties the given trash directories in a detached process"""
+    trash_dirs = sorted(set(trash_dir for trash_dir in trash_dirs if trash_dir))
+    if not trash_dirs:
+        return
+    try:
+        subprocess.Popen(
+            rob_folders_command("trash", "--empty", *trash_dirs),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError as err:
+        click.echo(
+            "Could not start emptying the trash in the background ({}). "
+            "Run 'fzirob trash --empty' to reclaim the space.".format(err)
+        )
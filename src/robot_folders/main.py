@@ -98,3 +98,7 @@ cli = RobotFolders(
     "Use tab-completion for combining commands or type --help on each level "
     "to get a help message."
 )
+
+
+if __name__ == "__main__":
+    cli()
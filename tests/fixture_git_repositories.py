@@ -0,0 +1,88 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+import subprocess
+
+import pytest
+
+
+def git(*args, cwd=None):
+    """Runs a git command and returns its stripped output"""
+    return subprocess.check_output(
+        ["git"] + list(args), cwd=cwd, universal_newlines=True
+    ).strip()
+
+
+def commit_file(repo_dir, filename, content="content"):
+    """Adds a file to a work tree and commits it. Returns the new commit id."""
+    with open(os.path.join(repo_dir, filename), "w") as out_file:
+        out_file.write(content)
+    git("add", filename, cwd=repo_dir)
+    git("commit", "--quiet", "-m", "Add {}".format(filename), cwd=repo_dir)
+    return git("rev-parse", "HEAD", cwd=repo_dir)
+
+
+@pytest.fixture
+def git_identity(monkeypatch):
+    monkeypatch.setenv("GIT_AUTHOR_NAME", "Robot Folders")
+    monkeypatch.setenv("GIT_AUTHOR_EMAIL", "robot_folders@example.com")
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "Robot Folders")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "robot_folders@example.com")
+
+
+@pytest.fixture
+def bare_remote(tmp_path, git_identity):
+    """Creates a bare repository with one commit on 'main' and returns a tuple of the bare
+    repository's path and a work tree pushing to it."""
+    remote_dir = str(tmp_path / "remotes" / "repo.git")
+    work_dir = str(tmp_path / "work")
+    git("init", "--quiet", "--bare", "-b", "main", remote_dir)
+    git("config", "uploadpack.allowFilter", "true", cwd=remote_dir)
+    git("clone", "--quiet", remote_dir, work_dir)
+    git("checkout", "--quiet", "-b", "main", cwd=work_dir)
+    commit_file(work_dir, "README.md", "first")
+    git("push", "--quiet", "origin", "main", cwd=work_dir)
+    yield remote_dir, work_dir
+
+
+@pytest.fixture
+def remote_with_submodule(tmp_path, bare_remote, monkeypatch):
+    """Extends bare_remote by a submodule 'sub' living in its own bare repository"""
+    remote_dir, work_dir = bare_remote
+    # Submodules from local paths are only allowed when explicitly enabled
+    monkeypatch.setenv("GIT_CONFIG_COUNT", "1")
+    monkeypatch.setenv("GIT_CONFIG_KEY_0", "protocol.file.allow")
+    monkeypatch.setenv("GIT_CONFIG_VALUE_0", "always")
+
+    sub_remote_dir = str(tmp_path / "remotes" / "sub.git")
+    sub_work_dir = str(tmp_path / "sub_work")
+    git("init", "--quiet", "--bare", "-b", "main", sub_remote_dir)
+    git("clone", "--quiet", sub_remote_dir, sub_work_dir)
+    git("checkout", "--quiet", "-b", "main", cwd=sub_work_dir)
+    commit_file(sub_work_dir, "first.txt")
+    commit_file(sub_work_dir, "second.txt")
+    git("push", "--quiet", "origin", "main", cwd=sub_work_dir)
+
+    git("submodule", "--quiet", "add", "file://" + sub_remote_dir, "sub", cwd=work_dir)
+    git("commit", "--quiet", "-m", "Add submodule", cwd=work_dir)
+    git("push", "--quiet", "origin", "main", cwd=work_dir)
+    yield remote_dir, work_dir
@@ -21,9 +21,13 @@
 #
 import pytest
 
+from robot_folders.helpers.config_helpers import get_resource_path
+
 
 @pytest.fixture
 def fake_ros_installation(fs):
+    # Commands read their settings from the config, which falls back to the distributed one
+    fs.add_real_file(get_resource_path("userconfig_distribute.yaml"))
     fs.create_file("/opt/ros/melodic/setup.sh", contents="catkin")
     fs.create_file("/opt/ros/noetic/setup.sh", contents="catkin")
     fs.create_file("/opt/ros/humble/setup.sh", contents="AMENT_CURRENT_PREFIX")
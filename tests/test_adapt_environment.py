@@ -0,0 +1,143 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+from robot_folders.commands.adapt_environment import (
+    EnvironmentAdapter,
+    RepositoryPlan,
+    get_plan_waves,
+)
+from robot_folders.helpers.clone_helpers import CloneOptions
+from robot_folders.helpers.exceptions import ModuleException
+
+from .fixture_git_repositories import bare_remote, commit_file, git, git_identity
+
+
+@pytest.fixture
+def adapter():
+    adapter = EnvironmentAdapter(name="env")
+    adapter.local_delete_policy = "delete_all"
+    adapter.local_override_policy = "override"
+    adapter.clone_options = CloneOptions(use_mirrors=False)
+    adapter.jobs = 4
+    return adapter
+
+
+def test_adapt_rosinstall(tmp_path, bare_remote, adapter):
+    remote_dir, work_dir = bare_remote
+    git("checkout", "--quiet", "-b", "feature", cwd=work_dir)
+    feature_commit = commit_file(work_dir, "feature.txt")
+    git("push", "--quiet", "origin", "feature", cwd=work_dir)
+
+    packages_dir = str(tmp_path / "src")
+    for name in ["existing", "extra"]:
+        git("clone", "--quiet", remote_dir, os.path.join(packages_dir, name))
+    adapter.parse_folder(packages_dir)
+
+    config_rosinstall = [
+        {"git": {"local-name": "existing", "uri": remote_dir, "version": "feature"}},
+        {"git": {"local-name": "new", "uri": remote_dir, "version": "main"}},
+        {"git": {"local-name": "new/nested", "uri": remote_dir, "version": "main"}},
+    ]
+    adapter.adapt_rosinstall(config_rosinstall, packages_dir)
+
+    assert git("rev-parse", "HEAD", cwd=os.path.join(packages_dir, "existing")) == (
+        feature_commit
+    )
+    assert os.path.isfile(os.path.join(packages_dir, "new", "README.md"))
+    assert os.path.isfile(os.path.join(packages_dir, "new", "nested", "README.md"))
+    assert not os.path.exists(os.path.join(packages_dir, "extra"))
+
+
+def test_adapt_rosinstall_reports_failures(tmp_path, bare_remote, adapter):
+    remote_dir, _ = bare_remote
+    packages_dir = str(tmp_path / "src")
+    config_rosinstall = [
+        {"git": {"local-name": "good", "uri": remote_dir, "version": "main"}},
+        {"git": {"local-name": "bad", "uri": str(tmp_path / "missing.git")}},
+    ]
+    with pytest.raises(ModuleException) as excinfo:
+        adapter.adapt_rosinstall(config_rosinstall, packages_dir)
+    assert "bad" in excinfo.value.message
+    assert os.path.isfile(os.path.join(packages_dir, "good", "README.md"))
+
+
+def test_get_plan_waves():
+    plans = [
+        RepositoryPlan(name, name, "uri", "main", None)
+        for name in ["a/b/c", "a", "d", "a/b", "ab"]
+    ]
+    waves = get_plan_waves(plans)
+    assert [sorted(plan.local_name for plan in wave) for wave in waves] == [
+        ["a", "ab", "d"],
+        ["a/b"],
+        ["a/b/c"],
+    ]
+
+
+def test_adapt_rosinstall_offline(tmp_path, bare_remote, adapter):
+    remote_dir, work_dir = bare_remote
+    packages_dir = str(tmp_path / "src")
+    repo_dir = os.path.join(packages_dir, "repo")
+    git("clone", "--quiet", remote_dir, repo_dir)
+    main_commit = git("rev-parse", "HEAD", cwd=repo_dir)
+    git("checkout", "--quiet", "-b", "local", cwd=repo_dir)
+    commit_file(work_dir, "upstream.txt")
+    git("push", "--quiet", "origin", "main:upstream", cwd=work_dir)
+
+    adapter.offline = True
+    adapter.parse_folder(packages_dir)
+    config_rosinstall = [
+        {"git": {"local-name": "repo", "uri": remote_dir, "version": "upstream"}}
+    ]
+    with pytest.raises(ModuleException):
+        adapter.adapt_rosinstall(config_rosinstall, packages_dir)
+    assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=repo_dir) == "local"
+
+    # Versions known locally are checked out without fetching
+    for version in ["main", main_commit]:
+        config_rosinstall[0]["git"]["version"] = version
+        adapter.parse_folder(packages_dir)
+        plans, _ = adapter.plan_rosinstall(config_rosinstall, packages_dir)
+        assert not plans[0].fetch
+        adapter.adapt_rosinstall(config_rosinstall, packages_dir)
+        assert git("rev-parse", "HEAD", cwd=repo_dir) == main_commit
+
+
+def test_check_new_workspaces_offline(tmp_path, adapter):
+    existing_dir = str(tmp_path / "existing")
+    os.makedirs(existing_dir)
+    rosinstall = [{"git": {"local-name": "repo", "uri": "uri", "version": "main"}}]
+    adapter.check_new_workspaces_offline(
+        [
+            ("misc", True, str(tmp_path / "misc"), []),
+            ("catkin", True, existing_dir, rosinstall),
+            ("colcon", False, str(tmp_path / "colcon"), rosinstall),
+        ]
+    )
+    with pytest.raises(ModuleException) as excinfo:
+        adapter.check_new_workspaces_offline(
+            [("colcon", True, str(tmp_path / "colcon"), rosinstall)]
+        )
+    assert "colcon" in excinfo.value.message
@@ -0,0 +1,191 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import json
+import os
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.commands.add_environment as add_environment
+import robot_folders.helpers.clone_helpers as clone_helpers
+import robot_folders.helpers.directory_helpers as directory_helpers
+from robot_folders.helpers.environment_helpers import CREATION_STATE_FILENAME
+
+from .fixture_git_repositories import bare_remote, git, git_identity
+
+
+@pytest.fixture
+def checkout_dir(tmp_path, monkeypatch):
+    checkout_dir = str(tmp_path / "checkout")
+    os.makedirs(checkout_dir)
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setattr(clone_helpers, "RETRY_DELAY", 0.0)
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    # add_environment marks the new environment as active
+    monkeypatch.delenv("ROB_FOLDERS_ACTIVE_ENV", raising=False)
+    yield checkout_dir
+
+
+def add(*args):
+    result = CliRunner().invoke(
+        add_environment.cli,
+        [
+            "--local_build=yes",
+            "--underlays=skip",
+            "--no_remote_check",
+            "--submodule_strategy=recursive",
+        ]
+        + list(args),
+    )
+    print(result.output)
+    return result
+
+
+def test_resume(bare_remote, checkout_dir, tmp_path):
+    remote_dir, _ = bare_remote
+    missing_remote = str(tmp_path / "remotes" / "late.git")
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        """
+misc_ws:
+  rosinstall:
+  - git:
+      local-name: first
+      uri: {remote}
+      version: main
+  - git:
+      local-name: late
+      uri: {missing}
+      version: main
+""".format(
+            remote=remote_dir, missing=missing_remote
+        )
+    )
+    env_dir = os.path.join(checkout_dir, "env")
+
+    result = add("--config_file", str(config_file), "env")
+    assert result.exit_code != 0
+    assert "--resume" in result.output
+    with open(os.path.join(env_dir, CREATION_STATE_FILENAME)) as state_file:
+        state = json.load(state_file)
+    assert state["completed"] == ["demos"]
+    assert state["current_step"] == "misc_ws"
+    first_dir = os.path.join(env_dir, "misc_ws", "first")
+    assert os.path.isdir(first_dir)
+
+    # Without --resume the half-created environment is not touched
+    result = add("--config_file", str(config_file), "env")
+    assert result.exit_code != 0
+    assert "--resume" in result.output
+
+    git("clone", "--quiet", "--bare", remote_dir, missing_remote)
+    marker = os.path.join(first_dir, "marker")
+    open(marker, "w").close()
+    result = add("--resume", "env")
+    assert result.exit_code == 0
+    assert "Skipping demos" in result.output
+    # Successful clones are kept
+    assert os.path.isfile(marker)
+    assert git("rev-parse", "HEAD", cwd=os.path.join(env_dir, "misc_ws", "late"))
+    assert not os.path.exists(os.path.join(env_dir, CREATION_STATE_FILENAME))
+
+
+def test_resume_without_state(checkout_dir):
+    result = add("--resume", "env")
+    assert result.exit_code != 0
+    assert "no unfinished creation" in result.output
+
+
+def test_import_missing_retries(bare_remote, tmp_path, monkeypatch):
+    remote_dir, _ = bare_remote
+    monkeypatch.setattr(clone_helpers, "RETRY_DELAY", 0.0)
+    target_dir = str(tmp_path / "ws")
+    rosinstall = [{"git": {"local-name": "repo", "uri": remote_dir}}]
+    # A leftover of a failed clone is replaced by a complete clone
+    os.makedirs(os.path.join(target_dir, "repo", "partial"))
+    calls = list()
+    original_import = clone_helpers.import_rosinstall
+
+    def flaky_import(missing, *args):
+        calls.append([repo["git"]["local-name"] for repo in missing])
+        if len(calls) == 1:
+            raise clone_helpers.subprocess.CalledProcessError(1, "vcs")
+        original_import(missing, *args)
+
+    monkeypatch.setattr(clone_helpers, "import_rosinstall", flaky_import)
+    options = clone_helpers.CloneOptions(use_mirrors=False, no_submodules=True)
+    clone_helpers.import_missing(rosinstall, target_dir, options)
+    assert calls == [["repo"], ["repo"]]
+    assert clone_helpers.is_cloned(rosinstall[0], target_dir)
+    assert not os.path.exists(os.path.join(target_dir, "repo", "partial"))
+
+    # Nothing is cloned if everything is there already
+    clone_helpers.import_missing(rosinstall, target_dir, options)
+    assert len(calls) == 2
+
+
+def test_background(bare_remote, checkout_dir, tmp_path, mocker):
+    import robot_folders.commands.active_environment as active_environment
+
+    remote_dir, _ = bare_remote
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        """
+misc_ws:
+  rosinstall:
+  - git:
+      local-name: first
+      uri: {remote}
+      version: main
+""".format(
+            remote=remote_dir
+        )
+    )
+    env_dir = os.path.join(checkout_dir, "env")
+    popen = mocker.patch.object(add_environment.subprocess, "Popen")
+    popen.return_value.pid = os.getpid()
+
+    result = add("--config_file", str(config_file), "--background", "env")
+    assert result.exit_code == 0
+    # Only the skeleton is created, cloning is left for the worker
+    assert os.path.islink(os.path.join(env_dir, "setup.sh"))
+    assert not os.path.exists(os.path.join(env_dir, "misc_ws", "first"))
+    command = popen.call_args[0][0]
+    assert command[-3:] == ["add_environment", "--resume", "env"]
+    assert popen.call_args[1]["start_new_session"]
+    assert popen.call_args[1]["env"]["ROB_FOLDERS_ACTIVE_ENV"] == "env"
+
+    result = CliRunner().invoke(active_environment.cli)
+    assert 'Creating environment "env": 0 steps done' in result.output
+
+    # Run the worker in this process
+    mocker.stop(popen)
+    result = add("--resume", "env")
+    assert result.exit_code == 0
+    assert os.path.isdir(os.path.join(env_dir, "misc_ws", "first"))
+
+    result = CliRunner().invoke(active_environment.cli)
+    assert 'Creation of environment "env" finished' in result.output
+    # The completion is only reported once
+    result = CliRunner().invoke(active_environment.cli)
+    assert "finished" not in result.output
@@ -0,0 +1,182 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+import robot_folders.commands.apply as apply
+import robot_folders.helpers.directory_helpers as directory_helpers
+from robot_folders.commands.apply import ManifestApplier
+from robot_folders.helpers.exceptions import ModuleException
+
+
+@pytest.fixture
+def checkout_dir(tmp_path, monkeypatch):
+    checkout_dir = str(tmp_path / "checkout")
+    os.makedirs(os.path.join(checkout_dir, "existing", "colcon_ws"))
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    yield checkout_dir
+
+
+def write_manifest(tmp_path, content):
+    manifest_file = str(tmp_path / "manifest.yaml")
+    with open(manifest_file, "w") as out_file:
+        out_file.write(content)
+    return manifest_file
+
+
+MANIFEST = """
+defaults:
+  local_build: yes
+  ros2_distro: humble
+environments:
+  base:
+    config_file: base.yaml
+  app:
+    config_file: app.yaml
+    underlays: [base, existing]
+  existing:
+    config_file: /configs/existing.yaml
+    local_delete_policy: delete_all
+"""
+
+
+def test_build_commands(tmp_path, checkout_dir):
+    applier = ManifestApplier(write_manifest(tmp_path, MANIFEST))
+    applier.parse_manifest()
+
+    assert applier.get_action("base") == "add"
+    assert applier.get_action("existing") == "adapt"
+
+    base_cmd = applier.build_command("base", "add")
+    assert base_cmd[3] == "add_environment"
+    assert "--config_file={}".format(tmp_path / "base.yaml") in base_cmd
+    assert "--local_build=yes" in base_cmd
+    assert "--ros2_distro=humble" in base_cmd
+    assert "--underlays=skip" in base_cmd
+    assert "--no_build" not in base_cmd
+    assert base_cmd[-1] == "base"
+
+    assert "--no_build" in applier.build_command("app", "add")
+    # Environments with underlays are built separately after setting the underlays
+    assert applier.build_make_command("base", "add") is None
+    assert applier.build_make_command("app", "add")[-1] == "make"
+    assert applier.build_make_command("app", "adapt") is None
+
+    existing_cmd = applier.build_command("existing", "adapt")
+    assert existing_cmd[3] == "adapt_environment"
+    assert "--local_delete_policy=delete_all" in existing_cmd
+    assert existing_cmd[-2:] == ["existing", "/configs/existing.yaml"]
+
+
+def test_invalid_manifest(tmp_path, checkout_dir):
+    applier = ManifestApplier(
+        write_manifest(tmp_path, "environments:\n  foo:\n    distro: humble\n")
+    )
+    with pytest.raises(ModuleException):
+        applier.parse_manifest()
+
+    applier = ManifestApplier(
+        write_manifest(
+            tmp_path,
+            "environments:\n  foo:\n    config_file: a.yaml\n    underlays: [bar]\n",
+        )
+    )
+    with pytest.raises(ModuleException):
+        applier.parse_manifest()
+
+
+def test_resolve_distros(tmp_path, checkout_dir, monkeypatch):
+    with open(str(tmp_path / "ros2.yaml"), "w") as config_file:
+        config_file.write("colcon_workspace:\n  rosinstall: []\n")
+    manifest_file = write_manifest(
+        tmp_path, "environments:\n  foo:\n    config_file: ros2.yaml\n"
+    )
+    monkeypatch.setattr(apply, "installed_ros_1_versions", lambda: [])
+    monkeypatch.setattr(apply, "installed_ros_2_versions", lambda: ["humble"])
+    applier = ManifestApplier(manifest_file)
+    applier.parse_manifest()
+    assert "--ros2_distro=humble" in applier.build_command("foo", "add")
+    # Without a catkin workspace the ROS 1 distribution is never asked for
+    assert "--ros_distro=ask" in applier.build_command("foo", "add")
+
+    monkeypatch.setattr(apply, "installed_ros_2_versions", lambda: ["humble", "jazzy"])
+    with pytest.raises(ModuleException):
+        ManifestApplier(manifest_file).parse_manifest()
+
+
+def test_underlays_are_processed_first(tmp_path, checkout_dir, mocker):
+    applier = ManifestApplier(write_manifest(tmp_path, MANIFEST), jobs=4)
+    applier.parse_manifest()
+    started = list()
+
+    def run_job(env_name, action):
+        started.append(env_name)
+        return 0
+
+    mocker.patch.object(applier, "run_job", side_effect=run_job)
+    applier.apply()
+    assert started.index("app") > started.index("base")
+    assert started.index("app") > started.index("existing")
+    assert applier.failed() == []
+
+
+def test_failed_underlay_skips_environment(tmp_path, checkout_dir, mocker):
+    applier = ManifestApplier(write_manifest(tmp_path, MANIFEST), jobs=4)
+    applier.parse_manifest()
+    mocker.patch.object(
+        applier,
+        "run_job",
+        side_effect=lambda env_name, action: 1 if env_name == "base" else 0,
+    )
+    applier.apply()
+    assert applier.results["base"]["result"] == "failed"
+    assert applier.results["app"]["result"].startswith("skipped")
+    assert applier.results["existing"]["result"] == "ok"
+    assert sorted(applier.failed()) == ["app", "base"]
+
+
+def test_environment_with_underlays_is_built(tmp_path, checkout_dir, mocker):
+    applier = ManifestApplier(write_manifest(tmp_path, MANIFEST), log_dir=str(tmp_path))
+    applier.parse_manifest()
+    run = mocker.patch.object(
+        apply.subprocess, "run", return_value=mocker.Mock(returncode=0)
+    )
+    os.makedirs(os.path.join(checkout_dir, "app"))
+    assert applier.run_job("app", "add") == 0
+    assert run.call_count == 2
+    assert run.call_args_list[0][0][0][3] == "add_environment"
+    make_command = run.call_args_list[1][0][0]
+    assert make_command[:2] == ["bash", "-c"]
+    assert make_command[4] == os.path.join(checkout_dir, "app")
+    assert make_command[-1] == "make"
+    with open(os.path.join(checkout_dir, "app", "underlays.txt")) as underlay_file:
+        assert underlay_file.read().split() == [
+            os.path.join(checkout_dir, "base"),
+            os.path.join(checkout_dir, "existing"),
+        ]
+
+    # With no_build, the environment is only added
+    run.reset_mock()
+    applier.environments["app"]["no_build"] = True
+    assert applier.run_job("app", "add") == 0
+    assert run.call_count == 1
@@ -0,0 +1,91 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+import shutil
+
+import pytest
+
+from robot_folders.helpers.bundle_helpers import (
+    BUNDLE_CONFIG_NAME,
+    extract_archive,
+    write_archive,
+    write_bundle_dir,
+)
+from robot_folders.helpers.clone_helpers import CloneOptions, import_rosinstall
+from robot_folders.helpers.ConfigParser import ConfigFileParser
+from robot_folders.helpers.scrape_helpers import EnvironmentScraper
+from robot_folders.helpers.which import which
+
+from .fixture_git_repositories import (
+    bare_remote,
+    commit_file,
+    git,
+    git_identity,
+    remote_with_submodule,
+)
+
+
+@pytest.mark.parametrize("archive_name", ["env.tar.gz", "env.tar.zst"])
+def test_export_and_import(remote_with_submodule, tmp_path, archive_name):
+    if archive_name.endswith(".zst") and which("zstd") is None:
+        pytest.skip("zstd is not installed")
+    remote_dir, _ = remote_with_submodule
+    env_dir = str(tmp_path / "checkout" / "source")
+    repo_dir = os.path.join(env_dir, "colcon_ws", "src", "repo")
+    git(
+        "-c",
+        "protocol.file.allow=always",
+        "clone",
+        "--quiet",
+        "--recurse-submodules",
+        remote_dir,
+        repo_dir,
+    )
+    git("checkout", "--quiet", "-b", "feature", cwd=repo_dir)
+    commit = commit_file(repo_dir, "local.txt")
+
+    bundle_dir = str(tmp_path / "export")
+    os.makedirs(bundle_dir)
+    write_bundle_dir(EnvironmentScraper(), env_dir, bundle_dir)
+    archive = str(tmp_path / archive_name)
+    write_archive(bundle_dir, archive)
+
+    # Importing must not need the remotes anymore
+    shutil.rmtree(str(tmp_path / "remotes"))
+
+    extract_dir = str(tmp_path / "import")
+    extract_archive(archive, extract_dir)
+    parser = ConfigFileParser(os.path.join(extract_dir, BUNDLE_CONFIG_NAME))
+    has_colcon, rosinstall = parser.parse_ros2_config()
+    assert has_colcon
+    assert os.path.isfile(rosinstall[0]["git"]["bundle"])
+
+    target_dir = str(tmp_path / "target" / "src")
+    import_rosinstall(rosinstall, target_dir, CloneOptions(use_mirrors=False))
+    target_repo = os.path.join(target_dir, "repo")
+    assert git("rev-parse", "HEAD", cwd=target_repo) == commit
+    assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=target_repo) == "feature"
+    assert git("remote", "get-url", "origin", cwd=target_repo) == remote_dir
+    assert os.path.isfile(os.path.join(target_repo, "sub", "second.txt"))
+    assert git(
+        "remote", "get-url", "origin", cwd=os.path.join(target_repo, "sub")
+    ).endswith("sub.git")
@@ -0,0 +1,65 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+from click.testing import CliRunner
+
+import robot_folders.commands.clean as clean
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.helpers.trash_helpers as trash_helpers
+
+from .test_package_helpers import create_package
+
+
+def test_clean_packages(tmp_path, monkeypatch, mocker):
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("ROB_FOLDERS_ACTIVE_ENV", "env")
+    mocker.patch.object(trash_helpers.subprocess, "Popen")
+    colcon_dir = os.path.join(checkout_dir, "env", "colcon_ws")
+    src_dir = os.path.join(colcon_dir, "src")
+    create_package(os.path.join(src_dir, "base"), "base")
+    create_package(os.path.join(src_dir, "top"), "top", ["base"])
+    create_package(os.path.join(src_dir, "other"), "other")
+    for space in ["build", "install"]:
+        for package in ["base", "top", "other"]:
+            os.makedirs(os.path.join(colcon_dir, space, package))
+    os.makedirs(os.path.join(colcon_dir, "log"))
+
+    result = CliRunner().invoke(
+        clean.cli, ["colcon", "--packages-above", "base"], input="clean\n"
+    )
+    print(result.output)
+    assert result.exit_code == 0
+    for space in ["build", "install"]:
+        assert os.listdir(os.path.join(colcon_dir, space)) == ["other"]
+    assert os.path.isdir(os.path.join(colcon_dir, "log"))
+
+    result = CliRunner().invoke(clean.cli, ["colcon", "--packages", "unknown"])
+    assert result.exit_code != 0
+    assert os.listdir(os.path.join(colcon_dir, "build")) == ["other"]
+
+    # Without packages, the whole workspace is cleaned
+    result = CliRunner().invoke(clean.cli, ["colcon"], input="clean\n")
+    assert result.exit_code == 0
+    assert os.listdir(os.path.join(colcon_dir, "build")) == []
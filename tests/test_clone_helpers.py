@@ -0,0 +1,256 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+from robot_folders.helpers.clone_helpers import (
+    LAZY_SUBMODULES_FILENAME,
+    CloneOptions,
+    clone_repository,
+    import_rosinstall,
+    init_lazy_submodules,
+)
+from robot_folders.helpers.repository_helpers import (
+    create_rosinstall_entry,
+    fetch_version,
+    get_sparse_paths,
+    is_shallow_repository,
+)
+
+from .fixture_git_repositories import (
+    bare_remote,
+    commit_file,
+    git,
+    git_identity,
+    remote_with_submodule,
+)
+
+
+def add_history(remote_dir, work_dir, count):
+    """Pushes count commits to main and returns their commit ids"""
+    commits = [commit_file(work_dir, "file_{}".format(i)) for i in range(count)]
+    git("push", "--quiet", "origin", "main", cwd=work_dir)
+    return commits
+
+
+def test_clone_options_for_repo():
+    options = CloneOptions(use_mirrors=False, depth=5)
+    assert options.requires_git_clone()
+    repo_options = options.for_repo({"depth": 1, "filter": "blob:none"})
+    assert repo_options.depth == 1
+    assert repo_options.filter == "blob:none"
+    assert options.depth == 5
+    assert options.filter is None
+    assert not CloneOptions(use_mirrors=False).requires_git_clone()
+
+
+def test_shallow_clone_of_branch(bare_remote, tmp_path):
+    remote_dir, work_dir = bare_remote
+    add_history(remote_dir, work_dir, 3)
+    package_dir = str(tmp_path / "ws" / "repo")
+
+    clone_repository(
+        "file://" + remote_dir,
+        package_dir,
+        CloneOptions(use_mirrors=False, depth=1),
+        "main",
+    )
+    assert is_shallow_repository(package_dir)
+    assert git("rev-list", "--count", "HEAD", cwd=package_dir) == "1"
+    assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=package_dir) == "main"
+
+
+def test_shallow_clone_of_commit(bare_remote, tmp_path):
+    remote_dir, work_dir = bare_remote
+    commits = add_history(remote_dir, work_dir, 3)
+    package_dir = str(tmp_path / "ws" / "repo")
+
+    clone_repository(
+        "file://" + remote_dir,
+        package_dir,
+        CloneOptions(use_mirrors=False, depth=1),
+        commits[0],
+    )
+    assert git("rev-parse", "HEAD", cwd=package_dir) == commits[0]
+
+
+def test_partial_clone(bare_remote, tmp_path):
+    remote_dir, _ = bare_remote
+    package_dir = str(tmp_path / "ws" / "repo")
+
+    clone_repository(
+        "file://" + remote_dir,
+        package_dir,
+        CloneOptions(use_mirrors=False, filter="blob:none"),
+    )
+    assert git("config", "remote.origin.partialclonefilter", cwd=package_dir) == (
+        "blob:none"
+    )
+
+
+def test_fetch_version_deepens_history(bare_remote, tmp_path):
+    remote_dir, work_dir = bare_remote
+    commits = add_history(remote_dir, work_dir, 4)
+    git("checkout", "--quiet", "-b", "feature", commits[1], cwd=work_dir)
+    git("push", "--quiet", "origin", "feature", cwd=work_dir)
+    package_dir = str(tmp_path / "ws" / "repo")
+
+    clone_repository(
+        "file://" + remote_dir,
+        package_dir,
+        CloneOptions(use_mirrors=False, depth=1),
+        "main",
+    )
+
+    fetch_version(package_dir, "feature", depth=1)
+    git("checkout", "--quiet", "feature", cwd=package_dir)
+    assert git("rev-parse", "HEAD", cwd=package_dir) == commits[1]
+
+    fetch_version(package_dir, commits[0], depth=1)
+    git("checkout", "--quiet", commits[0], cwd=package_dir)
+    assert git("rev-parse", "HEAD", cwd=package_dir) == commits[0]
+
+
+def test_import_rosinstall_with_repo_depth(bare_remote, tmp_path):
+    remote_dir, work_dir = bare_remote
+    add_history(remote_dir, work_dir, 2)
+    target_dir = str(tmp_path / "ws" / "src")
+    rosinstall = [
+        {
+            "git": {
+                "local-name": "shallow",
+                "uri": "file://" + remote_dir,
+                "version": "main",
+                "depth": 1,
+            }
+        },
+        {"git": {"local-name": "full", "uri": remote_dir, "version": "main"}},
+    ]
+
+    import_rosinstall(rosinstall, target_dir, CloneOptions(use_mirrors=False))
+    assert is_shallow_repository(os.path.join(target_dir, "shallow"))
+    assert not is_shallow_repository(os.path.join(target_dir, "full"))
+
+
+def test_sparse_clone(bare_remote, tmp_path):
+    remote_dir, work_dir = bare_remote
+    for package in ["pkg_a", "pkg_b", "pkg_c"]:
+        os.mkdir(os.path.join(work_dir, package))
+        commit_file(work_dir, os.path.join(package, "package.xml"))
+    git("push", "--quiet", "origin", "main", cwd=work_dir)
+    package_dir = str(tmp_path / "ws" / "repo")
+
+    clone_repository(
+        "file://" + remote_dir,
+        package_dir,
+        CloneOptions(use_mirrors=False).for_repo({"sparse": ["pkg_a", "pkg_c"]}),
+        "main",
+    )
+    assert os.path.isfile(os.path.join(package_dir, "pkg_a", "package.xml"))
+    assert not os.path.exists(os.path.join(package_dir, "pkg_b"))
+    assert os.path.isfile(os.path.join(package_dir, "README.md"))
+    assert get_sparse_paths(package_dir) == ["pkg_a", "pkg_c"]
+
+    entry = create_rosinstall_entry(package_dir, "repo")
+    assert entry["git"]["sparse"] == ["pkg_a", "pkg_c"]
+    assert "sparse" not in create_rosinstall_entry(work_dir, "work")["git"]
+
+
+def test_submodule_strategy_args():
+    options = CloneOptions(use_mirrors=False, submodule_strategy="recursive")
+    assert options.submodule_clone_args() == ["--recurse-submodules"]
+    assert options.submodule_update_args() == ["--init", "--recursive"]
+
+    options = CloneOptions(
+        use_mirrors=False, submodule_strategy="parallel", submodule_jobs=4
+    )
+    assert options.submodule_clone_args() == ["--recurse-submodules", "--jobs", "4"]
+
+    options = CloneOptions(
+        use_mirrors=False, submodule_strategy="shallow", submodule_jobs=4
+    )
+    assert options.submodule_clone_args() == [
+        "--recurse-submodules",
+        "--jobs",
+        "4",
+        "--shallow-submodules",
+    ]
+    assert options.submodule_update_args() == [
+        "--init",
+        "--recursive",
+        "--jobs",
+        "4",
+        "--depth",
+        "1",
+    ]
+
+    options = CloneOptions(use_mirrors=False, submodule_strategy="lazy")
+    assert options.submodule_clone_args() == []
+    assert options.defers_submodules()
+
+    options = CloneOptions(
+        use_mirrors=False, no_submodules=True, submodule_strategy="parallel"
+    )
+    assert options.submodule_clone_args() == []
+    assert not options.defers_submodules()
+
+
+def test_shallow_submodules(remote_with_submodule, tmp_path):
+    remote_dir, _ = remote_with_submodule
+    package_dir = str(tmp_path / "ws" / "repo")
+
+    clone_repository(
+        "file://" + remote_dir,
+        package_dir,
+        CloneOptions(use_mirrors=False, submodule_strategy="shallow"),
+    )
+    sub_dir = os.path.join(package_dir, "sub")
+    assert os.path.isfile(os.path.join(sub_dir, "second.txt"))
+    assert is_shallow_repository(sub_dir)
+
+
+def test_quiet_clone(remote_with_submodule, tmp_path, capfd):
+    remote_dir, work_dir = remote_with_submodule
+    package_dir = str(tmp_path / "ws" / "repo")
+    commit = git("rev-parse", "HEAD", cwd=work_dir)
+    capfd.readouterr()
+
+    options = CloneOptions(use_mirrors=False, quiet=True)
+    assert "--quiet" in options.submodule_update_args()
+    clone_repository("file://" + remote_dir, package_dir, options, commit)
+    assert os.path.isfile(os.path.join(package_dir, "sub", "second.txt"))
+    assert capfd.readouterr() == ("", "")
+
+
+def test_lazy_submodules(remote_with_submodule, tmp_path):
+    remote_dir, _ = remote_with_submodule
+    target_dir = str(tmp_path / "ws" / "src")
+    rosinstall = [{"git": {"local-name": "repo", "uri": remote_dir, "version": "main"}}]
+
+    options = CloneOptions(use_mirrors=False, submodule_strategy="lazy")
+    import_rosinstall(rosinstall, target_dir, options)
+    sub_dir = os.path.join(target_dir, "repo", "sub")
+    assert not os.path.isfile(os.path.join(sub_dir, "second.txt"))
+    assert os.path.isfile(os.path.join(target_dir, LAZY_SUBMODULES_FILENAME))
+
+    init_lazy_submodules(target_dir, options)
+    assert os.path.isfile(os.path.join(sub_dir, "second.txt"))
+    assert not os.path.isfile(os.path.join(target_dir, LAZY_SUBMODULES_FILENAME))
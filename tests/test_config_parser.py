@@ -0,0 +1,95 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+from robot_folders.helpers.ConfigParser import ConfigFileParser
+
+
+def test_parse_sparse_paths(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        """
+colcon_workspace:
+  rosinstall:
+  - git:
+      local-name: mono
+      uri: https://example.com/mono.git
+      version: main
+      sparse: /packages/pkg_a/
+  - git:
+      local-name: other
+      uri: https://example.com/other.git
+      sparse: [pkg_b, pkg_c/]
+  - git:
+      local-name: full
+      uri: https://example.com/full.git
+"""
+    )
+    parser = ConfigFileParser(str(config_file))
+    has_colcon, rosinstall = parser.parse_ros2_config()
+    assert has_colcon
+    assert rosinstall[0]["git"]["sparse"] == ["packages/pkg_a"]
+    assert rosinstall[1]["git"]["sparse"] == ["pkg_b", "pkg_c"]
+    assert "sparse" not in rosinstall[2]["git"]
+
+
+def test_validate(tmp_path):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        """
+colcon_worksapce:
+  rosinstall: []
+catkin_workspace:
+  rosinstall:
+  - git:
+      local-name: pkg
+      uri: https://example.com/pkg.git
+      depth: 0
+      sparse: {a: b}
+      verison: main
+  - git:
+      local-name: pkg
+  - git:
+      local-name: ../outside
+      uri: https://example.com/outside.git
+      bundle: missing.bundle
+  - svn:
+      local-name: old
+      uri: https://example.com/svn
+  - foo: {}
+demos:
+  run: echo hello
+"""
+    )
+    problems, warnings = ConfigFileParser(str(config_file)).validate()
+    assert warnings == [
+        "Unknown section 'colcon_worksapce' is ignored, expected one of "
+        "misc_ws, catkin_workspace, colcon_workspace, demos",
+        "catkin_workspace: Repository 'pkg': Unknown entry 'verison' is ignored",
+    ]
+    assert problems == [
+        "catkin_workspace: Repository 'pkg': depth has to be a positive number",
+        "catkin_workspace: Repository 'pkg': sparse has to be a list of paths",
+        "catkin_workspace: Repository 'pkg': local-name is used twice",
+        "catkin_workspace: Repository 'pkg': No uri given",
+        "catkin_workspace: Repository '../outside': local-name has to be a relative path",
+        "catkin_workspace: Repository '../outside': Bundle missing.bundle does not exist",
+        "catkin_workspace: Entry 5 has unknown repository type 'foo'",
+    ]
@@ -0,0 +1,157 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+import subprocess
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.commands.copy_environment as copy_environment
+
+from .fixture_git_repositories import (
+    bare_remote,
+    commit_file,
+    git,
+    git_identity,
+    remote_with_submodule,
+)
+
+
+@pytest.fixture
+def source_env(tmp_path, monkeypatch, bare_remote):
+    """Creates an environment 'source' with a colcon workspace containing one repository on
+    a feature branch and a misc workspace"""
+    remote_dir, _ = bare_remote
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+
+    env_dir = os.path.join(checkout_dir, "source")
+    os.makedirs(os.path.join(env_dir, "demos"))
+    with open(os.path.join(env_dir, "demos", "demo.sh"), "w") as demo_file:
+        demo_file.write("echo demo")
+    with open(os.path.join(env_dir, "underlays.txt"), "w") as underlay_file:
+        underlay_file.write(os.path.join(checkout_dir, "underlay") + "\n")
+    os.makedirs(os.path.join(env_dir, "misc_ws", "export"))
+    os.makedirs(os.path.join(env_dir, "colcon_ws", "build", "repo"))
+    os.makedirs(os.path.join(env_dir, "colcon_ws", "install"))
+
+    repo_dir = os.path.join(env_dir, "colcon_ws", "src", "group", "repo")
+    git("clone", "--quiet", remote_dir, repo_dir)
+    git("checkout", "--quiet", "-b", "feature", cwd=repo_dir)
+    git("push", "--quiet", "-u", "origin", "feature", cwd=repo_dir)
+    commit = commit_file(repo_dir, "local.txt")
+    yield checkout_dir, repo_dir, commit
+
+
+@pytest.mark.parametrize("mode", ["hardlink", "shared", "worktree"])
+def test_copy_environment(source_env, mode):
+    checkout_dir, source_repo, commit = source_env
+    runner = CliRunner()
+    result = runner.invoke(
+        copy_environment.cli,
+        ["--mode", mode, "--local_build", "yes", "source", "target"],
+    )
+    print(result.output)
+    assert result.exit_code == 0
+
+    env_dir = os.path.join(checkout_dir, "target")
+    assert os.path.isfile(os.path.join(env_dir, "demos", "demo.sh"))
+    assert os.path.isfile(os.path.join(env_dir, "underlays.txt"))
+    assert os.path.isdir(os.path.join(env_dir, "misc_ws", "export"))
+    assert not os.path.exists(os.path.join(env_dir, "colcon_ws", "build"))
+    assert not os.path.exists(os.path.join(env_dir, "colcon_ws", "install"))
+
+    repo_dir = os.path.join(env_dir, "colcon_ws", "src", "group", "repo")
+    assert git("rev-parse", "HEAD", cwd=repo_dir) == commit
+    assert os.path.isfile(os.path.join(repo_dir, "local.txt"))
+    if mode == "worktree":
+        assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=repo_dir) == "HEAD"
+    else:
+        assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=repo_dir) == "feature"
+        assert git("remote", "get-url", "origin", cwd=repo_dir) == git(
+            "remote", "get-url", "origin", cwd=source_repo
+        )
+        assert (
+            git("rev-parse", "--abbrev-ref", "feature@{upstream}", cwd=repo_dir)
+            == "origin/feature"
+        )
+        assert git("rev-parse", "main", cwd=repo_dir) == git(
+            "rev-parse", "main", cwd=source_repo
+        )
+        assert (
+            git("rev-parse", "--abbrev-ref", "main@{upstream}", cwd=repo_dir)
+            == "origin/main"
+        )
+
+
+def test_copy_to_existing_environment(source_env):
+    runner = CliRunner()
+    result = runner.invoke(
+        copy_environment.cli, ["--local_build", "yes", "source", "source"]
+    )
+    assert result.exit_code != 0
+
+
+@pytest.mark.parametrize("mode", ["hardlink", "shared", "worktree"])
+def test_copy_submodules_from_source(
+    tmp_path, monkeypatch, remote_with_submodule, mode
+):
+    remote_dir, _ = remote_with_submodule
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    source_repo = os.path.join(checkout_dir, "source", "colcon_ws", "src", "repo")
+    git("clone", "--quiet", "--recurse-submodules", remote_dir, source_repo)
+    sub_url = git("remote", "get-url", "origin", cwd=os.path.join(source_repo, "sub"))
+    # The submodule must not be fetched from its remote again
+    os.rename(
+        str(tmp_path / "remotes" / "sub.git"), str(tmp_path / "remotes" / "gone.git")
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        copy_environment.cli,
+        ["--mode", mode, "--local_build", "yes", "source", "target"],
+    )
+    print(result.output)
+    assert result.exit_code == 0
+
+    sub_dir = os.path.join(checkout_dir, "target", "colcon_ws", "src", "repo", "sub")
+    assert os.path.isfile(os.path.join(sub_dir, "second.txt"))
+    assert git("remote", "get-url", "origin", cwd=sub_dir) == sub_url
+
+
+def test_copy_failure_removes_target(source_env, monkeypatch):
+    checkout_dir, _, _ = source_env
+
+    def fail(*args, **kwargs):
+        raise subprocess.CalledProcessError(1, "git")
+
+    monkeypatch.setattr(copy_environment, "copy_repository", fail)
+    runner = CliRunner()
+    result = runner.invoke(
+        copy_environment.cli, ["--local_build", "yes", "source", "target"]
+    )
+    assert result.exit_code != 0
+    assert not os.path.exists(os.path.join(checkout_dir, "target"))
+    assert os.path.isdir(os.path.join(checkout_dir, "source"))
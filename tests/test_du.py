@@ -0,0 +1,124 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+import re
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.commands.du as du
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.helpers.disk_usage_helpers as disk_usage_helpers
+from robot_folders.helpers.cache_helpers import DiskUsageCache
+
+
+def write_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as out_file:
+        out_file.write(os.urandom(size))
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch):
+    """Creates an environment 'env' whose colcon build folder lives in the build base"""
+    checkout_dir = str(tmp_path / "checkout")
+    build_base_dir = str(tmp_path / "no_backup" / "robot_folders_build_base")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setattr(
+        directory_helpers, "get_build_base_dir", lambda use_no_backup: build_base_dir
+    )
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    env_dir = os.path.join(checkout_dir, "env")
+    colcon_dir = os.path.join(env_dir, "colcon_ws")
+    write_file(os.path.join(colcon_dir, "src", "pkg", "source.cpp"), 20000)
+    write_file(os.path.join(colcon_dir, "install", "pkg", "lib.so"), 30000)
+    build_dir = os.path.join(build_base_dir, "env", "colcon_ws", "build")
+    write_file(os.path.join(build_dir, "pkg", "object.o"), 50000)
+    os.symlink(build_dir, os.path.join(colcon_dir, "build"))
+    write_file(os.path.join(build_base_dir, "env", "leftover", "file"), 10000)
+    open(os.path.join(env_dir, "setup.sh"), "w").close()
+    yield env_dir, build_dir
+
+
+def test_measure_trees(environment):
+    env_dir, build_dir = environment
+    colcon_dir = os.path.join(env_dir, "colcon_ws")
+    roots = [
+        os.path.join(colcon_dir, "src"),
+        os.path.join(colcon_dir, "build"),
+        env_dir,
+    ]
+    sizes = disk_usage_helpers.measure_trees(roots, jobs=4)
+    assert sizes[os.path.realpath(roots[0])] == directory_helpers.get_directory_size(
+        roots[0]
+    )
+    assert sizes[build_dir] == directory_helpers.get_directory_size(build_dir)
+    # The sources are only counted for their own root
+    assert sizes[env_dir] == directory_helpers.get_directory_size(
+        env_dir
+    ) - directory_helpers.get_directory_size(roots[0])
+
+
+def test_measure_trees_cached(environment, mocker):
+    env_dir, _ = environment
+    cache = DiskUsageCache()
+    sizes = disk_usage_helpers.measure_trees([env_dir], cache=cache)
+    cache.save()
+
+    cache = DiskUsageCache()
+    scandir = mocker.spy(disk_usage_helpers.os, "scandir")
+    assert disk_usage_helpers.measure_trees([env_dir], cache=cache) == sizes
+    assert scandir.call_count == 0
+
+    # Adding a file changes the modification time of its folder
+    write_file(os.path.join(env_dir, "colcon_ws", "src", "pkg", "new.cpp"), 40000)
+    new_sizes = disk_usage_helpers.measure_trees([env_dir], cache=cache)
+    assert new_sizes[env_dir] > sizes[env_dir]
+    assert scandir.call_count == 1
+
+
+def test_du(environment):
+    result = CliRunner().invoke(du.cli, ["env"])
+    print(result.output)
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0].split() == [
+        "Environment",
+        "src",
+        "build",
+        "devel/install",
+        "log",
+        "misc",
+        "export",
+        "other",
+        "Total",
+    ]
+    assert lines[2].startswith("env ")
+    assert lines[3].startswith("total ")
+    columns = re.split(r"\s{2,}", lines[2])
+    # The build folder and the leftovers on no_backup are counted
+    assert columns[2] != "0 B"
+    assert columns[6] != "0 B"
+
+    result = CliRunner().invoke(du.cli, ["unknown"])
+    assert result.exit_code != 0
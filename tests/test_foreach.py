@@ -0,0 +1,82 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.commands.foreach as foreach
+
+from .fixture_git_repositories import bare_remote, git, git_identity
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch, bare_remote):
+    """Creates the active environment 'env' with repositories in both workspaces"""
+    remote_dir, _ = bare_remote
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setenv("ROB_FOLDERS_ACTIVE_ENV", "env")
+    env_dir = os.path.join(checkout_dir, "env")
+    for repo in ["colcon_ws/src/a", "colcon_ws/src/group/b", "misc_ws/c"]:
+        git("clone", "--quiet", remote_dir, os.path.join(env_dir, repo))
+    yield env_dir
+
+
+def test_foreach(environment):
+    result = CliRunner().invoke(foreach.cli, ["--", "echo", "$ROB_FOLDERS_REPO_NAME"])
+    print(result.output)
+    assert result.exit_code == 0
+    # The arguments are quoted, so the variable is not expanded
+    assert "[group/b] $ROB_FOLDERS_REPO_NAME" in result.output
+    assert "3 of 3 repositories succeeded" in result.output
+
+    result = CliRunner().invoke(
+        foreach.cli,
+        [
+            "--ws",
+            "colcon",
+            "--interleave",
+            "-j",
+            "1",
+            "echo $ROB_FOLDERS_REPO_WORKSPACE",
+        ],
+    )
+    assert result.exit_code == 0
+    assert result.output.count("[a] colcon") == 1
+    assert "[c]" not in result.output
+
+
+def test_foreach_filters(environment):
+    with open(os.path.join(environment, "misc_ws", "c", "README.md"), "w") as out_file:
+        out_file.write("modified")
+    result = CliRunner().invoke(foreach.cli, ["--dirty", "git diff --name-only"])
+    assert "[c] README.md" in result.output
+    assert "1 of 1 repositories succeeded" in result.output
+
+    result = CliRunner().invoke(
+        foreach.cli, ["--name", "group/*", "--name", "a", "false"]
+    )
+    assert result.exit_code != 0
+    assert "0 of 2 repositories succeeded" in result.output
@@ -0,0 +1,114 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+import time
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.commands.gc as gc
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.helpers.trash_helpers as trash_helpers
+from robot_folders.helpers.cache_helpers import DiskUsageCache
+
+
+def create_environment(checkout_dir, env_name, build_dir):
+    """Creates an environment whose colcon build folder is a symlink to build_dir"""
+    colcon_dir = os.path.join(checkout_dir, env_name, "colcon_ws")
+    os.makedirs(os.path.join(colcon_dir, "src"))
+    open(os.path.join(checkout_dir, env_name, "setup.sh"), "w").close()
+    os.symlink(build_dir, os.path.join(colcon_dir, "build"))
+
+
+def create_build_dir(build_dir):
+    os.makedirs(os.path.join(build_dir, "pkg"))
+    with open(os.path.join(build_dir, "pkg", "object.o"), "w") as out_file:
+        out_file.write("object" * 1000)
+
+
+@pytest.fixture
+def checkout(tmp_path, monkeypatch, mocker):
+    checkout_dir = str(tmp_path / "checkout")
+    build_base_dir = str(tmp_path / "no_backup" / "robot_folders_build_base")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setattr(
+        directory_helpers, "get_build_base_dir", lambda use_no_backup: build_base_dir
+    )
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("ROB_FOLDERS_ACTIVE_ENV", "active")
+    mocker.patch.object(trash_helpers.subprocess, "Popen")
+
+    for env_name in ["active", "old"]:
+        build_dir = os.path.join(build_base_dir, env_name, "colcon_ws", "build")
+        create_build_dir(build_dir)
+        create_environment(checkout_dir, env_name, build_dir)
+    # An environment that has been renamed manually still uses its old build folder
+    renamed_build_dir = os.path.join(build_base_dir, "before", "colcon_ws", "build")
+    create_build_dir(renamed_build_dir)
+    create_environment(checkout_dir, "renamed", renamed_build_dir)
+    # The build folder of an environment deleted manually
+    create_build_dir(os.path.join(build_base_dir, "deleted", "colcon_ws", "build"))
+    # A build folder that has been deleted manually
+    create_environment(checkout_dir, "dangling", os.path.join(build_base_dir, "gone"))
+
+    long_ago = time.time() - 100 * gc.SECONDS_PER_DAY
+    old_build_dir = os.path.join(build_base_dir, "old", "colcon_ws", "build")
+    for path in [old_build_dir, os.path.join(old_build_dir, "pkg")]:
+        os.utime(path, (long_ago, long_ago))
+    directory_helpers.mark_env_used("renamed")
+    yield checkout_dir, build_base_dir
+
+
+def test_gc_report(checkout):
+    checkout_dir, build_base_dir = checkout
+    result = CliRunner().invoke(gc.cli, [])
+    print(result.output)
+    assert result.exit_code == 0
+    assert os.path.join(build_base_dir, "deleted") in result.output
+    assert os.path.join(build_base_dir, "before") not in result.output
+    assert os.path.join(build_base_dir, "old") not in result.output
+    assert "dangling/colcon_ws/build points to" in result.output
+    # Nothing is deleted without --reclaim
+    assert os.path.isdir(os.path.join(build_base_dir, "deleted"))
+    # The measured directories are cached for the next run
+    assert os.path.join(build_base_dir, "deleted") in DiskUsageCache().keys()
+
+    result = CliRunner().invoke(gc.cli, ["--unused_days=30"])
+    print(result.output)
+    assert os.path.join(build_base_dir, "old", "colcon_ws", "build") in result.output
+    assert "100 days" in result.output
+    assert os.path.join(build_base_dir, "active") not in result.output
+    assert os.path.join(build_base_dir, "before") not in result.output
+
+
+def test_gc_reclaim(checkout):
+    checkout_dir, build_base_dir = checkout
+    result = CliRunner().invoke(gc.cli, ["--unused_days=30", "--reclaim", "--force"])
+    print(result.output)
+    assert result.exit_code == 0
+    assert not os.path.exists(os.path.join(build_base_dir, "deleted"))
+    # Build folders of unused environments are emptied, but kept for later builds
+    old_build_dir = os.path.join(build_base_dir, "old", "colcon_ws", "build")
+    assert os.listdir(old_build_dir) == []
+    assert os.listdir(os.path.join(build_base_dir, "active", "colcon_ws", "build"))
+    assert os.listdir(os.path.join(build_base_dir, "before", "colcon_ws", "build"))
@@ -0,0 +1,131 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+from robot_folders.helpers.git_metadata_helpers import (
+    GitMetadata,
+    GitPythonMetadata,
+    UnsupportedRepository,
+    parse_config,
+    read_with_fallback,
+)
+from robot_folders.helpers.repository_helpers import (
+    get_remote_urls,
+    get_sparse_paths,
+    parse_repository,
+    read_head,
+)
+
+from .fixture_git_repositories import bare_remote, commit_file, git, git_identity
+
+
+def assert_same_metadata(repo_dir):
+    """Compares the file based reader with GitPython"""
+    for use_commit_id in [False, True]:
+        assert read_head(GitMetadata(repo_dir), use_commit_id) == read_head(
+            GitPythonMetadata(repo_dir), use_commit_id
+        )
+
+
+def test_branch_and_remotes(tmp_path, bare_remote):
+    remote_dir, work_dir = bare_remote
+    git("remote", "add", "fork", "https://example.com/fork.git", cwd=work_dir)
+    git("branch", "--quiet", "--set-upstream-to", "origin/main", cwd=work_dir)
+    metadata = GitMetadata(work_dir)
+    assert metadata.active_branch() == "main"
+    assert metadata.upstream("main") == ("origin", "refs/heads/main")
+    assert metadata.remotes() == [
+        ("origin", [remote_dir]),
+        ("fork", ["https://example.com/fork.git"]),
+    ]
+    assert_same_metadata(work_dir)
+
+    # Packed refs are found as well
+    git("pack-refs", "--all", cwd=work_dir)
+    assert not os.path.exists(os.path.join(work_dir, ".git", "refs", "heads", "main"))
+    assert_same_metadata(work_dir)
+
+
+def test_detached_head_and_worktree(tmp_path, bare_remote):
+    _, work_dir = bare_remote
+    commit = commit_file(work_dir, "second.txt")
+    git("checkout", "--quiet", "--detach", cwd=work_dir)
+    assert GitMetadata(work_dir).active_branch() is None
+    assert GitMetadata(work_dir).head_commit() == commit
+    assert_same_metadata(work_dir)
+
+    worktree_dir = str(tmp_path / "worktree")
+    git(
+        "worktree",
+        "add",
+        "--quiet",
+        "-b",
+        "feature",
+        worktree_dir,
+        "main",
+        cwd=work_dir,
+    )
+    metadata = GitMetadata(worktree_dir)
+    assert metadata.active_branch() == "feature"
+    assert metadata.head_commit() == commit
+    assert_same_metadata(worktree_dir)
+    assert parse_repository(worktree_dir, False) == (
+        metadata.remotes()[0][1][0],
+        "feature",
+    )
+
+
+def test_parse_config(tmp_path):
+    config_file = tmp_path / "config"
+    config_file.write_text(
+        "[core]\n"
+        "\tbare = false ; comment\n"
+        "\tsparseCheckout\n"
+        '[remote "My Remote"]\n'
+        '\turl = "/path/with # hash"\n'
+        "\turl = second\n"
+        "[Branch.main]\n"
+        "\tremote = origin\n"
+    )
+    assert parse_config(str(config_file)) == [
+        ("core", None, "bare", "false"),
+        ("core", None, "sparsecheckout", None),
+        ("remote", "My Remote", "url", "/path/with # hash"),
+        ("remote", "My Remote", "url", "second"),
+        ("branch", "main", "remote", "origin"),
+    ]
+
+
+def test_fallback_to_gitpython(tmp_path, bare_remote):
+    remote_dir, work_dir = bare_remote
+    with open(os.path.join(work_dir, ".git", "config"), "a") as config_file:
+        config_file.write("[include]\n\tpath = other.config\n")
+    with pytest.raises(UnsupportedRepository):
+        GitMetadata(work_dir)
+    assert isinstance(
+        read_with_fallback(work_dir, lambda metadata: metadata), GitPythonMetadata
+    )
+    assert parse_repository(work_dir, False) == (remote_dir, "main")
+    assert get_remote_urls(work_dir) == [remote_dir]
+    assert get_sparse_paths(work_dir) is None
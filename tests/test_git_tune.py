@@ -0,0 +1,89 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.commands.git_tune as git_tune
+
+from .fixture_git_repositories import bare_remote, commit_file, git, git_identity
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch, bare_remote):
+    """Creates an environment 'env' with a clone of bare_remote and a linked worktree"""
+    remote_dir, _ = bare_remote
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    src_dir = os.path.join(checkout_dir, "env", "colcon_ws", "src")
+    repo_dir = os.path.join(src_dir, "repo")
+    git("clone", "--quiet", remote_dir, repo_dir)
+    for index in range(3):
+        commit_file(repo_dir, "file_{}.txt".format(index), "content {}".format(index))
+    git(
+        "worktree",
+        "add",
+        "--quiet",
+        "--detach",
+        os.path.join(src_dir, "tree"),
+        cwd=repo_dir,
+    )
+    yield repo_dir
+
+
+def test_git_tune(environment, mocker):
+    repo_dir = environment
+    spy = mocker.spy(git_tune, "tune_repository")
+    result = CliRunner().invoke(git_tune.cli, ["--no_schedule", "--fsmonitor", "env"])
+    print(result.output)
+    assert result.exit_code == 0
+    # The worktree shares the object database of the repository
+    assert spy.call_count == 1
+    assert git("config", "feature.manyFiles", cwd=repo_dir) == "true"
+    assert git("config", "core.untrackedCache", cwd=repo_dir) == "true"
+    pack_dir = os.path.join(repo_dir, ".git", "objects", "pack")
+    assert "multi-pack-index" in os.listdir(pack_dir)
+    assert os.path.exists(
+        os.path.join(repo_dir, ".git", "objects", "info", "commit-graph")
+    )
+    assert "Reclaimed" in result.output
+
+
+def test_git_tune_keeps_borrowed_objects(environment, mocker):
+    repo_dir = environment
+    copy_dir = os.path.join(
+        directory_helpers.get_checkout_dir(), "copy", "colcon_ws", "src", "repo"
+    )
+    git("clone", "--quiet", "--shared", repo_dir, copy_dir)
+    spy = mocker.spy(git_tune, "tune_repository")
+    schedule = mocker.patch.object(git_tune, "schedule_maintenance")
+    result = CliRunner().invoke(git_tune.cli, [])
+    print(result.output)
+    assert result.exit_code == 0
+    prune = dict((call[0][0], call[0][3]) for call in spy.call_args_list)
+    assert prune == {repo_dir: False, copy_dir: True}
+    # Only the copy is maintained in the background
+    assert schedule.call_args[0][0] == [copy_dir]
+    assert git("log", "--oneline", cwd=copy_dir)
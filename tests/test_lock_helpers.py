@@ -0,0 +1,137 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import robot_folders.helpers.directory_helpers as directory_helpers
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.lock_helpers import EnvironmentLock, FileLock, checkout_lock
+
+
+@pytest.fixture
+def checkout_dir(tmp_path, monkeypatch):
+    checkout_dir = str(tmp_path / "checkout")
+    os.makedirs(checkout_dir)
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    yield checkout_dir
+
+
+def hold_lock(path, shared=False):
+    """Starts a process holding a lock on path until its stdin is closed"""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import fcntl, sys\n"
+            "lock_file = open(sys.argv[1], 'a')\n"
+            "fcntl.flock(lock_file, fcntl.{})\n"
+            "print('locked', flush=True)\n"
+            "sys.stdin.read()\n".format("LOCK_SH" if shared else "LOCK_EX"),
+            path,
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert process.stdout.readline().strip() == "locked"
+    return process
+
+
+def test_lock_timeout(tmp_path):
+    lock_path = str(tmp_path / "test.lock")
+    process = hold_lock(lock_path)
+    try:
+        with pytest.raises(ModuleException):
+            FileLock(lock_path, timeout=0.2).acquire()
+        # Shared locks conflict with exclusive ones as well
+        with pytest.raises(ModuleException):
+            FileLock(lock_path, shared=True, timeout=0).acquire()
+    finally:
+        process.stdin.close()
+        process.wait()
+
+    with FileLock(lock_path, timeout=0):
+        pass
+
+
+def test_locks_exclude_other_threads(tmp_path):
+    lock_path = str(tmp_path / "test.lock")
+    errors = list()
+
+    def acquire():
+        try:
+            FileLock(lock_path, timeout=0).acquire()
+        except ModuleException as err:
+            errors.append(err)
+
+    with FileLock(lock_path):
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+    assert len(errors) == 1
+
+
+def test_shared_locks(tmp_path):
+    lock_path = str(tmp_path / "test.lock")
+    process = hold_lock(lock_path, shared=True)
+    try:
+        with FileLock(lock_path, shared=True, timeout=0):
+            pass
+        with pytest.raises(ModuleException):
+            FileLock(lock_path, timeout=0).acquire()
+    finally:
+        process.stdin.close()
+        process.wait()
+
+
+def test_locks_are_reentrant(checkout_dir):
+    with EnvironmentLock("env", timeout=0):
+        with EnvironmentLock("env", timeout=0):
+            pass
+        # Still held by the outer lock
+        lock_path = os.path.join(checkout_dir, ".locks", "env.lock")
+        assert lock_path in FileLock.held_locks()
+    assert FileLock.held_locks() == dict()
+
+
+def test_checkout_lock_excludes_environment_locks(checkout_dir):
+    os.makedirs(os.path.join(checkout_dir, ".locks"))
+    process = hold_lock(os.path.join(checkout_dir, ".locks", ".checkout.lock"))
+    try:
+        with pytest.raises(ModuleException):
+            EnvironmentLock("env", timeout=0).__enter__()
+    finally:
+        process.stdin.close()
+        process.wait()
+    with checkout_lock(timeout=0):
+        pass
+
+
+def test_set_last_activated_env(checkout_dir):
+    directory_helpers.set_last_activated_env("first")
+    directory_helpers.set_last_activated_env("second")
+    assert directory_helpers.get_last_activated_env() == "second"
+    assert os.listdir(checkout_dir) == [".cur_env"]
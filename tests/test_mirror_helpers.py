@@ -0,0 +1,103 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+import robot_folders.helpers.mirror_helpers as mirror_helpers
+from robot_folders.helpers.clone_helpers import (
+    CloneOptions,
+    clone_repository,
+    import_rosinstall,
+)
+
+from .fixture_git_repositories import bare_remote, commit_file, git, git_identity
+
+
+@pytest.fixture
+def mirror_dir(tmp_path, monkeypatch):
+    mirror_dir = str(tmp_path / "mirrors")
+    monkeypatch.setattr(mirror_helpers, "get_mirror_dir", lambda: mirror_dir)
+    yield mirror_dir
+
+
+def test_mirror_path_is_keyed_by_uri(mirror_dir):
+    cache = mirror_helpers.MirrorCache()
+    assert cache.mirror_path("https://example.com/foo.git") == cache.mirror_path(
+        "https://example.com/foo/"
+    )
+    assert cache.mirror_path("https://example.com/foo.git") != cache.mirror_path(
+        "https://example.org/foo.git"
+    )
+    assert os.path.basename(cache.mirror_path("https://example.com/foo")).startswith(
+        "foo-"
+    )
+
+
+def test_mirror_update(bare_remote, mirror_dir):
+    remote_dir, work_dir = bare_remote
+    cache = mirror_helpers.MirrorCache()
+
+    path = cache.update(remote_dir)
+    assert cache.has_mirror(remote_dir)
+    assert cache.list_mirrors() == {path: remote_dir}
+
+    new_commit = commit_file(work_dir, "second.txt")
+    git("push", "--quiet", "origin", "main", cwd=work_dir)
+    assert cache.update(remote_dir) == path
+    assert git("--git-dir", path, "rev-parse", "main") == new_commit
+    assert cache.update_all() == []
+
+
+def test_clone_from_mirror(bare_remote, mirror_dir, tmp_path):
+    remote_dir, _ = bare_remote
+    package_dir = str(tmp_path / "ws" / "repo")
+
+    clone_repository(remote_dir, package_dir, CloneOptions(use_mirrors=True))
+    assert git("remote", "get-url", "origin", cwd=package_dir) == remote_dir
+    assert mirror_helpers.MirrorCache().has_mirror(remote_dir)
+    assert git("rev-parse", "HEAD", cwd=package_dir) == git(
+        "rev-parse", "main", cwd=remote_dir
+    )
+
+
+def test_import_rosinstall_from_mirror(bare_remote, mirror_dir, tmp_path):
+    remote_dir, _ = bare_remote
+    target_dir = str(tmp_path / "ws" / "src")
+    rosinstall = [{"git": {"local-name": "repo", "uri": remote_dir, "version": "main"}}]
+
+    import_rosinstall(rosinstall, target_dir, CloneOptions(use_mirrors=True))
+    package_dir = os.path.join(target_dir, "repo")
+    assert git("remote", "get-url", "origin", cwd=package_dir) == remote_dir
+    assert git("rev-parse", "--abbrev-ref", "HEAD", cwd=package_dir) == "main"
+
+
+def test_mirror_gc(bare_remote, mirror_dir):
+    remote_dir, _ = bare_remote
+    cache = mirror_helpers.MirrorCache()
+    path = cache.update(remote_dir)
+
+    assert cache.gc() == []
+    assert cache.gc(used_uris=[remote_dir]) == []
+    assert os.path.isdir(path)
+    assert cache.gc(used_uris=[]) == [path]
+    assert not os.path.isdir(path)
@@ -23,7 +23,7 @@ import click
 
 import pytest
 
-from robot_folders.helpers.option_helpers import SwallowAllOption
+from robot_folders.helpers.option_helpers import MultipleValuesOption, SwallowAllOption
 
 
 def test_swallow_all_option():
@@ -48,3 +48,23 @@ def test_swallow_all_option():
             click.echo("hello")
 
         runner.invoke(illegal_test_command)
+
+
+def test_multiple_values_option():
+    runner = click.testing.CliRunner()
+
+    @click.command()
+    @click.option("--packages", cls=MultipleValuesOption)
+    @click.option("--packages-above", "packages_above", cls=MultipleValuesOption)
+    @click.option("--flag", is_flag=True)
+    def test_command(packages, packages_above, flag):
+        click.echo(f"{packages} {packages_above} {flag}")
+
+    result = runner.invoke(
+        test_command, ["--packages", "a", "b", "--packages-above", "c", "--flag"]
+    )
+    assert result.exit_code == 0
+    assert result.output == "('a', 'b') ('c',) True\n"
+
+    result = runner.invoke(test_command, [])
+    assert result.output == "() () False\n"
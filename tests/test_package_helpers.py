@@ -0,0 +1,92 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+from robot_folders.helpers.exceptions import ModuleException
+from robot_folders.helpers.package_helpers import (
+    find_packages,
+    get_packages_above,
+    select_packages,
+)
+
+PACKAGE_XML = """<?xml version="1.0"?>
+<package format="3">
+  <name>{name}</name>
+  <version>0.0.1</version>
+  {dependencies}
+</package>
+"""
+
+
+def create_package(path, name, build_depends=(), exec_depends=()):
+    os.makedirs(path)
+    dependencies = [
+        "<build_depend>{}</build_depend>".format(dependency)
+        for dependency in build_depends
+    ] + [
+        "<exec_depend>{}</exec_depend>".format(dependency)
+        for dependency in exec_depends
+    ]
+    with open(os.path.join(path, "package.xml"), "w") as package_file:
+        package_file.write(
+            PACKAGE_XML.format(name=name, dependencies="\n  ".join(dependencies))
+        )
+
+
+@pytest.fixture
+def src_dir(tmp_path):
+    src_dir = str(tmp_path / "src")
+    create_package(os.path.join(src_dir, "base"), "base", build_depends=["rclcpp"])
+    create_package(os.path.join(src_dir, "repo", "middle"), "middle", ["base"])
+    create_package(os.path.join(src_dir, "repo", "top"), "top", exec_depends=["middle"])
+    create_package(os.path.join(src_dir, "other"), "other")
+    # Packages inside packages, ignored and hidden folders are not found
+    create_package(os.path.join(src_dir, "other", "nested"), "nested", ["base"])
+    create_package(os.path.join(src_dir, "ignored", "pkg"), "ignored", ["base"])
+    open(os.path.join(src_dir, "ignored", "COLCON_IGNORE"), "w").close()
+    create_package(os.path.join(src_dir, ".hidden"), "hidden", ["base"])
+    yield src_dir
+
+
+def test_find_packages(src_dir):
+    packages = find_packages(src_dir)
+    assert sorted(packages) == ["base", "middle", "other", "top"]
+    assert packages["middle"] == (os.path.join(src_dir, "repo", "middle"), {"base"})
+    assert packages["base"][1] == {"rclcpp"}
+
+
+def test_packages_above(src_dir):
+    packages = find_packages(src_dir)
+    assert get_packages_above(["base"], packages) == {"base", "middle", "top"}
+    assert get_packages_above(["top"], packages) == {"top"}
+    assert select_packages(src_dir, ["other"], ["middle"]) == ["middle", "other", "top"]
+    with pytest.raises(ModuleException):
+        select_packages(src_dir, ["unknown"])
+
+
+def test_invalid_package_xml(tmp_path):
+    os.makedirs(str(tmp_path / "broken"))
+    (tmp_path / "broken" / "package.xml").write_text("<package><name>")
+    with pytest.raises(ModuleException):
+        find_packages(str(tmp_path))
@@ -0,0 +1,67 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.commands.prefetch as prefetch
+
+from .fixture_git_repositories import bare_remote, commit_file, git, git_identity
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch, bare_remote):
+    """Creates an environment 'env' with a clone of bare_remote in its colcon workspace"""
+    remote_dir, work_dir = bare_remote
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    repo_dir = os.path.join(checkout_dir, "env", "colcon_ws", "src", "repo")
+    git("clone", "--quiet", remote_dir, repo_dir)
+    yield repo_dir, work_dir
+
+
+def test_prefetch(environment):
+    repo_dir, work_dir = environment
+    commit = commit_file(work_dir, "new.txt")
+    git("push", "--quiet", "origin", "main", cwd=work_dir)
+
+    result = CliRunner().invoke(prefetch.cli, [])
+    print(result.output)
+    assert result.exit_code == 0
+    assert git("rev-parse", "origin/main", cwd=repo_dir) == commit
+    # Local branches are not touched
+    assert git("rev-parse", "main", cwd=repo_dir) != commit
+
+
+def test_prefetch_retries(environment, monkeypatch):
+    repo_dir, _ = environment
+    monkeypatch.setattr(prefetch, "RETRY_DELAY", 0.01)
+    git("remote", "set-url", "origin", repo_dir + "_missing", cwd=repo_dir)
+    result = CliRunner().invoke(prefetch.cli, ["--retries", "1", "env"])
+    assert result.exit_code != 0
+    assert "Fetched 0 of 1 repositories" in result.output
+
+    result = CliRunner().invoke(prefetch.cli, ["unknown"])
+    assert result.exit_code != 0
@@ -0,0 +1,121 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.commands.add_environment as add_environment
+import robot_folders.helpers.directory_helpers as directory_helpers
+from robot_folders.helpers.ConfigParser import ConfigFileParser
+from robot_folders.helpers.preflight_helpers import check_remote, run_preflight
+
+from .fixture_git_repositories import bare_remote, git, git_identity
+
+
+@pytest.fixture
+def remote(bare_remote):
+    """Extends bare_remote by a tag 'v1.0'"""
+    remote_dir, work_dir = bare_remote
+    git("tag", "v1.0", cwd=work_dir)
+    git("push", "--quiet", "origin", "v1.0", cwd=work_dir)
+    yield remote_dir
+
+
+def write_config(tmp_path, remote_dir, version):
+    config_file = tmp_path / "config.yaml"
+    config_file.write_text(
+        """
+colcon_workspace:
+  rosinstall:
+  - git:
+      local-name: good
+      uri: {remote}
+      version: main
+      verison: main
+  - git:
+      local-name: missing_uri
+      uri: {missing}
+  - git:
+      local-name: versioned
+      uri: {remote}
+      version: {version}
+""".format(
+            remote=remote_dir,
+            missing=str(tmp_path / "missing.git"),
+            version=version,
+        )
+    )
+    return str(config_file)
+
+
+def test_check_remote(remote, tmp_path):
+    assert check_remote(remote) is None
+    assert check_remote(remote, "main") is None
+    assert check_remote(remote, "v1.0") is None
+    # Commit ids cannot be checked without fetching them
+    assert check_remote(remote, "0123456789abcdef") is None
+    assert "does not exist" in check_remote(remote, "deleted_branch")
+    assert "Cannot access" in check_remote(str(tmp_path / "missing.git"))
+
+
+def test_run_preflight(remote, tmp_path):
+    parser = ConfigFileParser(write_config(tmp_path, remote, "typo"))
+    problems, warnings = run_preflight(parser, jobs=2)
+    assert len(problems) == 2
+    assert "missing_uri" in problems[0]
+    assert "'typo' does not exist" in problems[1]
+    assert warnings == [
+        "colcon_workspace: Repository 'good': Unknown entry 'verison' is ignored"
+    ]
+
+    parser = ConfigFileParser(write_config(tmp_path, remote, "v1.0"))
+    assert len(run_preflight(parser)[0]) == 1
+    # Unknown entries are only reported as warnings, also without checking the remotes
+    problems, warnings = run_preflight(parser, check_remotes=False)
+    assert problems == []
+    assert len(warnings) == 1
+
+
+def test_add_environment_aborts_early(remote, tmp_path, monkeypatch):
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    config_file = write_config(tmp_path, remote, "typo")
+
+    result = CliRunner().invoke(
+        add_environment.cli,
+        [
+            "--config_file",
+            config_file,
+            "--local_build=yes",
+            "--underlays=skip",
+            "--no_build",
+            "broken_env",
+        ],
+    )
+    print(result.output)
+    assert result.exit_code != 0
+    assert "missing_uri" in result.output
+    assert "'typo' does not exist" in result.output
+    assert "WARNING" in result.output and "'verison' is ignored" in result.output
+    assert not os.path.exists(os.path.join(checkout_dir, "broken_env"))
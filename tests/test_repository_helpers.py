@@ -0,0 +1,75 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+from robot_folders.helpers.repository_helpers import (
+    find_repositories,
+    inspect_repositories,
+)
+
+
+def make_repo(path, git_file=False):
+    """Creates a fake repository at path. Only the .git entry matters for the discovery."""
+    os.makedirs(path)
+    if git_file:
+        with open(os.path.join(path, ".git"), "w") as out_file:
+            out_file.write("gitdir: ../.git/modules/sub\n")
+    else:
+        os.makedirs(os.path.join(path, ".git", "objects", "ab"))
+
+
+def test_find_repositories(tmp_path):
+    src_dir = str(tmp_path / "src")
+    make_repo(os.path.join(src_dir, "repo"))
+    make_repo(os.path.join(src_dir, "group", "a"))
+    make_repo(os.path.join(src_dir, "group", "b"))
+    make_repo(os.path.join(src_dir, "worktree"), git_file=True)
+    make_repo(os.path.join(src_dir, "repo", "nested"))
+    make_repo(os.path.join(src_dir, "repo", "sub"), git_file=True)
+    make_repo(os.path.join(src_dir, "ignored", "c"))
+    open(os.path.join(src_dir, "ignored", "COLCON_IGNORE"), "w").close()
+    make_repo(os.path.join(src_dir, "build", "d"))
+    os.symlink(os.path.join(src_dir, "group"), os.path.join(src_dir, "link"))
+
+    assert [name for name, _ in find_repositories(src_dir)] == [
+        "group/a",
+        "group/b",
+        "repo",
+        "worktree",
+    ]
+    assert find_repositories(src_dir)[0][1] == os.path.join(src_dir, "group", "a")
+    assert [name for name, _ in find_repositories(src_dir, nested=True)] == [
+        "group/a",
+        "group/b",
+        "repo",
+        "repo/nested",
+        "worktree",
+    ]
+
+
+def test_inspect_repositories(tmp_path):
+    src_dir = str(tmp_path / "src")
+    for name in ["c", "a", "b"]:
+        make_repo(os.path.join(src_dir, name))
+    assert inspect_repositories(
+        src_dir, lambda name, path: (name, os.path.basename(path)), jobs=2
+    ) == [("a", "a"), ("b", "b"), ("c", "c")]
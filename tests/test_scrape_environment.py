@@ -0,0 +1,95 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+import yaml
+
+from click.testing import CliRunner
+
+import robot_folders.helpers.cache_helpers as cache_helpers
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.commands.scrape_environment as scrape_environment
+import robot_folders.helpers.scrape_helpers as scrape_helpers
+
+from .fixture_git_repositories import bare_remote, git, git_identity
+
+
+@pytest.fixture
+def environments(tmp_path, monkeypatch, bare_remote):
+    """Creates the environments 'first' and 'second' each containing a clone of bare_remote"""
+    remote_dir, _ = bare_remote
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    repos = dict()
+    for env_name in ["first", "second"]:
+        repo_dir = os.path.join(checkout_dir, env_name, "colcon_ws", "src", "repo")
+        git("clone", "--quiet", remote_dir, repo_dir)
+        repos[env_name] = repo_dir
+    yield remote_dir, repos
+
+
+def test_scrape_all(tmp_path, environments):
+    remote_dir, _ = environments
+    expected = {
+        "colcon_workspace": {
+            "rosinstall": [
+                {"git": {"local-name": "repo", "uri": remote_dir, "version": "main"}}
+            ]
+        }
+    }
+    runner = CliRunner()
+
+    out_dir = str(tmp_path / "out")
+    result = runner.invoke(scrape_environment.cli, ["--all", out_dir])
+    print(result.output)
+    assert result.exit_code == 0
+    assert sorted(os.listdir(out_dir)) == ["first.yaml", "second.yaml"]
+    with open(os.path.join(out_dir, "first.yaml")) as config_file:
+        assert yaml.safe_load(config_file) == expected
+
+    lockfile = str(tmp_path / "all.yaml")
+    result = runner.invoke(scrape_environment.cli, ["--all", lockfile, "-j", "1"])
+    assert result.exit_code == 0
+    with open(lockfile) as config_file:
+        assert yaml.safe_load(config_file) == {"first": expected, "second": expected}
+
+
+def test_scrape_cache(tmp_path, environments, mocker):
+    _, repos = environments
+    out_dir = str(tmp_path / "out")
+    spy = mocker.spy(cache_helpers, "create_rosinstall_entry")
+    scrape_helpers.scrape_all(out_dir)
+    assert spy.call_count == 2
+
+    # Unchanged repositories are not inspected again
+    scrape_helpers.scrape_all(out_dir)
+    assert spy.call_count == 2
+
+    git("checkout", "--quiet", "-b", "feature", cwd=repos["first"])
+    scrape_helpers.scrape_all(out_dir)
+    assert spy.call_count == 3
+    assert spy.call_args[0][0] == repos["first"]
+    with open(os.path.join(out_dir, "first.yaml")) as config_file:
+        config = yaml.safe_load(config_file)
+    assert config["colcon_workspace"]["rosinstall"][0]["git"]["version"] == "feature"
@@ -0,0 +1,141 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+
+import robot_folders.helpers.ssh_helpers as ssh_helpers
+
+
+@pytest.fixture
+def ssh_environment(monkeypatch):
+    """Removes all variables influencing the ssh command from the environment"""
+    for name in ["GIT_SSH", "GIT_SSH_COMMAND", ssh_helpers.CONTROL_DIR_VARIABLE]:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(
+        ssh_helpers.config_helpers,
+        "get_value_safe_default",
+        lambda section, key, default, debug=True: default,
+    )
+
+
+def test_base_ssh_command(ssh_environment, monkeypatch):
+    monkeypatch.setenv("GIT_SSH_COMMAND", "ssh -i key")
+    assert ssh_helpers.get_base_ssh_command() == "ssh -i key"
+
+    monkeypatch.setenv("GIT_SSH_COMMAND", "/usr/bin/ssh")
+    assert ssh_helpers.get_base_ssh_command() == "/usr/bin/ssh"
+
+    # Custom programs might not understand ssh's options
+    monkeypatch.setenv("GIT_SSH_COMMAND", "plink")
+    assert ssh_helpers.get_base_ssh_command() is None
+
+    monkeypatch.delenv("GIT_SSH_COMMAND")
+    monkeypatch.setenv("GIT_SSH", "plink")
+    assert ssh_helpers.get_base_ssh_command() is None
+
+
+def test_multiplexing_command():
+    command = ssh_helpers.get_multiplexing_command("ssh -i key", "/tmp/ctl", batch=True)
+    assert command.startswith("ssh -i key -o ControlMaster=auto")
+    assert "-o ControlPath=/tmp/ctl/%C" in command
+    assert "-o ControlPersist=" in command
+    assert command.endswith("-o BatchMode=yes")
+    assert "BatchMode" not in ssh_helpers.get_multiplexing_command("ssh", "/tmp/ctl")
+
+
+def test_multiplexer(ssh_environment, monkeypatch, mocker):
+    monkeypatch.setenv("GIT_SSH_COMMAND", "ssh -i key")
+    with ssh_helpers.SshMultiplexer(batch=True) as multiplexer:
+        control_dir = multiplexer.control_dir
+        assert os.path.isdir(control_dir)
+        assert os.environ[ssh_helpers.CONTROL_DIR_VARIABLE] == control_dir
+        assert os.environ["GIT_SSH_COMMAND"].startswith("ssh -i key -o ")
+        assert "BatchMode=yes" in os.environ["GIT_SSH_COMMAND"]
+
+        # Nested multiplexers reuse the outer connections
+        with ssh_helpers.SshMultiplexer() as inner:
+            assert inner.control_dir is None
+            assert os.environ[ssh_helpers.CONTROL_DIR_VARIABLE] == control_dir
+
+        open(os.path.join(control_dir, "socket"), "w").close()
+        call = mocker.patch("subprocess.call")
+
+    call.assert_called_once()
+    assert "ControlPath={}".format(os.path.join(control_dir, "socket")) in (
+        call.call_args[0][0]
+    )
+    assert not os.path.exists(control_dir)
+    assert os.environ["GIT_SSH_COMMAND"] == "ssh -i key"
+    assert ssh_helpers.CONTROL_DIR_VARIABLE not in os.environ
+
+
+def test_multiplexer_disabled(ssh_environment, monkeypatch):
+    monkeypatch.setattr(
+        ssh_helpers.config_helpers,
+        "get_value_safe_default",
+        lambda section, key, default, debug=True: False,
+    )
+    with ssh_helpers.SshMultiplexer():
+        assert "GIT_SSH_COMMAND" not in os.environ
+
+    monkeypatch.setenv("GIT_SSH", "plink")
+    monkeypatch.setattr(
+        ssh_helpers.config_helpers,
+        "get_value_safe_default",
+        lambda section, key, default, debug=True: default,
+    )
+    with ssh_helpers.SshMultiplexer():
+        assert "GIT_SSH_COMMAND" not in os.environ
+
+
+def test_configured_ssh_command(ssh_environment, monkeypatch, tmp_path):
+    monkeypatch.delenv("GIT_CONFIG_GLOBAL", raising=False)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "xdg"))
+    (tmp_path / "xdg" / "git").mkdir(parents=True)
+    (tmp_path / "xdg" / "git" / "config").write_text(
+        "[core]\n\tsshCommand = ssh -i xdg\n"
+    )
+    assert ssh_helpers.get_base_ssh_command() == "ssh -i xdg"
+    # ~/.gitconfig takes precedence over the XDG config
+    (tmp_path / ".gitconfig").write_text("[core]\n\tsshCommand = ssh -i home\n")
+    assert ssh_helpers.get_base_ssh_command() == "ssh -i home"
+
+
+def test_nested_batch_multiplexer(ssh_environment, monkeypatch):
+    monkeypatch.setenv("GIT_SSH_COMMAND", "ssh -i key")
+    with ssh_helpers.SshMultiplexer():
+        outer_command = os.environ["GIT_SSH_COMMAND"]
+        assert "BatchMode" not in outer_command
+        # The batch environment never prompts, even inside an interactive multiplexer
+        assert ssh_helpers.get_batch_environment()["GIT_SSH_COMMAND"].endswith(
+            "-o BatchMode=yes"
+        )
+
+        with ssh_helpers.SshMultiplexer(batch=True) as inner:
+            assert inner.control_dir is None
+            assert os.environ["GIT_SSH_COMMAND"] == outer_command + " -o BatchMode=yes"
+        assert os.environ["GIT_SSH_COMMAND"] == outer_command
+
+    monkeypatch.setenv("GIT_SSH_COMMAND", "plink")
+    assert ssh_helpers.get_batch_environment()["GIT_SSH_COMMAND"] == "plink"
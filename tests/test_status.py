@@ -0,0 +1,152 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+
+import pytest
+import yaml
+
+from click.testing import CliRunner
+
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.helpers.scrape_helpers as scrape_helpers
+import robot_folders.commands.status as status
+
+from .fixture_git_repositories import bare_remote, commit_file, git, git_identity
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch, bare_remote):
+    """Creates an environment 'env' with a clean clone 'clean' and a clone 'dirty' with a
+    local commit, a modified and an untracked file"""
+    remote_dir, _ = bare_remote
+    checkout_dir = str(tmp_path / "checkout")
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    src_dir = os.path.join(checkout_dir, "env", "colcon_ws", "src")
+    for name in ["clean", "dirty"]:
+        git("clone", "--quiet", remote_dir, os.path.join(src_dir, name))
+    dirty_dir = os.path.join(src_dir, "dirty")
+    commit_file(dirty_dir, "local.txt")
+    with open(os.path.join(dirty_dir, "README.md"), "w") as out_file:
+        out_file.write("modified")
+    open(os.path.join(dirty_dir, "untracked.txt"), "w").close()
+    yield remote_dir, src_dir
+
+
+def test_repository_status(environment):
+    _, src_dir = environment
+    result = status.get_repository_status(os.path.join(src_dir, "dirty"))
+    assert result["branch"] == "main"
+    assert (result["changed"], result["untracked"]) == (1, 1)
+    assert (result["ahead"], result["behind"]) == (1, 0)
+    result = status.get_repository_status(
+        os.path.join(src_dir, "dirty"), untracked=False
+    )
+    assert result["untracked"] == 0
+
+
+def test_status(tmp_path, environment):
+    remote_dir, src_dir = environment
+    config_file = str(tmp_path / "config.yaml")
+    with open(config_file, "w") as out_file:
+        yaml.safe_dump(
+            {
+                "colcon_workspace": {
+                    "rosinstall": [
+                        {
+                            "git": {
+                                "local-name": name,
+                                "uri": remote_dir,
+                                "version": git(
+                                    "rev-parse", "origin/main", cwd=src_dir + "/clean"
+                                ),
+                            }
+                        }
+                        for name in ["clean", "dirty"]
+                    ]
+                }
+            },
+            out_file,
+        )
+
+    result = CliRunner().invoke(status.cli, ["--config", config_file, "env"])
+    print(result.output)
+    assert result.exit_code == 0
+    lines = [line for line in result.output.splitlines() if line.startswith("colcon")]
+    assert lines[0].split() == [
+        "colcon",
+        "clean",
+        "main",
+        "clean",
+        "up",
+        "to",
+        "date",
+        "same",
+    ]
+    assert lines[1].split() == [
+        "colcon",
+        "dirty",
+        "main",
+        "1",
+        "changed,",
+        "1",
+        "untracked",
+        "+1",
+        "-0",
+        "differs",
+    ]
+    assert (
+        "2 repositories, 1 with changes, 1 differing from the config" in result.output
+    )
+
+    # Without a config file and without a scrape, nothing is compared
+    result = CliRunner().invoke(status.cli, ["env"])
+    assert result.output.splitlines()[2].split()[-1] == "-"
+
+    # After scraping, the scraped versions are compared. A branch name matches new commits
+    # on the same branch.
+    scrape_helpers.scrape_all(str(tmp_path / "scraped"))
+    commit_file(os.path.join(src_dir, "clean"), "new.txt")
+    git("checkout", "--quiet", "-b", "feature", cwd=os.path.join(src_dir, "dirty"))
+    commit_file(os.path.join(src_dir, "dirty"), "feature.txt")
+    result = CliRunner().invoke(status.cli, ["env"])
+    assert [line.split()[-1] for line in result.output.splitlines()[2:4]] == [
+        "same",
+        "differs",
+    ]
+
+
+def test_status_compares_last_scrape(tmp_path, environment):
+    _, src_dir = environment
+    repo_dir = os.path.join(src_dir, "clean")
+    # A scrape using commit ids is superseded by a later scrape using branch names
+    scrape_helpers.scrape_all(str(tmp_path / "scraped"), use_commit_id=True)
+    scrape_helpers.scrape_all(str(tmp_path / "scraped"))
+    commit_file(repo_dir, "new.txt")
+    result = CliRunner().invoke(status.cli, ["env"])
+    assert result.output.splitlines()[2].split()[-1] == "same"
+
+    # and the other way round
+    scrape_helpers.scrape_all(str(tmp_path / "scraped"), use_commit_id=True)
+    commit_file(repo_dir, "other.txt")
+    result = CliRunner().invoke(status.cli, ["env"])
+    assert result.output.splitlines()[2].split()[-1] == "differs"
@@ -0,0 +1,173 @@
+#
+# Copyright (c) 2024 FZI Forschungszentrum Informatik
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+#
+import os
+import threading
+
+import pytest
+
+from click.testing import CliRunner
+
+import robot_folders.helpers.directory_helpers as directory_helpers
+import robot_folders.helpers.trash_helpers as trash_helpers
+import robot_folders.commands.delete_environment as delete_environment
+import robot_folders.commands.trash as trash
+from robot_folders.helpers.clean_helpers import clean_folder
+from robot_folders.helpers.lock_helpers import FileLock
+
+
+@pytest.fixture
+def checkout_dir(tmp_path, monkeypatch):
+    checkout_dir = str(tmp_path / "checkout")
+    os.makedirs(checkout_dir)
+    monkeypatch.setattr(directory_helpers, "get_checkout_dir", lambda: checkout_dir)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    yield checkout_dir
+
+
+def create_tree(path):
+    """Creates a directory tree that is deep enough to be deleted in parallel"""
+    for package in ["pkg_a", "pkg_b"]:
+        for subdir in ["include", "src/deep"]:
+            os.makedirs(os.path.join(path, package, subdir))
+            with open(os.path.join(path, package, subdir, "file"), "w") as out_file:
+                out_file.write("content")
+    open(os.path.join(path, "top_level_file"), "w").close()
+
+
+def test_move_to_trash(checkout_dir):
+    tree = os.path.join(checkout_dir, "env", "build")
+    create_tree(tree)
+    trash_dir = trash_helpers.move_to_trash(tree)
+    assert trash_dir == os.path.join(checkout_dir, trash_helpers.TRASH_DIR_NAME)
+    assert not os.path.exists(tree)
+    entries = trash_helpers.list_trash_entries(trash_dir)
+    assert len(entries) == 1
+    assert os.path.isdir(os.path.join(entries[0], "build", "pkg_a", "src", "deep"))
+
+    assert trash_helpers.empty_trash(trash_dir, jobs=2) == (1, [])
+    assert trash_helpers.list_trash_entries(trash_dir) == []
+
+
+def test_empty_trash_locked(checkout_dir):
+    tree = os.path.join(checkout_dir, "tree")
+    create_tree(tree)
+    trash_dir = trash_helpers.move_to_trash(tree)
+    locked = threading.Event()
+    release = threading.Event()
+
+    def reclaimer():
+        with FileLock(os.path.join(trash_dir, trash_helpers.RECLAIM_LOCK_NAME)):
+            locked.set()
+            release.wait()
+
+    thread = threading.Thread(target=reclaimer)
+    thread.start()
+    locked.wait()
+    try:
+        assert trash_helpers.is_reclaiming(trash_dir)
+        assert trash_helpers.empty_trash(trash_dir) is None
+    finally:
+        release.set()
+        thread.join()
+    assert not trash_helpers.is_reclaiming(trash_dir)
+
+
+def test_delete_environment(checkout_dir, mocker):
+    env_dir = os.path.join(checkout_dir, "env")
+    create_tree(os.path.join(env_dir, "colcon_ws"))
+    open(os.path.join(env_dir, "setup.sh"), "w").close()
+    popen = mocker.patch.object(trash_helpers.subprocess, "Popen")
+
+    result = CliRunner().invoke(delete_environment.cli, ["--force", "env"])
+    print(result.output)
+    assert result.exit_code == 0
+    assert not os.path.exists(env_dir)
+    trash_dir = os.path.join(checkout_dir, trash_helpers.TRASH_DIR_NAME)
+    assert popen.call_args[0][0][-3:] == ["trash", "--empty", trash_dir]
+
+    result = CliRunner().invoke(trash.cli, ["--status"])
+    assert trash_dir in result.output
+    result = CliRunner().invoke(trash.cli, ["--empty"])
+    assert result.exit_code == 0
+    assert "Deleted 1 entries" in result.output
+    assert trash_helpers.list_trash_entries(trash_dir) == []
+
+
+def test_clean_folder(checkout_dir, mocker):
+    build_dir = os.path.join(checkout_dir, "env", "colcon_ws", "build")
+    create_tree(build_dir)
+    popen = mocker.patch.object(trash_helpers.subprocess, "Popen")
+    clean_folder(build_dir)
+    assert os.listdir(build_dir) == []
+    assert popen.call_count == 1
+
+
+def test_delete_environment_build_links(checkout_dir, tmp_path, monkeypatch, mocker):
+    build_base_dir = str(tmp_path / "no_backup" / "robot_folders_build_base")
+    monkeypatch.setattr(
+        directory_helpers, "get_build_base_dir", lambda use_no_backup: build_base_dir
+    )
+    mocker.patch.object(trash_helpers.subprocess, "Popen")
+    env_dir = os.path.join(checkout_dir, "env")
+    colcon_dir = os.path.join(env_dir, "colcon_ws")
+    os.makedirs(os.path.join(colcon_dir, "src"))
+    open(os.path.join(env_dir, "setup.sh"), "w").close()
+    # A build folder outside of the environment's folder in the build base
+    build_dir = str(tmp_path / "elsewhere" / "build")
+    create_tree(build_dir)
+    os.symlink(build_dir, os.path.join(colcon_dir, "build"))
+
+    result = CliRunner().invoke(delete_environment.cli, ["--force", "env"])
+    print(result.output)
+    assert result.exit_code == 0
+    assert not os.path.exists(build_dir)
+
+
+def test_empty_trash_checks_directory(checkout_dir, tmp_path):
+    scratch_dir = str(tmp_path / "scratch")
+    os.makedirs(os.path.join(scratch_dir, "important"))
+    result = CliRunner().invoke(trash.cli, ["--empty", scratch_dir])
+    assert result.exit_code != 0
+    assert os.path.isdir(os.path.join(scratch_dir, "important"))
+
+    # Files are deleted as well and the reclaim lock is removed afterwards
+    trash_dir = os.path.join(checkout_dir, trash_helpers.TRASH_DIR_NAME)
+    os.makedirs(trash_dir)
+    open(os.path.join(trash_dir, "file"), "w").close()
+    os.symlink(scratch_dir, os.path.join(trash_dir, "link"))
+    assert trash_helpers.empty_trash(trash_dir) == (2, [])
+    assert os.listdir(trash_dir) == []
+    assert os.path.isdir(os.path.join(scratch_dir, "important"))
+
+
+def test_trash_dir_outside_of_cleaned_folder(checkout_dir, tmp_path, monkeypatch):
+    build_dir = os.path.join(checkout_dir, "env", "colcon_ws", "build")
+    create_tree(build_dir)
+    # Neither a known trash directory nor one inside the cleaned folder may be used
+    nested_trash_dir = os.path.join(build_dir, trash_helpers.TRASH_DIR_NAME)
+    monkeypatch.setattr(
+        trash_helpers, "get_known_trash_dirs", lambda: [nested_trash_dir]
+    )
+    monkeypatch.setattr(trash_helpers, "get_mount_point", lambda path: checkout_dir)
+    trash_dir = trash_helpers.move_to_trash(build_dir)
+    assert trash_dir == os.path.join(checkout_dir, trash_helpers.TRASH_DIR_NAME)
+    assert not os.path.exists(build_dir)